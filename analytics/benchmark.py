@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+import os
+import time
+import yaml
+import logging
+import itertools
+import subprocess
+from argparse import ArgumentParser
+
+from utils.dates import now
+
+# frontend name => services that have to run and address of the frontend in the compose network
+FRONTENDS = {
+    "rr": ([ "frontend-rr" ], "http://frontend-rr:8080"),
+    "builtin": ([ "frontend-builtin" ], "http://frontend-builtin:8080"),
+    "fpm": ([ "frontend-fpm", "fpm" ], "http://frontend-fpm:8080"),
+    "apache": ([ "frontend-apache" ], "http://frontend-apache:80"),
+    "rr-nginx": ([ "frontend-rr-nginx", "rr" ], "http://frontend-rr-nginx:8080"),
+    "ppm": ([ "frontend-ppm", "ppm" ], "http://frontend-ppm:8080"),
+}
+
+FRONTEND_SERVICES = sorted({ service for services, _ in FRONTENDS.values() for service in services })
+
+# polls the frontend until it answers (any HTTP status), then keeps sending requests for the warm-up period
+PROBE = """
+import sys, time, urllib.request, urllib.error
+host, timeout, warmup = sys.argv[1], float(sys.argv[2]), float(sys.argv[3])
+deadline, ready = time.time() + timeout, None
+while time.time() < deadline or ready is not None:
+    try:
+        urllib.request.urlopen(host, timeout=5).read()
+    except urllib.error.HTTPError:
+        pass
+    except Exception:
+        time.sleep(1)
+        continue
+    ready = ready or time.time()
+    if time.time() - ready >= warmup:
+        sys.exit(0)
+sys.exit(1)
+"""
+
+class Docker:
+    """
+    Control of the services used by the orchestrator, so that docker can be replaced by a stub.
+    """
+    def start(self, services, environment={}, scale={}, recreate=False):
+        raise NotImplementedError()
+
+    def stop(self, services):
+        raise NotImplementedError()
+
+    def run(self, service, command, environment={}):
+        """
+        Runs one-off container of the service, blocks until it exits and returns its exit code.
+        """
+        raise NotImplementedError()
+
+    def container(self, service):
+        raise NotImplementedError()
+
+    def wait(self, host, timeout=120, warmup=0):
+        """
+        Blocks until the host answers HTTP requests and was warmed up for given number of seconds, returns whether it
+        answered before the timeout.
+        """
+        raise NotImplementedError()
+
+class ComposeDocker(Docker):
+    def __init__(self, file="docker-compose.yml", project="performance-testing"):
+        self.file = file
+        self.project = project
+
+    def compose(self, *arguments, environment={}):
+        command = [ "docker-compose", "-f", self.file, "-p", self.project, *arguments ]
+        logging.info(" ".join(command))
+        return subprocess.run(command, env={ **os.environ, **environment }).returncode
+
+    def start(self, services, environment={}, scale={}, recreate=False):
+        scaling = [ argument for service, count in scale.items() for argument in [ "--scale", f"{service}={count}" ] ]
+        recreating = [ "--force-recreate" ] if recreate else []
+        if self.compose("up", "-d", *recreating, *scaling, *services, environment=environment) != 0:
+            raise RuntimeError(f"Could not start {', '.join(services)}")
+
+    def stop(self, services):
+        if services:
+            self.compose("stop", *services)
+
+    def run(self, service, command, environment={}):
+        variables = [ argument for name, value in environment.items() for argument in [ "-e", f"{name}={value}" ] ]
+        # aliases make the one-off container reachable under the service name, workers connect to it
+        return self.compose("run", "--rm", "--use-aliases", *variables, service, *command, environment=environment)
+
+    def container(self, service):
+        return f"{self.project}_{service}_1"
+
+    def wait(self, host, timeout=120, warmup=0):
+        # frontends are reachable only from the compose network, so the probe runs in a container of locust image
+        return self.compose("run", "--rm", "--no-deps", "--entrypoint", "python", "locust-master", "-c", PROBE,
+                            host, str(timeout), str(warmup)) == 0
+
+class StubDocker(Docker):
+    """
+    Records the calls and pretends that every run took given number of seconds, used by --dry-run.
+    """
+    def __init__(self, duration=0, project="performance-testing"):
+        self.duration = duration
+        self.project = project
+        self.calls = []
+        self.running = set()
+
+    def start(self, services, environment={}, scale={}, recreate=False):
+        self.calls.append(("start", list(services), dict(environment), dict(scale), recreate))
+        self.running.update(services)
+
+    def stop(self, services):
+        self.calls.append(("stop", list(services)))
+        self.running.difference_update(services)
+
+    def run(self, service, command, environment={}):
+        self.calls.append(("run", service, list(command), dict(environment)))
+        time.sleep(self.duration)
+        return 0
+
+    def container(self, service):
+        return f"{self.project}_{service}_1"
+
+    def wait(self, host, timeout=120, warmup=0):
+        self.calls.append(("wait", host, timeout, warmup))
+        return True
+
+def get_cells(frontends, tags, users, repetitions):
+    """
+    Returns all cells of the matrix. Repetition is the outermost loop, so slow drift of the host (thermal throttling,
+    background jobs) affects all frontends equally instead of only the last one.
+    """
+    return [
+        { "frontend": frontend, "tags": tag, "users": count, "repetition": repetition }
+        for repetition in range(1, repetitions + 1)
+        for frontend, tag, count in itertools.product(frontends, tags, users)
+    ]
+
+def cell_run_id(prefix, cell):
+    return f"{prefix}-{cell['frontend']}-{cell['tags']}-{cell['users']}-{cell['repetition']}".lower()
+
+def run_cell(docker: Docker, cell, run_id, duration, workers=3, environment={}, recreate=False, warmup=10, timeout=120):
+    """
+    Runs locust against the frontend of the cell with all other frontends stopped, returns metadata of the run. Load
+    starts only after the frontend answers and was warmed up, running containers of the frontend are reused unless
+    recreate is set.
+    """
+    services, host = FRONTENDS[cell["frontend"]]
+    docker.stop([ service for service in FRONTEND_SERVICES if service not in services ])
+    docker.start(services, recreate=recreate)
+
+    if not docker.wait(host, timeout, warmup):
+        raise RuntimeError(f"{host} did not answer within {timeout}s")
+
+    locust_environment = {
+        **environment,
+        "LOCUST_TAGS": cell["tags"],
+        "LOCUST_MAX_USER_COUNT": str(cell["users"]),
+        "LOCUST_TIME_LIMIT": str(duration),
+        "LOCUST_RUN_ID": run_id,
+    }
+
+    # workers are always recreated, they have to pick up environment of the cell
+    docker.start([ "locust-worker" ], locust_environment, scale={ "locust-worker": workers }, recreate=True)
+
+    exit_code = docker.run("locust-master", [
+        "-f", "/mnt/locust/locustfile.py", "--tags", cell["tags"], "--master", "--headless",
+        "--expect-workers", str(workers), "-H", host,
+    ], locust_environment)
+
+    docker.stop([ "locust-worker" ])
+
+    # time range is not recorded - wall clock around the run includes start of the containers and spawning of the
+    # users, range of the run index (see utils.runs.get_run_range) covers only the reported load
+    return {
+        "run": run_id,
+        # locust exits with non-zero code when any request failed, so it is only recorded
+        "exit code": exit_code,
+    }
+
+def get_definitions(cells, results, docker: Docker, **metadata):
+    """
+    Returns definitions in the format read by summary.py - one suite per frontend, tags and user count, with every
+    repetition as separate run.
+    """
+    suites = {}
+    for cell, result in zip(cells, results):
+        key = (cell["frontend"], cell["tags"], cell["users"])
+        if key not in suites:
+            services, host = FRONTENDS[cell["frontend"]]
+            suites[key] = {
+                "name": f"{cell['frontend']} {cell['tags']} {cell['users']} users",
+                "containers": [ docker.container(service) for service in services ],
+                "frontend": cell["frontend"],
+                "host": host,
+                "tags": cell["tags"],
+                "users": cell["users"],
+                "repetitions": [],
+            }
+
+        suites[key]["repetitions"].append(result)
+
+    return { **metadata, "tests": list(suites.values()) }
+
+def save_definitions(path, definitions):
+    with open(path, "w") as file:
+        yaml.dump(definitions, file, sort_keys=False)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Runs load tests of the frontends x tags x users matrix and writes definitions file for summary.py")
+
+    parser.add_argument("output", help="Definitions file to write, it is updated after every run")
+    parser.add_argument("--frontends", "-f", nargs="+", choices=list(FRONTENDS), default=list(FRONTENDS), help="Frontends to test")
+    parser.add_argument("--tags", "-t", nargs="+", default=[ "light" ], help="Locust tags, one run per tag")
+    parser.add_argument("--users", "-u", nargs="+", type=int, default=[ 250 ], help="Numbers of users")
+    parser.add_argument("--repetitions", "-r", type=int, default=1, help="Number of repetitions of every cell")
+    parser.add_argument("--duration", "-d", type=int, default=500, help="Duration of every run in seconds")
+    parser.add_argument("--cooldown", type=int, default=30, help="Pause between the runs in seconds")
+    parser.add_argument("--workers", "-w", type=int, default=3, help="Number of locust workers")
+    parser.add_argument("--warmup", type=int, default=10, help="Seconds of requests sent to the frontend before the load starts")
+    parser.add_argument("--ready-timeout", dest="ready_timeout", type=int, default=120, help="Seconds to wait for the frontend to answer")
+    parser.add_argument("--recreate", action="store_true", help="Recreate containers of the frontend before every run, otherwise they are reused")
+    parser.add_argument("--prefix", type=str, default=now().strftime("%Y%m%d-%H%M%S"), help="Prefix of run ids")
+    parser.add_argument("--compose-file", dest="compose_file", type=str, default="docker-compose.yml", help="Compose file with the services")
+    parser.add_argument("--project", type=str, default="performance-testing", help="Compose project name, used in container names")
+    parser.add_argument("--dry-run", dest="dry_run", action="store_true", help="Only print the commands, docker is not used")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    docker = StubDocker(project=args.project) if args.dry_run else ComposeDocker(args.compose_file, args.project)
+    cells = get_cells(args.frontends, args.tags, args.users, args.repetitions)
+
+    logging.info(f"Running {len(cells)} cells, expected to take {len(cells) * (args.duration + args.cooldown) / 3600:.1f}h")
+
+    results = []
+    try:
+        for number, cell in enumerate(cells):
+            if number > 0:
+                time.sleep(0 if args.dry_run else args.cooldown)
+
+            run_id = cell_run_id(args.prefix, cell)
+            logging.info(f"[{number + 1}/{len(cells)}] {cell['frontend']} {cell['tags']} {cell['users']} users, repetition {cell['repetition']} ({run_id})")
+
+            results.append(run_cell(docker, cell, run_id, args.duration, args.workers, recreate=args.recreate,
+                                    warmup=args.warmup, timeout=args.ready_timeout))
+            # runs of the stub did not happen, so the definitions file is left untouched
+            if not args.dry_run:
+                save_definitions(args.output, get_definitions(cells, results, docker, duration=args.duration, workers=args.workers))
+    finally:
+        docker.stop([ *FRONTEND_SERVICES, "locust-worker" ])
+
+    if args.dry_run:
+        for call in docker.calls:
+            print(*call)
+
+        print(f"Definitions that would be written to {args.output}:")
+        print(yaml.dump(get_definitions(cells, results, docker, duration=args.duration, workers=args.workers), sort_keys=False))
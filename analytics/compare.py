@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+import numpy as np
+import pandas as pd
+import utils.args
+import utils.cache
+
+from times import get_request_time_series, get_cpu_time_series, get_memory_time_series, get_steady_state
+from utils.aggs import elastic_interval_to_seconds
+from utils.bootstrap import bootstrap_means, block_length, confidence_interval, p_value
+from utils.definitions import load_definitions
+from utils.runs import resolve_suite, suite_filter
+
+# metric name => whether higher value is better
+METRICS = {
+    "50th percentile [ms]": False,
+    "95th percentile [ms]": False,
+    "rps": True,
+    "cpu [%]": False,
+    "memory [MiB]": False,
+}
+
+# below that number of suites starting worker processes costs more than it saves
+PROCESS_POOL_THRESHOLD = 4
+
+number_formatter = "{:.2f}".format
+
+formatters = {
+    "mean": number_formatter,
+    "ci low": number_formatter,
+    "ci high": number_formatter,
+    "difference": number_formatter,
+    "p-value": "{:.4f}".format,
+}
+
+def get_interval_metrics(elasticsearch, suite, interval="5s", steady_state=False):
+    start, end, index = resolve_suite(elasticsearch, suite)
+    requests_filter = suite_filter(suite)
+
+    if steady_state:
+        start, end = get_steady_state(elasticsearch, start, end, requests_filter, interval=interval, index=index)
+
+    requests_df = get_request_time_series(elasticsearch, start, end, additional_filter=requests_filter, interval=interval, index=index).xs("all", level="path")
+    cpu_df = get_cpu_time_series(elasticsearch, start, end, containers=suite["containers"], interval=interval)
+    memory_df = get_memory_time_series(elasticsearch, start, end, containers=suite["containers"], interval=interval)
+
+    requests_df = requests_df.set_index("time")
+
+    return pd.DataFrame({
+        "50th percentile [ms]": requests_df["50th percentile"],
+        "95th percentile [ms]": requests_df["95th percentile"],
+        "rps": requests_df["requests"] / elastic_interval_to_seconds(interval),
+        "cpu [%]": cpu_df.groupby("time")["average"].sum() * 100,
+        "memory [MiB]": memory_df.groupby("time")["average"].sum() / 2 ** 20,
+    })
+
+def bootstrap(series, resamples=10000, processes=None, seed=0, block=1):
+    keys = [ (suite, metric) for suite in series for metric in METRICS ]
+    values = [ series[suite][metric].to_numpy(dtype=float) for suite, metric in keys ]
+    seeds = [ seed + i for i in range(len(keys)) ]
+
+    if len(series) > PROCESS_POOL_THRESHOLD:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            samples = list(executor.map(bootstrap_means, values, repeat(resamples), seeds, repeat(block)))
+    else:
+        samples = list(map(bootstrap_means, values, repeat(resamples), seeds, repeat(block)))
+
+    return dict(zip(keys, samples))
+
+def compare(series, resamples=10000, confidence=0.95, processes=None, block=1):
+    samples = bootstrap(series, resamples, processes, block=block)
+
+    rows = []
+    for metric, higher_is_better in METRICS.items():
+        means = { suite: np.nanmean(series[suite][metric]) if series[suite][metric].notna().any() else np.nan for suite in series }
+        ranking = sorted(means, key=lambda suite: (np.isnan(means[suite]), -means[suite] if higher_is_better else means[suite]))
+        best = ranking[0]
+
+        for rank, suite in enumerate(ranking, 1):
+            low, high = confidence_interval(samples[suite, metric], confidence)
+            probability = p_value(samples[suite, metric] - samples[best, metric]) if suite != best else np.nan
+
+            rows.append({
+                "metric": metric,
+                "suite": suite,
+                "rank": rank,
+                "mean": means[suite],
+                "ci low": low,
+                "ci high": high,
+                "difference": means[suite] - means[best],
+                "p-value": probability,
+                "significant": bool(probability < 1 - confidence) if not np.isnan(probability) else None,
+            })
+
+    return pd.DataFrame(rows).set_index(["metric", "suite"])
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Compares suites using bootstrap confidence intervals of per-interval metrics")
+    parser.add_argument("definitions", help="YAML file with test definitions")
+    parser.add_argument("--interval", "-i", dest="interval", type=str, help="Interval of observations", default="5s")
+    parser.add_argument("--resamples", "-r", dest="resamples", type=int, help="Number of bootstrap resamples", default=10000)
+    parser.add_argument("--confidence", dest="confidence", type=float, help="Confidence level", default=0.95)
+    parser.add_argument("--processes", "-P", dest="processes", type=int, help="Number of bootstrap processes", default=None)
+    parser.add_argument("--block", "-b", dest="block", type=int, help="Duration of resampled blocks of intervals in seconds", default=60)
+
+    utils.args.add_format_args(parser, formatters)
+    utils.args.add_elastic_arg(parser)
+    utils.args.add_cache_args(parser)
+    utils.args.add_jobs_arg(parser)
+    utils.args.add_steady_state_arg(parser)
+
+    args = parser.parse_args()
+
+    utils.cache.configure(enabled=args.cache, refresh=args.refresh)
+
+    definitions = load_definitions(args.definitions)
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        frames = executor.map(lambda suite: get_interval_metrics(args.elasticsearch, suite, args.interval, args.steady_state), definitions['tests'])
+        series = dict(zip([ suite["name"] for suite in definitions['tests'] ], frames))
+
+    block = block_length(elastic_interval_to_seconds(args.interval), args.block)
+    print(args.format(compare(series, args.resamples, args.confidence, args.processes, block)))
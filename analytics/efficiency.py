@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+import humanize
+import pandas as pd
+import utils.args
+import utils.cache
+
+from times import get_request_time_series, get_cpu_time_series, get_memory_time_series, get_steady_state
+from utils.aggs import elastic_interval_to_seconds
+from utils.definitions import load_definitions
+from utils.runs import resolve_suite, suite_filter
+
+time_formatter = "{:.0f}ms".format
+number_formatter = "{:.2f}".format
+memory_formatter = humanize.naturalsize
+
+formatters = {
+    "rps": number_formatter,
+    "cpu cores": number_formatter,
+    "rps per core": number_formatter,
+    "cores per 1k rps": number_formatter,
+    "cpu share": "{:.1%}".format,
+    "memory": memory_formatter,
+    "memory per 1k rps": memory_formatter,
+    "concurrency": number_formatter,
+    "memory per concurrent request": memory_formatter,
+    "average": time_formatter,
+    "95th percentile": time_formatter,
+}
+
+def get_joined_time_series(elasticsearch, suite, interval="5s", steady_state=False):
+    start, end, index = resolve_suite(elasticsearch, suite)
+    requests_filter = suite_filter(suite)
+
+    if steady_state:
+        start, end = get_steady_state(elasticsearch, start, end, requests_filter, interval=interval, index=index)
+
+    requests_df = get_request_time_series(elasticsearch, start, end, additional_filter=requests_filter, interval=interval, index=index).xs("all", level="path")
+    cpu_df = get_cpu_time_series(elasticsearch, start, end, containers=suite["containers"], interval=interval)
+    memory_df = get_memory_time_series(elasticsearch, start, end, containers=suite["containers"], interval=interval)
+
+    # all series use the same date_histogram buckets, so they can be aligned by the bucket start
+    cpu_df = cpu_df.reset_index().pivot_table(index="time", columns="container", values="average")
+    memory_df = memory_df.reset_index().pivot_table(index="time", columns="container", values="average")
+
+    return pd.concat({
+        "requests": requests_df.set_index("time")[["requests", "average", "95th percentile"]],
+        "cpu": cpu_df,
+        "memory": memory_df,
+    }, axis=1, join="inner")
+
+def get_efficiency(joined: pd.DataFrame, interval="5s"):
+    rps = joined["requests"]["requests"] / elastic_interval_to_seconds(interval)
+    cores = joined["cpu"].sum(axis=1)
+    memory = joined["memory"].sum(axis=1)
+
+    # Little's law - average number of requests in the system
+    concurrency = rps * joined["requests"]["average"].fillna(0) / 1000
+
+    return {
+        "rps": rps.mean(),
+        "cpu cores": cores.mean(),
+        "rps per core": rps.sum() / cores.sum(),
+        "cores per 1k rps": 1000 * cores.sum() / rps.sum(),
+        "memory": memory.mean(),
+        "memory per 1k rps": 1000 * memory.mean() / rps.mean(),
+        "concurrency": concurrency.mean(),
+        "memory per concurrent request": memory.mean() / concurrency.mean(),
+    }
+
+def get_container_efficiency(joined: pd.DataFrame, interval="5s"):
+    rps = joined["requests"]["requests"] / elastic_interval_to_seconds(interval)
+    cores = joined["cpu"]
+
+    for container in cores.columns:
+        yield {
+            "container": container,
+            "cpu cores": cores[container].mean(),
+            "cpu share": cores[container].sum() / cores.sum().sum(),
+            "cores per 1k rps": 1000 * cores[container].sum() / rps.sum(),
+            "memory": joined["memory"][container].mean() if container in joined["memory"] else None,
+        }
+
+def get_saturation_curve(joined: pd.DataFrame, interval="5s", bins=10):
+    cores = joined["cpu"].sum(axis=1)
+
+    df = pd.DataFrame({
+        "cpu cores": pd.cut(cores, bins=bins),
+        "rps": joined["requests"]["requests"] / elastic_interval_to_seconds(interval),
+        "average": joined["requests"]["average"],
+        "95th percentile": joined["requests"]["95th percentile"],
+    })
+
+    curve = df.groupby("cpu cores", observed=True).mean()
+    curve["intervals"] = df.groupby("cpu cores", observed=True).size()
+
+    return curve
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Relates throughput and latency to the resources used by the SUT")
+    parser.add_argument("definitions", help="YAML file with test definitions")
+    parser.add_argument("--interval", "-i", dest="interval", type=str, help="Interval of observations", default="5s")
+    parser.add_argument("--containers", dest="per_container", action="store_true", help="Show per container breakdown")
+    parser.add_argument("--curve", dest="curve", type=int, nargs="?", const=10, default=None,
+                        help="Show latency vs cpu saturation curve with given number of bins")
+
+    utils.args.add_format_args(parser, formatters)
+    utils.args.add_elastic_arg(parser)
+    utils.args.add_cache_args(parser)
+    utils.args.add_jobs_arg(parser)
+    utils.args.add_steady_state_arg(parser)
+
+    args = parser.parse_args()
+
+    utils.cache.configure(enabled=args.cache, refresh=args.refresh)
+
+    definitions = load_definitions(args.definitions)
+    names = [ suite["name"] for suite in definitions['tests'] ]
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        frames = executor.map(lambda suite: get_joined_time_series(args.elasticsearch, suite, args.interval, args.steady_state), definitions['tests'])
+        joined = dict(zip(names, frames))
+
+    efficiency_df = pd.DataFrame([ { "suite": name, **get_efficiency(joined[name], args.interval) } for name in names ])
+    print(args.format(efficiency_df.set_index("suite")))
+
+    if args.per_container:
+        containers_df = pd.DataFrame([
+            { "suite": name, **observation } for name in names for observation in get_container_efficiency(joined[name], args.interval)
+        ])
+        print(args.format(containers_df.set_index(["suite", "container"])))
+
+    if args.curve:
+        curve_df = pd.concat({ name: get_saturation_curve(joined[name], args.interval, args.curve) for name in names }, names=["suite"])
+        print(args.format(curve_df))
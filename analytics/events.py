@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+import sys
+import humanize
+import pandas as pd
+from argparse import ArgumentParser
+from datetime import datetime
+import utils.args
+import utils.cache
+
+from times import get_cpu_time_series, get_memory_time_series
+from utils.storage import is_file_storage
+from utils.events import load_events, load_stored_events, get_event_stats, get_event_time_series
+
+time_formatter = "{:.1f}ms".format
+
+def get_correlated_time_series(elasticsearch, events_df, percents, start, end, containers=[], interval="5s", cpu=True, memory=False):
+    """
+    Joins exact per interval stats of the events with resource usage of the containers in the same intervals.
+    """
+    series = { "requests": get_event_time_series(events_df, percents, interval, start).set_index("time") }
+
+    if cpu:
+        cpu_df = get_cpu_time_series(elasticsearch, start, end, containers=containers, interval=interval)
+        series["cpu"] = cpu_df.reset_index().pivot_table(index="time", columns="container", values="average")
+
+    if memory:
+        memory_df = get_memory_time_series(elasticsearch, start, end, containers=containers, interval=interval)
+        series["memory"] = memory_df.reset_index().pivot_table(index="time", columns="container", values="average")
+
+    return pd.concat(series, axis=1, join="inner")
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Exact statistics of raw request events captured with LOCUST_EVENT_LOG")
+
+    parser.add_argument("events", nargs="*", help="Event files or directories containing them")
+    parser.add_argument("--run", "-R", dest="run", type=str, default=None,
+                        help="Read events of the run indexed into elasticsearch (LOCUST_EVENT_LOG=elasticsearch) instead")
+    parser.add_argument("--from", dest="start", type=datetime.fromisoformat, default=None, help="Skip events before (UTC)")
+    parser.add_argument("--to", dest="end", type=datetime.fromisoformat, default=None, help="Skip events after (UTC)")
+    parser.add_argument("--interval", "-i", dest="interval", type=str, default=None,
+                        help="Show stats of every interval, e.g. 1s")
+    parser.add_argument("--slowest", "-s", dest="slowest", type=int, default=0,
+                        help="Show given number of the slowest requests")
+
+    utils.args.add_elastic_arg(parser)
+    utils.args.add_containers_arg(parser)
+    utils.args.add_per_path_arg(parser)
+    utils.args.add_resources_args(parser)
+    utils.args.add_percentiles_arg(parser)
+    utils.args.add_cache_args(parser)
+
+    args = parser.parse_args()
+
+    utils.cache.configure(enabled=args.cache, refresh=args.refresh)
+
+    if args.run is not None and is_file_storage(args.elasticsearch):
+        parser.error("events of the run are stored only in elasticsearch")
+    if args.run is None and not args.events:
+        parser.error("the following arguments are required: events (or --run)")
+
+    events_df = load_stored_events(args.elasticsearch, args.run) if args.run is not None else load_events(args.events)
+    if args.start:
+        events_df = events_df[events_df["time"] >= args.start]
+    if args.end:
+        events_df = events_df[events_df["time"] < args.end]
+
+    if events_df.empty:
+        print("No events found", file=sys.stderr)
+        sys.exit(1)
+
+    start = (args.start or events_df["time"].min().floor("s").to_pydatetime()).replace(microsecond=0)
+    end = args.end or events_df["time"].max().ceil("s").to_pydatetime()
+
+    print(f"{humanize.intcomma(len(events_df))} requests from {start} to {end}")
+    print(get_event_stats(events_df, args.percentiles, args.per_path).to_string(float_format="{:.2f}".format))
+
+    if args.interval and (args.cpu or args.memory):
+        joined_df = get_correlated_time_series(args.elasticsearch, events_df, args.percentiles, start, end, args.containers,
+                                               args.interval, args.cpu, args.memory)
+        print(joined_df.to_string(float_format="{:.2f}".format))
+    elif args.interval:
+        print(get_event_time_series(events_df, args.percentiles, args.interval, start).to_string(float_format="{:.2f}".format))
+
+    if args.slowest:
+        slowest_df = events_df.nlargest(args.slowest, "response_time")
+        print(slowest_df.to_string(index=False, formatters={ "response_time": time_formatter }))
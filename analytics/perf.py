@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+import os
+import time
+import tempfile
+import tracemalloc
+import humanize
+import pandas as pd
+import pyarrow.parquet as pq
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+import utils.args
+import utils.cache
+
+from stats import get_request_stats, get_cpu_stats, get_memory_stats
+from times import get_request_time_series, get_cpu_time_series, get_latency_histogram, get_steady_state
+from summary import evaluate_suite
+from utils.runs import run_index, resolve_suite
+from utils.storage import FileStorage
+from utils.synthetic import generate_requests, generate_resources, MemoryStorage, FakeElasticsearch
+
+# sizes of the synthetic datasets, every suite is a separate run of given duration
+SCALES = {
+    "small": { "suites": 2, "duration": 300, "paths": 10, "workers": 3, "rps": 300 },
+    "medium": { "suites": 4, "duration": 1800, "paths": 50, "workers": 5, "rps": 1000 },
+    "large": { "suites": 4, "duration": 3600, "paths": 100, "workers": 5, "rps": 3000 },
+}
+
+CONTAINERS = [ "bench_frontend_1", "bench_app_1" ]
+
+def generate_dataset(scale, start=datetime(2021, 3, 1), seed=0):
+    """
+    Returns tables of all indices and suites of the dataset, suites run one after another with a minute of pause.
+    """
+    tables, suites = {}, []
+    for number in range(scale["suites"]):
+        suite_start = start + timedelta(seconds=number * (scale["duration"] + 60))
+        run_id = f"bench-{number}"
+
+        tables[run_index(run_id)] = generate_requests(suite_start, scale["duration"], run_id, scale["paths"], scale["workers"], scale["rps"], seed=seed + number)
+        suites.append({ "name": run_id, "run": run_id, "containers": CONTAINERS })
+
+    end = start + timedelta(seconds=scale["suites"] * (scale["duration"] + 60))
+    tables["metricbeat-sampler-bench"] = generate_resources(start, (end - start).total_seconds(), CONTAINERS, period=0.25, seed=seed)
+
+    return tables, suites
+
+def write_dataset(directory, tables):
+    for index, table in tables.items():
+        os.makedirs(os.path.join(directory, index), exist_ok=True)
+        pq.write_table(table, os.path.join(directory, index, "part-0.parquet"))
+
+# entry point => function of storage, time range and index of the first suite and all suites
+ENTRY_POINTS = {
+    "request stats": lambda storage, start, end, index, suites: get_request_stats(storage, start, end, per_path=True, index=index),
+    "cpu stats": lambda storage, start, end, index, suites: get_cpu_stats(storage, start, end, containers=CONTAINERS),
+    "memory stats": lambda storage, start, end, index, suites: get_memory_stats(storage, start, end, containers=CONTAINERS),
+    "request time series": lambda storage, start, end, index, suites: get_request_time_series(storage, start, end, per_path=True, index=index),
+    "cpu time series": lambda storage, start, end, index, suites: get_cpu_time_series(storage, start, end, containers=CONTAINERS),
+    "latency histogram": lambda storage, start, end, index, suites: get_latency_histogram(storage, start, end, index=index),
+    "steady state": lambda storage, start, end, index, suites: get_steady_state(storage, start, end, index=index),
+    "summary": lambda storage, start, end, index, suites: [ evaluate_suite(storage, suite, steady_state=True) for suite in suites ],
+}
+
+def measure(function, repeat=3):
+    """
+    Returns the best wall time of given number of calls and peak of memory traced during one more call. Traced memory
+    includes python objects and numpy arrays, but not buffers allocated by pyarrow itself. Calls are preceded by
+    a warm-up call, which fills responses of the elasticsearch stand-in, so only the analytics code is measured.
+    """
+    function()
+
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return min(times), peak
+
+def run_benchmark(scales, backends, entry_points, repeat=3, directory=None, seed=0):
+    rows = []
+    for name in scales:
+        tables, suites = generate_dataset(SCALES[name], seed=seed)
+        documents = sum(table.num_rows for table in tables.values())
+
+        with tempfile.TemporaryDirectory() as temporary:
+            storages = {
+                # the stand-in computes aggregations with the file storage code, so only the client side is measured
+                "elasticsearch-client": lambda: FakeElasticsearch(MemoryStorage(tables)),
+                "file": lambda: FileStorage(os.path.join(directory or temporary, name)),
+            }
+
+            if "file" in backends:
+                write_dataset(os.path.join(directory or temporary, name), tables)
+
+            for backend in backends:
+                storage = storages[backend]()
+                start, end, index = resolve_suite(storage, suites[0])
+
+                for entry_point in entry_points:
+                    wall_time, peak = measure(lambda: ENTRY_POINTS[entry_point](storage, start, end, index, suites), repeat)
+                    rows.append({
+                        "scale": name,
+                        "backend": backend,
+                        "entry point": entry_point,
+                        "documents": documents,
+                        "wall time": wall_time,
+                        "peak memory": peak,
+                    })
+
+    return pd.DataFrame(rows).set_index([ "scale", "backend", "entry point" ])
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Measures wall time and peak memory of the analytics entry points on synthetic data")
+
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=[ "small" ], help="Sizes of the datasets")
+    parser.add_argument("--backends", nargs="+", choices=[ "elasticsearch-client", "file" ], default=[ "elasticsearch-client", "file" ],
+                        help="Storages to query, elasticsearch-client measures only building the queries and processing of the responses")
+    parser.add_argument("--entry-points", dest="entry_points", nargs="+", choices=list(ENTRY_POINTS), default=list(ENTRY_POINTS),
+                        help="Entry points to measure")
+    parser.add_argument("--repeat", "-r", type=int, default=3, help="Number of calls, the best time is reported")
+    parser.add_argument("--data", type=str, default=None, help="Keep the parquet files of the datasets in given directory")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generator")
+
+    utils.args.add_format_args(parser, {
+        "documents": humanize.intcomma,
+        "wall time": "{:.3f}s".format,
+        "peak memory": humanize.naturalsize,
+    })
+
+    args = parser.parse_args()
+
+    # every call has to compute its result
+    utils.cache.configure(enabled=False)
+
+    print(args.format(run_benchmark(args.scales, args.backends, args.entry_points, args.repeat, args.data, args.seed)))
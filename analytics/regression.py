@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+import sys
+import yaml
+import humanize
+import numpy as np
+import pandas as pd
+from argparse import ArgumentParser, ArgumentTypeError
+from datetime import datetime
+
+from stats import get_request_stats, get_cpu_stats, get_memory_stats
+from times import get_steady_state
+import utils.args
+import utils.cache
+
+from utils.runs import DEFAULT_INDEX, run_index, get_run_range
+
+# metric name => whether higher value is better
+METRICS = {
+    "50th percentile": False,
+    "95th percentile": False,
+    "99th percentile": False,
+    "rps": True,
+    "failure rate": False,
+    "cpu": False,
+    "memory": False,
+}
+
+# metric name => (relative, absolute) threshold, change is a regression only if it exceeds both of them, so that
+# absolute thresholds filter out noise of small values - e.g. relative change of failure rate around 0 is meaningless
+THRESHOLDS = {
+    "50th percentile": (0.10, 1),
+    "95th percentile": (0.10, 2),
+    "99th percentile": (0.15, 5),
+    "rps": (0.05, 0),
+    "failure rate": (None, 0.01),
+    "cpu": (0.10, 0.05),
+    "memory": (0.10, 16 * 2 ** 20),
+}
+
+time_formatter = "{:.1f}ms".format
+percent_formatter = "{:.1%}".format
+
+metric_formatters = {
+    "50th percentile": time_formatter,
+    "95th percentile": time_formatter,
+    "99th percentile": time_formatter,
+    "rps": "{:.2f}".format,
+    "failure rate": "{:.2%}".format,
+    "cpu": percent_formatter,
+    "memory": humanize.naturalsize,
+}
+
+def get_metrics(elasticsearch, start, end, index=DEFAULT_INDEX, containers=[], steady_state=False):
+    if steady_state:
+        start, end = get_steady_state(elasticsearch, start, end, index=index)
+
+    requests = get_request_stats(elasticsearch, start, end, index=index).loc["all"]
+    cpu_df = get_cpu_stats(elasticsearch, start, end, containers=containers)
+    memory_df = get_memory_stats(elasticsearch, start, end, containers=containers)
+
+    return {
+        "50th percentile": requests["50th percentile"],
+        "95th percentile": requests["95th percentile"],
+        "99th percentile": requests["99th percentile"],
+        "rps": requests["rps"],
+        "failure rate": requests["failures"] / requests["requests"] if requests["requests"] else np.nan,
+        "cpu": cpu_df["average"].sum(min_count=1),
+        "memory": memory_df["peak"].sum(min_count=1),
+    }
+
+def load_baseline(path):
+    with open(path) as file:
+        return yaml.safe_load(file)["metrics"]
+
+def save_baseline(path, metrics, **details):
+    with open(path, "w") as file:
+        yaml.dump({ **details, "metrics": { metric: float(value) for metric, value in metrics.items() } }, file, sort_keys=False)
+
+def format_metric(metric, values):
+    value = values.get(metric, np.nan)
+    return metric_formatters[metric](value) if not pd.isna(value) else "n/a"
+
+def compare(baseline, current, thresholds=THRESHOLDS):
+    """
+    Returns status of every metric - regression, improvement, ok, or missing when the metric could not be measured
+    in the baseline or in the current run (e.g. no requests or resource samples in the range).
+    """
+    rows = []
+    for metric, higher_is_better in METRICS.items():
+        relative, absolute = thresholds[metric]
+
+        if pd.isna(baseline.get(metric, np.nan)) or pd.isna(current.get(metric, np.nan)):
+            rows.append({
+                "metric": metric,
+                "baseline": format_metric(metric, baseline),
+                "current": format_metric(metric, current),
+                "change": "n/a",
+                "threshold": "",
+                "status": "missing",
+            })
+            continue
+
+        change = current[metric] - baseline[metric]
+        relative_change = change / baseline[metric] if baseline[metric] else np.nan
+
+        # positive when the metric got worse
+        worse = -change if higher_is_better else change
+        exceeds = worse > (absolute or 0) and (relative is None or worse > relative * abs(baseline[metric]))
+        improves = -worse > (absolute or 0) and (relative is None or -worse > relative * abs(baseline[metric]))
+
+        rows.append({
+            "metric": metric,
+            "baseline": metric_formatters[metric](baseline[metric]),
+            "current": metric_formatters[metric](current[metric]),
+            "change": f"{relative_change:+.1%}" if not np.isnan(relative_change) else "n/a",
+            "threshold": " & ".join(filter(None, [
+                f"{relative:.0%}" if relative is not None else None,
+                metric_formatters[metric](absolute) if absolute else None,
+            ])),
+            "status": "regression" if exceeds else "improvement" if improves else "ok",
+        })
+
+    return pd.DataFrame(rows).set_index("metric")
+
+def parse_threshold(value):
+    metric, _, threshold = value.partition("=")
+    if metric not in METRICS or not threshold:
+        raise ArgumentTypeError(f"expected <metric>=<value> with one of metrics: {', '.join(METRICS)}")
+
+    try:
+        return metric, float(threshold)
+    except ValueError:
+        raise ArgumentTypeError(f"invalid threshold value: {threshold}")
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Compares the run with the baseline and fails if performance regressed")
+
+    utils.args.add_elastic_arg(parser)
+    utils.args.add_containers_arg(parser)
+    utils.args.add_date_range_args(parser, optional_start=True, optional_end=True)
+    utils.args.add_run_arg(parser)
+    utils.args.add_cache_args(parser)
+    utils.args.add_steady_state_arg(parser)
+
+    baseline_group = parser.add_mutually_exclusive_group()
+    baseline_group.add_argument("--baseline", "-b", dest="baseline", type=str, default=None,
+                                help="Result file (created by --save) to use as baseline")
+    baseline_group.add_argument("--baseline-run", "-B", dest="baseline_run", type=str, default=None,
+                                help="Id of the run to use as baseline")
+    parser.add_argument("--baseline-from", dest="baseline_from", type=datetime.fromisoformat, default=None,
+                        help="Start of the baseline time range")
+    parser.add_argument("--baseline-to", dest="baseline_to", type=datetime.fromisoformat, default=None,
+                        help="End of the baseline time range")
+    parser.add_argument("--save", dest="save", type=str, default=None,
+                        help="Store results of the run in the file, so it can be used as baseline later")
+    parser.add_argument("--relative", dest="relative", type=parse_threshold, action="append", default=[],
+                        metavar="METRIC=FRACTION", help="Override relative threshold of the metric, e.g. rps=0.1")
+    parser.add_argument("--absolute", dest="absolute", type=parse_threshold, action="append", default=[],
+                        metavar="METRIC=VALUE", help="Override absolute threshold of the metric, e.g. \"95th percentile=5\"")
+
+    args = parser.parse_args()
+    es   = args.elasticsearch
+
+    utils.cache.configure(enabled=args.cache, refresh=args.refresh)
+
+    start, end = utils.args.resolve_date_range(parser, args)
+    current = get_metrics(es, start, end, run_index(args.run), args.containers, args.steady_state)
+
+    if args.save:
+        save_baseline(args.save, current, run=args.run, start=start.isoformat(), end=end.isoformat())
+
+    if args.baseline:
+        baseline = load_baseline(args.baseline)
+    elif args.baseline_run or (args.baseline_from and args.baseline_to):
+        baseline_start, baseline_end = args.baseline_from, args.baseline_to
+        if args.baseline_run and (baseline_start is None or baseline_end is None):
+            run_start, run_end = get_run_range(es, args.baseline_run)
+            baseline_start, baseline_end = baseline_start or run_start, baseline_end or run_end
+
+        baseline = get_metrics(es, baseline_start, baseline_end, run_index(args.baseline_run), args.containers, args.steady_state)
+    elif args.save:
+        sys.exit(0)
+    else:
+        parser.error("one of the arguments --baseline, --baseline-run or --baseline-from with --baseline-to is required")
+
+    thresholds = dict(THRESHOLDS)
+    for metric, value in args.relative:
+        thresholds[metric] = (value, thresholds[metric][1])
+    for metric, value in args.absolute:
+        thresholds[metric] = (thresholds[metric][0], value)
+
+    diff_df = compare(baseline, current, thresholds)
+    print(diff_df.to_string())
+
+    regressions = diff_df[diff_df["status"] == "regression"].index
+    missing = diff_df[diff_df["status"] == "missing"].index
+    if len(regressions) > 0:
+        print(f"Performance regressed: {', '.join(regressions)}", file=sys.stderr)
+    if len(missing) > 0:
+        print(f"Metrics missing in the baseline or in the run: {', '.join(missing)}", file=sys.stderr)
+    if len(regressions) > 0 or len(missing) > 0:
+        sys.exit(1)
@@ -4,10 +4,48 @@ from argparse import ArgumentParser
 from elasticsearch.client import Elasticsearch, IndicesClient
 import utils.args
 import requests
+
+from utils.aggs import SERVER_TIMING_PHASES
 import os
 
 dirname = os.path.dirname(__file__)
 
+# converts legacy unwound response times array into histogram field
+MIGRATE_RESPONSE_TIMES_SCRIPT = """
+Map histogram = new TreeMap();
+for (def ms : ctx._source.stats.response_times) {
+    double value = ((Number) ms).doubleValue();
+    histogram.put(value, histogram.getOrDefault(value, 0) + 1);
+}
+ctx._source.stats.response_time_histogram = [
+    'values': new ArrayList(histogram.keySet()),
+    'counts': new ArrayList(histogram.values())
+];
+ctx._source.stats.remove('response_times');
+"""
+
+def migrate_response_times(es: Elasticsearch, index="locust*"):
+    indices = IndicesClient(es)
+    indices.put_mapping(index=index, body={
+        "properties": {
+            "stats": {
+                "properties": {
+                    "response_time_histogram": { "type": "histogram" }
+                }
+            }
+        }
+    })
+
+    return es.update_by_query(
+        index=index,
+        body={
+            "query": { "exists": { "field": "stats.response_times" } },
+            "script": { "source": MIGRATE_RESPONSE_TIMES_SCRIPT, "lang": "painless" },
+        },
+        conflicts="proceed",
+        wait_for_completion=True,
+        request_timeout=3600)
+
 if __name__ == "__main__":
     parser = ArgumentParser("Initialize elasticsearch indexes")
     utils.args.add_elastic_arg(parser)
@@ -16,6 +54,10 @@ if __name__ == "__main__":
                         dest="kibana",
                         help="Kibana URL",
                         default="http://localhost:5601")
+    parser.add_argument("--migrate",
+                        dest="migrate",
+                        action="store_true",
+                        help="Convert response times of existing locust* indices into histograms")
 
     args = parser.parse_args()
 
@@ -28,7 +70,8 @@ if __name__ == "__main__":
             "index_patterns": ["locust*"],
             "template": {
                 "settings": {
-                    "number_of_replicas": 1,
+                    # single node cluster, replicas would never be assigned
+                    "number_of_replicas": 0,
                 },
                 "mappings": {
                     "properties": {
@@ -62,6 +105,32 @@ if __name__ == "__main__":
                                 }
                             }
                         },
+                        "load_generator": {
+                            "properties": {
+                                "cpu": {
+                                    "type": "float"
+                                },
+                                "loop_lag": {
+                                    "type": "float"
+                                },
+                                "saturated": {
+                                    "type": "boolean"
+                                }
+                            }
+                        },
+                        "connection": {
+                            "properties": {
+                                "policy": {
+                                    "type": "keyword"
+                                },
+                                "max_requests": {
+                                    "type": "integer"
+                                }
+                            }
+                        },
+                        "run_id": {
+                            "type": "keyword"
+                        },
                         "path": {
                             "type": "text",
                             "fields": {
@@ -91,6 +160,14 @@ if __name__ == "__main__":
                                 "response_times": {
                                     "type": "long"
                                 },
+                                "response_time_histogram": {
+                                    "type": "histogram"
+                                },
+                                "server_timing": {
+                                    "properties": {
+                                        phase: { "type": "histogram" } for phase in SERVER_TIMING_PHASES
+                                    }
+                                },
                                 "total_content_length": {
                                     "type": "long"
                                 },
@@ -105,6 +182,108 @@ if __name__ == "__main__":
             }
         })
 
+    print("Creating metricbeat-sampler* index template")
+    indices.put_index_template(
+        "metricbeat_sampler_template", {
+            "index_patterns": ["metricbeat-sampler*"],
+            "template": {
+                "settings": {
+                    "number_of_replicas": 0,
+                },
+                # the same fields as written by metricbeat docker module, so resource queries work on both
+                "mappings": {
+                    "properties": {
+                        "@timestamp": {
+                            "type": "date"
+                        },
+                        "container": {
+                            "properties": {
+                                "name": {
+                                    "type": "keyword"
+                                }
+                            }
+                        },
+                        "docker": {
+                            "properties": {
+                                "cpu": {
+                                    "properties": {
+                                        "total": {
+                                            "properties": {
+                                                "pct": {
+                                                    "type": "scaled_float",
+                                                    "scaling_factor": 1000
+                                                }
+                                            }
+                                        }
+                                    }
+                                },
+                                "memory": {
+                                    "properties": {
+                                        "usage": {
+                                            "properties": {
+                                                "total": {
+                                                    "type": "long"
+                                                },
+                                                "max": {
+                                                    "type": "long"
+                                                }
+                                            }
+                                        }
+                                    }
+                                },
+                                "pids": {
+                                    "properties": {
+                                        "current": {
+                                            "type": "long"
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        })
+
+    print("Creating request-events* index template")
+    indices.put_index_template(
+        "request_events_template", {
+            "index_patterns": ["request-events*"],
+            "template": {
+                "settings": {
+                    "number_of_replicas": 0,
+                },
+                "mappings": {
+                    "properties": {
+                        "@timestamp": {
+                            "type": "date"
+                        },
+                        "client_id": {
+                            "type": "keyword"
+                        },
+                        "run_id": {
+                            "type": "keyword"
+                        },
+                        "method": {
+                            "type": "keyword"
+                        },
+                        "path": {
+                            "type": "keyword"
+                        },
+                        "response_time": {
+                            "type": "float"
+                        },
+                        "status": {
+                            "type": "short"
+                        },
+                        "content_length": {
+                            "type": "long"
+                        }
+                    }
+                }
+            }
+        })
+
     print("Creating locust* kibana index pattern")
     requests.post(f"{args.kibana}/api/saved_objects/_import",
                   files={
@@ -113,3 +292,8 @@ if __name__ == "__main__":
                                'application/ndjson')
                   },
                   headers={"kbn-xsrf": "true"})
+
+    if args.migrate:
+        print("Migrating response times of existing locust* indices to histograms")
+        result = migrate_response_times(es)
+        print(f"Migrated {result['updated']} documents, {len(result['failures'])} failures")
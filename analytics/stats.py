@@ -1,73 +1,159 @@
 #!/usr/bin/env python
 from elasticsearch_dsl import Search, A, Q
 from argparse import ArgumentParser
+from functools import partial, reduce
+import operator
 import humanize
 import pandas as pd 
 import utils.args
-
-from utils.queries import time_query, memory_query, cpu_query
-from utils.aggs import add_requests_aggs, add_memory_aggs, add_cpu_aggs, resource_generator, request_generator
-
-def get_memory_stats(elasticsearch, start, end, containers = [], additional_filter = None):
+import utils.cache
+
+from utils.cache import cached
+from utils.queries import time_query, memory_query, cpu_query, RESOURCE_INDEX
+from utils.aggs import add_requests_aggs, add_memory_aggs, add_cpu_aggs, composite_pages, frame_from_pages, \
+    container_source, path_source, resource_observation, request_path_observation, get_request_observation, PERCENTILES, \
+    add_server_timing_aggs, get_server_timing_observation
+from utils.runs import DEFAULT_INDEX, run_index
+from utils.storage import is_file_storage, get_request_frame, get_resource_frame, get_server_timing_frame
+from times import get_steady_state
+
+@cached
+def get_memory_stats(elasticsearch, start, end, containers = [], additional_filter = None, index = RESOURCE_INDEX):
     query = memory_query(start, end, containers, additional_filter)
 
-    search = Search(using=elasticsearch, index="metricbeat-*") \
+    if is_file_storage(elasticsearch):
+        return get_resource_frame(elasticsearch, "memory", query, start, index=index).set_index("container")
+
+    search = Search(using=elasticsearch, index=index) \
         .extra(size=0) \
         .query(query)
 
-    add_memory_aggs(search.aggs)
-    
-    response = search.execute()
-    return pd.DataFrame(resource_generator(response.aggregations)).set_index("container")
+    pages = composite_pages(search, [ container_source ], add_memory_aggs)
+    return frame_from_pages(pages, resource_observation).set_index("container")
 
-def get_cpu_stats(elasticsearch, start, end, containers = [], additional_filter = None):
+@cached
+def get_cpu_stats(elasticsearch, start, end, containers = [], additional_filter = None, index = RESOURCE_INDEX):
     query = cpu_query(start, end, containers, additional_filter)
 
-    search = Search(using=elasticsearch, index="metricbeat-*") \
+    if is_file_storage(elasticsearch):
+        return get_resource_frame(elasticsearch, "cpu", query, start, index=index).set_index("container")
+
+    search = Search(using=elasticsearch, index=index) \
+        .extra(size=0) \
+        .query(query)
+
+    pages = composite_pages(search, [ container_source ], add_cpu_aggs)
+    return frame_from_pages(pages, resource_observation).set_index("container")
+
+@cached
+def get_request_stats(elasticsearch, start, end, per_path = False, additional_filter = None, index = DEFAULT_INDEX, percents = PERCENTILES):
+    if is_file_storage(elasticsearch):
+        frames = [ get_request_frame(elasticsearch, start, end, additional_filter, index, percents=percents).assign(path="all") ]
+        if per_path:
+            frames.append(get_request_frame(elasticsearch, start, end, additional_filter, index, by=[ "path" ], percents=percents))
+
+        return pd.concat(frames, ignore_index=True).set_index("path")
+
+    query = time_query(start, end)
+
+    if additional_filter is not None:
+        query = query & additional_filter
+
+    search = Search(using=elasticsearch, index=index) \
         .extra(size=0) \
         .query(query)
 
-    add_cpu_aggs(search.aggs)
-    
-    response = search.execute()
-    return pd.DataFrame(resource_generator(response.aggregations)).set_index("container")
+    all_search = search.extra(size=0)
+    add_requests_aggs(all_search.aggs, percents)
+    response = all_search.execute()
+
+    frames = [ pd.DataFrame([ { "path": "all", **get_request_observation(response.aggregations, start, end) } ]) ]
+    if per_path:
+        frames.append(frame_from_pages(composite_pages(search, [ path_source ], partial(add_requests_aggs, percents=percents)), request_path_observation(start, end)))
+
+    return pd.concat(frames, ignore_index=True).set_index("path")
+
+@cached
+def get_server_timing_stats(elasticsearch, start, end, per_path = False, additional_filter = None, index = DEFAULT_INDEX):
+    if is_file_storage(elasticsearch):
+        frames = [ get_server_timing_frame(elasticsearch, start, end, additional_filter, index).assign(path="all") ]
+        if per_path:
+            frames.append(get_server_timing_frame(elasticsearch, start, end, additional_filter, index, by=[ "path" ]))
+
+        df = pd.concat(frames, ignore_index=True)
+        return df.set_index(["path", "phase"]) if not df.empty else df
 
-def get_request_stats(elasticsearch, start, end, per_path = False, additional_filter = None):
     query = time_query(start, end)
 
     if additional_filter is not None:
         query = query & additional_filter
 
-    search = Search(using=elasticsearch, index="locust*") \
+    search = Search(using=elasticsearch, index=index) \
         .extra(size=0) \
         .query(query)
-    
-    add_requests_aggs(search.aggs)
+
+    all_search = search.extra(size=0)
+    add_server_timing_aggs(all_search.aggs)
+    response = all_search.execute()
+
+    rows = [ { "path": "all", **row } for row in get_server_timing_observation(response.aggregations) ]
     if per_path:
-        add_requests_aggs(search.aggs.bucket('per_path', 'terms', field="path.keyword", size=1000))
+        for page in composite_pages(search, [ path_source ], add_server_timing_aggs):
+            rows.extend({ "path": bucket.key.path, **row } for bucket in page for row in get_server_timing_observation(bucket))
+
+    df = pd.DataFrame(rows)
+    return df.set_index(["path", "phase"]) if not df.empty else df
 
-    response = search.execute()
-    
-    data = request_generator(response.aggs, start, end)
-    return pd.DataFrame(data).set_index("path")
+def get_merged_request_stats(elasticsearch, windows, per_path = False, additional_filter = None):
+    """
+    Returns request stats of multiple (start, end, index) windows treated as one test - percentiles are computed by
+    elasticsearch from all the histograms at once, as percentiles of separate windows cannot be averaged.
+    """
+    starts, ends, indices = zip(*windows)
+
+    ranges = reduce(operator.or_, [ time_query(start, end) for start, end in zip(starts, ends) ])
+    if additional_filter is not None:
+        ranges = ranges & additional_filter
+    index = DEFAULT_INDEX if DEFAULT_INDEX in indices else ",".join(sorted(set(indices)))
+
+    df = get_request_stats(elasticsearch, min(starts), max(ends), per_path, additional_filter=ranges, index=index).copy()
+    df["rps"] = df["requests"] / sum((end - start).total_seconds() for start, end in zip(starts, ends))
+
+    return df
 
 if __name__ == "__main__":
     parser = ArgumentParser(description="Extract statistical data from Elasticsearch")
 
     utils.args.add_elastic_arg(parser)
     utils.args.add_containers_arg(parser)
-    utils.args.add_date_range_args(parser)
+    utils.args.add_date_range_args(parser, optional_start=True, optional_end=True)
+    utils.args.add_run_arg(parser)
     utils.args.add_per_path_arg(parser)
     utils.args.add_resources_args(parser)
+    utils.args.add_percentiles_arg(parser)
+    utils.args.add_server_timing_arg(parser)
+    utils.args.add_cache_args(parser)
+    utils.args.add_steady_state_arg(parser)
 
     args = parser.parse_args()
     es   = args.elasticsearch
 
-    start, end = getattr(args, 'from'), getattr(args, 'to')
+    utils.cache.configure(enabled=args.cache, refresh=args.refresh)
 
-    requests_df = get_request_stats(es, start, end, args.per_path)
+    start, end = utils.args.resolve_date_range(parser, args)
+    index = run_index(args.run)
+
+    if args.steady_state:
+        steady_start, end = get_steady_state(es, start, end, index=index)
+        print(f"Steady state from {steady_start} to {end}, warm-up took {(steady_start - start).total_seconds():.0f}s")
+        start = steady_start
+
+    requests_df = get_request_stats(es, start, end, args.per_path, index=index, percents=args.percentiles)
     print(requests_df)
 
+    if args.server_timing:
+        print(get_server_timing_stats(es, start, end, args.per_path, index=index).to_string(float_format="{:.2f}ms".format))
+
     if args.memory:
         memory_df = get_memory_stats(es, start, end, containers=args.containers)
         print(memory_df.to_string(formatters={ column: humanize.naturalsize for column in memory_df.columns }))
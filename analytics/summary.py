@@ -1,15 +1,19 @@
+import sys
 import pandas as pd 
 from argparse import ArgumentParser
-from yaml import load
-try:
-    from yaml import CLoader as Loader, CDumper as Dumper
-except ImportError:
-    from yaml import Loader, Dumper
+from concurrent.futures import ThreadPoolExecutor
 
-from stats import get_request_stats, get_memory_stats, get_cpu_stats
+from stats import get_request_stats, get_merged_request_stats, get_memory_stats, get_cpu_stats, get_server_timing_stats
+from times import get_steady_state
 import utils.args
+import utils.cache
 import humanize
 
+from utils.aggs import SERVER_TIMING_PHASES
+from utils.definitions import load_definitions
+from utils.repetitions import OUTLIER_THRESHOLD, suite_repetitions, get_variation, find_outliers
+from utils.runs import resolve_suite, suite_filter
+
 time_formatter = "{:.0f}ms".format
 percent_formatter = "{:.1%}".format
 memory_formatter = humanize.naturalsize
@@ -22,54 +26,135 @@ formatters = {
     "50th percentile": time_formatter,
     "80th percentile": time_formatter,
     "95th percentile": time_formatter,
+    "99th percentile": time_formatter,
     "peak memory": memory_formatter,
     "95th memory percentile": memory_formatter,
     "average cpu": percent_formatter,
     "95th cpu percentile": percent_formatter,
+    "generator cpu": percent_formatter,
+    "warm-up": "{:.0f}s".format,
+    "rps cv": percent_formatter,
+    "95th percentile cv": percent_formatter,
+    "mean": "{:.2f}".format,
+    "std": "{:.2f}".format,
+    "cv": percent_formatter,
+    "min": "{:.2f}".format,
+    "max": "{:.2f}".format,
+    **{ f"{phase} time": "{:.2f}ms".format for phase in SERVER_TIMING_PHASES },
 }
 
+RESOURCE_COLUMNS = [ "peak memory", "95th memory percentile", "average cpu", "95th cpu percentile" ]
+PEAK_COLUMNS = [ "peak memory" ]
+
+# metrics checked for consistency between repetitions
+VARIATION_COLUMNS = [ "rps", "95th percentile" ]
+
+def evaluate_suite(elasticsearch, suite, steady_state=False, server_timing=False):
+    start, end, index = resolve_suite(elasticsearch, suite)
+    requests_filter = suite_filter(suite)
+
+    warmup = None
+    if steady_state:
+        steady_start, end = get_steady_state(elasticsearch, start, end, additional_filter=requests_filter, index=index)
+        warmup, start = (steady_start - start).total_seconds(), steady_start
+
+    current_df = get_request_stats(elasticsearch, start, end, additional_filter=requests_filter, index=index).copy()
+    current_df["suite"] = suite["name"]
+
+    if steady_state:
+        current_df["warm-up"] = warmup
+
+    memory_df = get_memory_stats(elasticsearch, start, end, containers=suite["containers"])
+    current_df["peak memory"] = sum(memory_df["peak"])
+    current_df["95th memory percentile"] = sum(memory_df["95th percentile"])
+
+    cpu_df = get_cpu_stats(elasticsearch, start, end, containers=suite["containers"])
+    current_df["average cpu"] = sum(cpu_df["average"])
+    current_df["95th cpu percentile"] = sum(cpu_df["95th percentile"])
+
+    if server_timing:
+        timing_df = get_server_timing_stats(elasticsearch, start, end, additional_filter=requests_filter, index=index)
+        for phase in SERVER_TIMING_PHASES:
+            current_df[f"{phase} time"] = timing_df.loc[("all", phase), "average"] if ("all", phase) in timing_df.index else float("nan")
+
+    return (start, end, index), current_df
+
+def merge_repetitions(elasticsearch, suite, windows, repetitions_df):
+    # latency and throughput are computed from all repetitions at once, resources are averaged over repetitions
+    # except of the peaks, which are the highest of all repetitions
+    current_df = get_merged_request_stats(elasticsearch, windows, additional_filter=suite_filter(suite))
+    current_df["suite"] = suite["name"]
+
+    for column in [ "warm-up", *RESOURCE_COLUMNS, *[ f"{phase} time" for phase in SERVER_TIMING_PHASES ] ]:
+        if column in repetitions_df:
+            current_df[column] = repetitions_df[column].max() if column in PEAK_COLUMNS else repetitions_df[column].mean()
+
+    current_df["generator saturated"] = repetitions_df["generator saturated"].any()
+
+    return current_df
+
+def describe_repetition(repetition, number):
+    return f"run {repetition['run']}" if "run" in repetition else f"#{number} ({repetition['from']})"
+
 if __name__ == "__main__":
     parser = ArgumentParser("Summarizes results")
     parser.add_argument("definitions", help="YAML file with test definitions")
-    parser.set_defaults(format=lambda df: pd.DataFrame.to_string(df, formatters=formatters))
-
-    output_format_group = parser.add_mutually_exclusive_group()
-    output_format_group.add_argument(
-        "--latex", "-l", 
-        help="Output as LaTeX table", 
-        const=lambda df: pd.DataFrame.to_latex(df, formatters=formatters), 
-        action='store_const', 
-        dest="format")
-    output_format_group.add_argument(
-        "--csv", "-c", 
-        help="Output as CSV", 
-        const=pd.DataFrame.to_csv, 
-        action='store_const', 
-        dest="format")
+    parser.add_argument("--variation", "-V", dest="variation", action="store_true", help="Show variation of metrics across repetitions")
+    parser.add_argument("--outlier-threshold", dest="outlier_threshold", type=float, default=OUTLIER_THRESHOLD,
+                        help="Relative deviation from other repetitions above which repetition is reported as outlier")
 
+    utils.args.add_format_args(parser, formatters)
     utils.args.add_elastic_arg(parser)
+    utils.args.add_cache_args(parser)
+    utils.args.add_jobs_arg(parser)
+    utils.args.add_steady_state_arg(parser)
+    utils.args.add_server_timing_arg(parser)
 
     args = parser.parse_args()
 
-    definitions = load(open(args.definitions), Loader=Loader)
+    utils.cache.configure(enabled=args.cache, refresh=args.refresh)
+
+    definitions = load_definitions(args.definitions)
+    repetitions = { suite["name"]: suite_repetitions(suite) for suite in definitions['tests'] }
+    repeated = [ name for name in repetitions if len(repetitions[name]) > 1 ]
 
-    stats_df = pd.DataFrame()
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        # all repetitions of all suites are evaluated at once
+        pairs = [ (name, repetition) for name in repetitions for repetition in repetitions[name] ]
+        results = list(executor.map(lambda pair: evaluate_suite(args.elasticsearch, pair[1], args.steady_state, args.server_timing), pairs))
 
-    for suite in definitions['tests']:
-        current_df = get_request_stats(args.elasticsearch, suite['from'], suite['to'])
-        current_df["suite"] = suite["name"]
+        windows = { name: [] for name in repetitions }
+        frames = { name: [] for name in repetitions }
+        for (name, _), (window, frame) in zip(pairs, results):
+            windows[name].append(window)
+            frames[name].append(frame)
 
-        memory_df = get_memory_stats(args.elasticsearch, suite['from'], suite['to'], containers=suite["containers"])
-        current_df["peak memory"] = sum(memory_df["peak"])
-        current_df["95th memory percentile"] = sum(memory_df["95th percentile"])
+        frames = { name: pd.concat(frames[name], ignore_index=True) for name in frames }
+        merged = dict(zip(repeated, executor.map(lambda name: merge_repetitions(args.elasticsearch, repetitions[name][0], windows[name], frames[name]), repeated)))
 
-        cpu_df = get_cpu_stats(args.elasticsearch, suite['from'], suite['to'], containers=suite["containers"])
-        current_df["average cpu"] = sum(cpu_df["average"])
-        current_df["95th cpu percentile"] = sum(cpu_df["95th percentile"])
+    stats_df = pd.concat([ merged.get(name, frames[name]) for name in repetitions ])
 
-        stats_df = stats_df.append(current_df)
+    if repeated:
+        stats_df["repetitions"] = [ len(repetitions[name]) for name in stats_df["suite"] ]
+        for column in VARIATION_COLUMNS:
+            stats_df[f"{column} cv"] = [ get_variation(frames[name], [ column ])["cv"][column] for name in stats_df["suite"] ]
 
     stats_df = stats_df.set_index(["suite"])
     stats_df = stats_df.drop(columns=["content length", "requests"])
 
-    print(args.format(stats_df))
\ No newline at end of file
+    print(args.format(stats_df))
+
+    if args.variation and repeated:
+        columns = [ column for column in [ *VARIATION_COLUMNS, "average", "failures", *RESOURCE_COLUMNS ] if column in stats_df ]
+        variation_df = pd.concat({ name: get_variation(frames[name], columns) for name in repeated }, names=["suite", "metric"])
+        print(args.format(variation_df))
+
+    for suite in stats_df[stats_df["generator saturated"]].index.unique():
+        print(f"Warning: load generator was saturated during '{suite}', results may describe locust rather than the server", file=sys.stderr)
+
+    for name in repeated:
+        for column in VARIATION_COLUMNS:
+            outliers = find_outliers(frames[name][column].to_numpy(dtype=float), args.outlier_threshold)
+            for number in outliers.nonzero()[0]:
+                print(f"Warning: {column} of repetition {describe_repetition(repetitions[name][number], number + 1)} of '{name}' "
+                      f"deviates from the median of repetitions by more than {args.outlier_threshold:.0%}", file=sys.stderr)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# scripts of the analytics directory import each other and utils as top level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
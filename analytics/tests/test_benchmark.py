@@ -0,0 +1,51 @@
+from benchmark import StubDocker, FRONTEND_SERVICES, get_cells, cell_run_id, run_cell, get_definitions
+
+def test_run_cell_stops_other_frontends_and_runs_locust():
+    docker = StubDocker()
+    cell = { "frontend": "fpm", "tags": "light", "users": 100, "repetition": 1 }
+
+    result = run_cell(docker, cell, "test-fpm", duration=60, workers=2, warmup=5, timeout=30)
+
+    assert [ call[0] for call in docker.calls ] == [ "stop", "start", "wait", "start", "run", "stop" ]
+
+    stopped = docker.calls[0][1]
+    assert "frontend-fpm" not in stopped and "fpm" not in stopped
+    assert set(stopped) == set(FRONTEND_SERVICES) - { "frontend-fpm", "fpm" }
+
+    assert docker.calls[1] == ("start", [ "frontend-fpm", "fpm" ], {}, {}, False)
+    assert docker.calls[2] == ("wait", "http://frontend-fpm:8080", 30, 5)
+
+    _, services, environment, scale, recreate = docker.calls[3]
+    assert services == [ "locust-worker" ] and scale == { "locust-worker": 2 } and recreate
+    assert environment["LOCUST_RUN_ID"] == "test-fpm"
+    assert environment["LOCUST_MAX_USER_COUNT"] == "100"
+    assert environment["LOCUST_TIME_LIMIT"] == "60"
+
+    _, service, command, _ = docker.calls[4]
+    assert service == "locust-master"
+    assert command[command.index("-H") + 1] == "http://frontend-fpm:8080"
+    assert command[command.index("--expect-workers") + 1] == "2"
+
+    assert docker.calls[5] == ("stop", [ "locust-worker" ])
+    assert result == { "run": "test-fpm", "exit code": 0 }
+
+def test_definitions_group_repetitions_into_suites():
+    docker = StubDocker(project="bench")
+    cells = get_cells([ "rr", "apache" ], [ "light" ], [ 50 ], repetitions=2)
+
+    # repetition is the outermost loop
+    assert [ (cell["repetition"], cell["frontend"]) for cell in cells ] == [ (1, "rr"), (1, "apache"), (2, "rr"), (2, "apache") ]
+
+    results = [ run_cell(docker, cell, cell_run_id("prefix", cell), duration=60) for cell in cells ]
+    definitions = get_definitions(cells, results, docker, duration=60)
+
+    assert definitions["duration"] == 60
+    assert [ suite["name"] for suite in definitions["tests"] ] == [ "rr light 50 users", "apache light 50 users" ]
+
+    rr = definitions["tests"][0]
+    assert rr["containers"] == [ "bench_frontend-rr_1" ]
+    assert rr["host"] == "http://frontend-rr:8080"
+    assert rr["repetitions"] == [
+        { "run": "prefix-rr-light-50-1", "exit code": 0 },
+        { "run": "prefix-rr-light-50-2", "exit code": 0 },
+    ]
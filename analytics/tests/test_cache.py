@@ -0,0 +1,25 @@
+import pandas as pd
+from datetime import timedelta
+
+from utils.cache import cache, cached, FINISHED_AFTER
+from utils.dates import now
+
+@cached
+def count_calls(elasticsearch, start, end):
+    elasticsearch.append(end)
+    return pd.DataFrame({ "calls": [ len(elasticsearch) ] })
+
+def test_range_that_ended_just_now_is_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "enabled", True)
+    monkeypatch.setattr(cache, "directory", str(tmp_path))
+    calls = []
+
+    end = now() - timedelta(seconds=1)
+    count_calls(calls, end - timedelta(minutes=10), end)
+    count_calls(calls, end - timedelta(minutes=10), end)
+    assert len(calls) == 2
+
+    end = now() - FINISHED_AFTER - timedelta(seconds=1)
+    count_calls(calls, end - timedelta(minutes=10), end)
+    count_calls(calls, end - timedelta(minutes=10), end)
+    assert len(calls) == 3
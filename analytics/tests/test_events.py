@@ -0,0 +1,45 @@
+import json
+import zlib
+import base64
+import numpy as np
+from types import SimpleNamespace
+
+import utils.events
+from utils.cache import cache
+from utils.events import HEADER, COLUMNS, load_events, load_stored_events
+
+def pack(timestamps, requests, table):
+    # same layout as EventLog.pack in locust/locustfile.py
+    count = len(timestamps)
+    columns = {
+        "timestamp": timestamps,
+        "response_time": np.arange(count) * 10.0,
+        "status": np.full(count, 200),
+        "content_length": np.full(count, 1024),
+        "request": requests,
+    }
+
+    payload = zlib.compress(b"".join(np.asarray(columns[name], dtype=dtype).tobytes() for name, dtype in COLUMNS) + json.dumps(table).encode())
+    return HEADER.pack(count, len(payload)) + payload
+
+BATCHES = [
+    pack([ 1614600000.0, 1614600001.5 ], [ 0, 1 ], [ [ "GET", "/" ], [ "GET", "/blog" ] ]),
+    pack([ 1614600002.0 ], [ 0 ], [ [ "GET", "/blog" ] ]),
+]
+
+def test_stored_batches_are_read_the_same_as_event_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "directory", str(tmp_path / "cache"))
+
+    path = tmp_path / "worker.events"
+    path.write_bytes(b"".join(BATCHES))
+
+    documents = [ { "_source": { "events": base64.b64encode(batch).decode() } } for batch in BATCHES ]
+    monkeypatch.setattr(utils.events.helpers, "scan", lambda elasticsearch, index, query: iter(documents))
+    elasticsearch = SimpleNamespace(
+        indices=SimpleNamespace(refresh=lambda index: None),
+        count=lambda index: { "count": len(documents) },
+    )
+
+    stored_df = load_stored_events(elasticsearch, "run")
+    assert stored_df["path"].tolist() == [ "/", "/blog", "/blog" ]
+    assert stored_df.equals(load_events([ str(tmp_path) ]))
@@ -0,0 +1,31 @@
+import numpy as np
+
+from regression import compare
+
+BASELINE = {
+    "50th percentile": 20.0,
+    "95th percentile": 80.0,
+    "99th percentile": 150.0,
+    "rps": 500.0,
+    "failure rate": 0.0,
+    "cpu": 1.5,
+    "memory": 256 * 2 ** 20,
+}
+
+def test_regression_and_improvement_exceed_both_thresholds():
+    current = { **BASELINE, "95th percentile": 100.0, "rps": 600.0, "50th percentile": 20.5 }
+    status = compare(BASELINE, current)["status"]
+
+    assert status["95th percentile"] == "regression"
+    assert status["rps"] == "improvement"
+    assert status["50th percentile"] == "ok"
+
+def test_nan_or_missing_metrics_are_not_ok():
+    current = { **BASELINE, "cpu": np.nan, "failure rate": np.nan }
+    baseline = { metric: value for metric, value in BASELINE.items() if metric != "memory" }
+
+    diff_df = compare(baseline, current)
+
+    assert diff_df.loc[[ "cpu", "failure rate", "memory" ], "status"].tolist() == [ "missing" ] * 3
+    assert diff_df.loc["memory", "baseline"] == "n/a"
+    assert (diff_df.drop([ "cpu", "failure rate", "memory" ])["status"] == "ok").all()
@@ -1,103 +1,258 @@
 #!/usr/bin/env python
+import sys
 from elasticsearch_dsl import Search, A, Q
 from argparse import ArgumentParser
 import humanize
 import pandas as pd 
 import utils.args
-from datetime import datetime
+import utils.cache
+import time
+from collections import defaultdict
+from datetime import timedelta
+from functools import partial
+from utils.cache import cached
+from utils.steady import find_steady_state
+from utils.dates import now
+from utils.window import SlidingWindow
+from utils.runs import DEFAULT_INDEX, run_index
+from utils.storage import is_file_storage, get_request_frame, get_resource_frame, get_latency_histogram_frame
 
-from utils.queries import memory_query, cpu_query, time_query
-from utils.aggs import add_requests_aggs, add_memory_aggs, add_cpu_aggs, resource_generator, request_generator, time_bucket
+from utils.queries import memory_query, cpu_query, time_query, RESOURCE_INDEX
+from utils.aggs import add_requests_aggs, add_memory_aggs, add_cpu_aggs, add_latency_histogram_aggs, composite_pages, frame_from_pages, \
+    elastic_interval_to_seconds, time_source, container_source, path_source, resource_time_observation, request_time_observation, \
+    latency_histogram_time_observation, latency_buckets, PERCENTILES
 
 def add_offset_variable(df: pd.DataFrame, index=[]):
     df["offset"] = (df["time"] - min(df["time"])).map(lambda x: x.total_seconds())
     df = df.set_index(["offset", *index])
     return df
 
-def time_series_generator(aggregation, subgenerator):
-    for time_segment in aggregation:
-        segment_start = datetime.utcfromtimestamp(time_segment.key / 1000)
-        for observation in subgenerator(time_segment):
-            yield { "time": segment_start, **observation }
-
-def get_memory_time_series(elasticsearch, start, end, containers = [], additional_filter = None, interval="5s"):
+@cached
+def get_memory_time_series(elasticsearch, start, end, containers = [], additional_filter = None, interval="5s", index = RESOURCE_INDEX):
     query = memory_query(start, end, containers, additional_filter)
 
-    search = Search(using=elasticsearch, index="metricbeat-*") \
-        .extra(size=0) \
-        .query(query)
+    if is_file_storage(elasticsearch):
+        df = get_resource_frame(elasticsearch, "memory", query, start, by=[ "time", "container" ], interval=interval, index=index)
+    else:
+        search = Search(using=elasticsearch, index=index) \
+            .extra(size=0) \
+            .query(query)
 
-    add_memory_aggs(time_bucket(search.aggs, start, end, interval=interval))
-    
-    response = search.execute()
+        pages = composite_pages(search, [ time_source(start, interval), container_source ], add_memory_aggs)
+        df = frame_from_pages(pages, resource_time_observation)
 
-    data = time_series_generator(response.aggregations.time, resource_generator)
+    if df.empty:
+        return df
 
-    df = pd.DataFrame(data)
     df = add_offset_variable(df, ["container"])
 
     return df
 
-def get_cpu_time_series(elasticsearch, start, end, containers = [], additional_filter = None, interval="5s"):
+@cached
+def get_cpu_time_series(elasticsearch, start, end, containers = [], additional_filter = None, interval="5s", index = RESOURCE_INDEX):
     query = cpu_query(start, end, containers, additional_filter)
 
-    search = Search(using=elasticsearch, index="metricbeat-*") \
-        .extra(size=0) \
-        .query(query)
+    if is_file_storage(elasticsearch):
+        df = get_resource_frame(elasticsearch, "cpu", query, start, by=[ "time", "container" ], interval=interval, index=index)
+    else:
+        search = Search(using=elasticsearch, index=index) \
+            .extra(size=0) \
+            .query(query)
 
-    add_cpu_aggs(time_bucket(search.aggs, start, end, interval=interval))
-    
-    response = search.execute()
+        pages = composite_pages(search, [ time_source(start, interval), container_source ], add_cpu_aggs)
+        df = frame_from_pages(pages, resource_time_observation)
 
-    data = time_series_generator(response.aggregations.time, resource_generator)
+    if df.empty:
+        return df
 
-    df = pd.DataFrame(data)
     df = add_offset_variable(df, ["container"])
 
     return df
 
-def get_request_time_series(elasticsearch, start, end, per_path = False, additional_filter = None, interval="5s"):
-    query = time_query(start, end)
+@cached
+def get_request_time_series(elasticsearch, start, end, per_path = False, additional_filter = None, interval="5s", index = DEFAULT_INDEX, percents = PERCENTILES):
+    if is_file_storage(elasticsearch):
+        frames = [ get_request_frame(elasticsearch, start, end, additional_filter, index, [ "time" ], interval, percents).assign(path="all") ]
+        if per_path:
+            frames.append(get_request_frame(elasticsearch, start, end, additional_filter, index, [ "time", "path" ], interval, percents))
+    else:
+        query = time_query(start, end)
+
+        if additional_filter is not None:
+            query = query & additional_filter
+
+        search = Search(using=elasticsearch, index=index) \
+            .extra(size=0) \
+            .query(query)
 
-    if additional_filter is not None:
-        query = query & additional_filter
+        add_aggs = partial(add_requests_aggs, percents=percents)
 
-    search = Search(using=elasticsearch, index="locust*") \
-        .extra(size=0) \
-        .query(query)
-    
-    time_series = time_bucket(search.aggs, start, end, interval=interval)
+        pages = composite_pages(search, [ time_source(start, interval) ], add_aggs)
+        frames = [ frame_from_pages(pages, request_time_observation(interval, path="all")) ]
 
-    add_requests_aggs(time_series)
-    if per_path:
-        add_requests_aggs(time_series.bucket('per_path', 'terms', field="path.keyword", size=1000))
+        if per_path:
+            pages = composite_pages(search, [ time_source(start, interval), path_source ], add_aggs)
+            frames.append(frame_from_pages(pages, request_time_observation(interval)))
 
-    response = search.execute()
-    data = time_series_generator(response.aggs.time, lambda results: request_generator(results, start, end))
+    df = pd.concat(frames, ignore_index=True)
+    if df.empty:
+        return df
 
-    df = pd.DataFrame(data)
+    df = df.sort_values("time", kind="stable")
     df = add_offset_variable(df, ["path"])
     return df
 
+@cached
+def get_latency_histogram(elasticsearch, start, end, per_path = False, additional_filter = None, interval="5s", index = DEFAULT_INDEX, edges = None):
+    """
+    Returns number of requests in every log-spaced latency bucket (columns named by upper edge in ms) per interval.
+    """
+    edges = edges or latency_buckets()
+
+    if is_file_storage(elasticsearch):
+        frames = [ get_latency_histogram_frame(elasticsearch, start, end, additional_filter, index, [ "time" ], interval, edges).assign(path="all") ]
+        if per_path:
+            frames.append(get_latency_histogram_frame(elasticsearch, start, end, additional_filter, index, [ "time", "path" ], interval, edges))
+    else:
+        query = time_query(start, end)
+
+        if additional_filter is not None:
+            query = query & additional_filter
+
+        search = Search(using=elasticsearch, index=index) \
+            .extra(size=0) \
+            .query(query)
+
+        add_aggs = partial(add_latency_histogram_aggs, edges=edges)
+
+        pages = composite_pages(search, [ time_source(start, interval) ], add_aggs)
+        frames = [ frame_from_pages(pages, latency_histogram_time_observation(path="all")) ]
+
+        if per_path:
+            pages = composite_pages(search, [ time_source(start, interval), path_source ], add_aggs)
+            frames.append(frame_from_pages(pages, latency_histogram_time_observation()))
+
+    df = pd.concat(frames, ignore_index=True)
+    if df.empty:
+        return df
+
+    df = df.sort_values("time", kind="stable")
+    df = add_offset_variable(df, ["path"])
+    return df
+
+def export_frame(df: pd.DataFrame, path):
+    # feather (arrow IPC) does not store index, so it is kept as ordinary columns in both formats
+    if path.endswith(".arrow") or path.endswith(".feather"):
+        df.reset_index().to_feather(path)
+    else:
+        df.reset_index().to_parquet(path, index=False)
+
+def get_steady_state(elasticsearch, start, end, additional_filter = None, interval="5s", index = DEFAULT_INDEX):
+    df = get_request_time_series(elasticsearch, start, end, additional_filter=additional_filter, interval=interval, index=index)
+    return find_steady_state(df, start, end, interval=interval)
+
+def follow(elasticsearch, start, containers = [], resources = False, interval="5s", window=12, lag=10, poll=None, index = DEFAULT_INDEX):
+    """
+    Prints rolling statistics of the running test. Every poll only buckets completed since the previous one are 
+    queried, so the cost of the query does not grow with the length of the test.
+    """
+    seconds = elastic_interval_to_seconds(interval)
+    requests_window = SlidingWindow(window)
+    resource_windows = defaultdict(lambda: SlidingWindow(window))
+
+    cursor = start
+    while True:
+        # reports from locust and metricbeat arrive with some delay, so buckets younger than lag are not complete
+        elapsed = (now(start) - timedelta(seconds=lag) - start).total_seconds()
+        complete = start + timedelta(seconds=elapsed // seconds * seconds)
+
+        if complete > cursor:
+            # range is inclusive, so the last millisecond belongs to the next poll
+            end = complete - timedelta(milliseconds=1)
+
+            for _, bucket in get_request_time_series(elasticsearch, cursor, end, interval=interval, index=index).iterrows():
+                requests_window.push(bucket.to_dict())
+                print(
+                    f"{bucket['time']}  rps {bucket['rps']:8.2f} (avg {requests_window.mean('rps'):8.2f})  "
+                    f"p50 {bucket['50th percentile']:6.0f}ms (avg {requests_window.mean('50th percentile'):6.0f}ms)  "
+                    f"p95 {bucket['95th percentile']:6.0f}ms (max {requests_window.max('95th percentile'):6.0f}ms)  "
+                    f"failures {bucket['failures']}")
+
+            if resources:
+                series = {}
+                for resource, df in [
+                    ("cpu", get_cpu_time_series(elasticsearch, cursor, end, containers=containers, interval=interval)),
+                    ("memory", get_memory_time_series(elasticsearch, cursor, end, containers=containers, interval=interval)),
+                ]:
+                    if not df.empty:
+                        series[resource] = df.reset_index().set_index(["time", "container"])["average"]
+
+                if len(series) > 0:
+                    for (_, container), bucket in pd.concat(series, axis=1).iterrows():
+                        resource_windows[container].push(bucket.to_dict())
+
+                for container, resource_window in sorted(resource_windows.items()):
+                    print(f"    {container:30}  cpu {resource_window.mean('cpu'):6.1%}  memory {humanize.naturalsize(resource_window.mean('memory'))}")
+
+            cursor = complete
+
+        time.sleep(poll or seconds)
+
 if __name__ == "__main__":
     parser = ArgumentParser(description="Extract time series data from Elasticsearch")
 
     utils.args.add_elastic_arg(parser)
     utils.args.add_containers_arg(parser)
-    utils.args.add_date_range_args(parser)
+    utils.args.add_date_range_args(parser, optional_start=True, optional_end=True)
+    utils.args.add_run_arg(parser)
     utils.args.add_per_path_arg(parser)
     utils.args.add_resources_args(parser)
+    utils.args.add_percentiles_arg(parser)
+
+    utils.args.add_cache_args(parser)
 
     parser.add_argument("--interval", "-i", dest="interval", type=str, help="Interfal between next time steps", default="5s")
+    parser.add_argument("--follow", "-f", dest="follow", action="store_true", help="Follow running test")
+    parser.add_argument("--window", "-w", dest="window", type=int, help="Number of intervals in the rolling window", default=12)
+    parser.add_argument("--lag", dest="lag", type=int, help="Delay in seconds after which interval is considered complete", default=10)
+    parser.add_argument("--histogram", "-H", dest="histogram", type=str, default=None,
+                        help="Export time x latency bucket matrix to the parquet (or .arrow) file")
+    parser.add_argument("--buckets-per-decade", dest="per_decade", type=int, help="Number of latency buckets per decade", default=10)
+    parser.add_argument("--max-latency", dest="max_latency", type=float, help="Upper edge of the last latency bucket in ms", default=60000)
  
     args = parser.parse_args()
     es   = args.elasticsearch
 
-    start, end = getattr(args, 'from'), getattr(args, 'to')
+    utils.cache.configure(enabled=args.cache, refresh=args.refresh)
+
+    index = run_index(args.run)
+
+    if args.follow:
+        start = getattr(args, 'from')
+        if start is None:
+            parser.error("the following arguments are required: from")
+
+        # following queries are never repeated, there is no point in caching them
+        utils.cache.configure(enabled=False)
 
-    requests_df = get_request_time_series(es, start, end, args.per_path, interval=args.interval)
+        try:
+            follow(es, start, args.containers, args.cpu or args.memory, interval=args.interval, window=args.window, lag=args.lag, index=index)
+        except KeyboardInterrupt:
+            pass
+
+        sys.exit(0)
+
+    start, end = utils.args.resolve_date_range(parser, args)
+
+    requests_df = get_request_time_series(es, start, end, args.per_path, interval=args.interval, index=index, percents=args.percentiles)
     print(requests_df)
 
+    if args.histogram:
+        edges = latency_buckets(maximum=args.max_latency, per_decade=args.per_decade)
+        histogram_df = get_latency_histogram(es, start, end, args.per_path, interval=args.interval, index=index, edges=edges)
+        export_frame(histogram_df, args.histogram)
+        print(f"Latency histogram with {len(edges) + 1} buckets of {len(histogram_df)} intervals written to {args.histogram}", file=sys.stderr)
+
     if args.memory:
         memory_df = get_memory_time_series(es, start, end, containers=args.containers, interval=args.interval)
         print(memory_df.to_string(formatters={ column: humanize.naturalsize for column in memory_df.columns if column not in ["offset", "time"] }))
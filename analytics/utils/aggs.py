@@ -1,18 +1,59 @@
+import sys
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from elasticsearch_dsl import Search
 from elasticsearch_dsl.aggs import AggBase
 
-def add_requests_aggs(agg: AggBase):
+# response times are stored as pre-aggregated histogram (values + counts), average is exact and HDR percentiles
+# with 3 significant digits are within 0.1% of the exact value
+RESPONSE_TIMES_FIELD = "stats.response_time_histogram"
+PERCENTILES_HDR = { "number_of_significant_value_digits": 3 }
+PERCENTILES = [ 50, 80, 95, 99 ]
+
+# phases of request processing reported by the SUT in Server-Timing header, stored as histograms next to response times
+SERVER_TIMING_FIELD = "stats.server_timing"
+SERVER_TIMING_PHASES = [ "boot", "controller", "db", "template", "highlight" ]
+
+# number of buckets fetched by one request of composite aggregation
+PAGE_SIZE = 1000
+
+def add_requests_aggs(agg: AggBase, percents=PERCENTILES):
     return agg \
-    .metric('percentiles', 'percentiles', field="stats.response_times", percents=[ 50, 80, 95 ]) \
+    .metric('percentiles', 'percentiles', field=RESPONSE_TIMES_FIELD, percents=percents, hdr=PERCENTILES_HDR) \
     .metric('requests_count', 'sum', field="stats.num_requests") \
     .metric('max_time', 'max', field="stats.max_response_time") \
-    .metric('avg_time', 'avg', field="stats.response_times") \
+    .metric('avg_time', 'avg', field=RESPONSE_TIMES_FIELD) \
     .metric('min_time', 'min', field="stats.min_response_time") \
     .metric('failures_count', 'sum', field="stats.num_failures") \
-    .metric('content_length', 'avg', field="stats.total_content_length")
+    .metric('content_length', 'avg', field="stats.total_content_length") \
+    .metric('generator_cpu', 'max', field="load_generator.cpu") \
+    .metric('generator_saturated', 'max', field="load_generator.saturated")
+
+def add_server_timing_aggs(agg: AggBase, phases=SERVER_TIMING_PHASES):
+    for phase in phases:
+        agg.metric(f'{phase}_count', 'value_count', field=f"{SERVER_TIMING_FIELD}.{phase}")
+        agg.metric(f'{phase}_average', 'avg', field=f"{SERVER_TIMING_FIELD}.{phase}")
+        agg.metric(f'{phase}_percentiles', 'percentiles', field=f"{SERVER_TIMING_FIELD}.{phase}", percents=[ 50, 95 ], hdr=PERCENTILES_HDR)
+
+    return agg
+
+def add_latency_histogram_aggs(agg: AggBase, edges):
+    # cumulative share of requests faster than every edge, counts of buckets are differences between adjacent edges
+    return agg \
+    .metric('ranks', 'percentile_ranks', field=RESPONSE_TIMES_FIELD, values=edges, hdr=PERCENTILES_HDR) \
+    .metric('requests_count', 'sum', field="stats.num_requests")
+
+def latency_buckets(minimum=1, maximum=60000, per_decade=10):
+    """
+    Returns upper edges of log-spaced latency buckets in ms, rounded to 3 significant digits.
+    """
+    count = int(np.ceil(np.log10(maximum / minimum) * per_decade)) + 1
+    edges = minimum * 10 ** (np.arange(count) / per_decade)
+    return sorted({ float(f"{edge:.3g}") for edge in edges })
 
 def add_memory_aggs(agg: AggBase):
     return agg \
-    .bucket('containers', 'terms', field="container.name") \
     .metric('minimum', 'min', field="docker.memory.usage.total") \
     .metric('average', 'avg', field="docker.memory.usage.total") \
     .metric('percentiles', 'percentiles', field="docker.memory.usage.total", percents=[50, 80, 95]) \
@@ -20,7 +61,6 @@ def add_memory_aggs(agg: AggBase):
 
 def add_cpu_aggs(agg: AggBase):
     return agg \
-    .bucket('containers', 'terms', field="container.name", size=1000) \
     .metric('minimum', 'min', field="docker.cpu.total.pct") \
     .metric('average', 'avg', field="docker.cpu.total.pct") \
     .metric('percentiles', 'percentiles', field="docker.cpu.total.pct", percents=[50, 80, 95]) \
@@ -37,12 +77,68 @@ def elastic_interval_to_seconds(interval: str):
         if any([ interval.endswith(suffix) for suffix in suffixes ]):
             return int(int(''.join(filter(str.isdigit, interval))) * multiplier)
 
-def time_bucket(agg: AggBase, start, end, interval="5s"):
+def time_source(start, interval="5s"):
     offset = int(start.timestamp() % elastic_interval_to_seconds(interval))
-    return agg.bucket("time", 'date_histogram', field="@timestamp", time_zone="Europe/Warsaw", fixed_interval=interval, offset=f"+{offset}s")
+    return { "time": { "date_histogram": { "field": "@timestamp", "time_zone": "Europe/Warsaw", "fixed_interval": interval, "offset": f"+{offset}s" } } }
+
+def terms_source(name, field):
+    return { name: { "terms": { "field": field } } }
+
+path_source = terms_source("path", "path.keyword")
+container_source = terms_source("container", "container.name")
+
+def composite_pages(search: Search, sources, add_metrics, size=PAGE_SIZE):
+    """
+    Pages through all buckets of the composite aggregation built from given sources, yielding one page of buckets at
+    a time. Unlike terms or date_histogram aggregations, results are never silently truncated.
+    """
+    after = None
+    pages = 0
+
+    while True:
+        page = search.extra(size=0)
+        composite = page.aggs.bucket("composite", "composite", sources=sources, size=size, **({ "after": after } if after else {}))
+        add_metrics(composite)
+
+        aggregation = page.execute().aggregations.composite
+        pages += 1
+
+        yield aggregation.buckets
+
+        after = getattr(aggregation, "after_key", None)
+        if after is None or len(aggregation.buckets) < size:
+            break
+
+        after = after.to_dict()
 
-def extract_percentiles(percentiles, format="{}th percentile".format):
-    return { format(int(float(percentile))): float(value) for percentile, value in percentiles.values.to_dict().items() }
+    if pages > 1:
+        print(f"Fetched {pages} pages of {size} buckets for {', '.join(name for source in sources for name in source)}", file=sys.stderr)
+
+def frame_from_pages(pages, observation):
+    # frames are built page by page, so only one page of raw buckets is kept in memory
+    frames = [ pd.DataFrame([ observation(bucket) for bucket in page ]) for page in pages ]
+    return pd.concat(frames, ignore_index=True) if len(frames) > 0 else pd.DataFrame()
+
+def bucket_time(bucket):
+    return datetime.utcfromtimestamp(bucket.key.time / 1000)
+
+def bucket_range(bucket, interval="5s"):
+    start = bucket_time(bucket)
+    return start, start + timedelta(seconds=elastic_interval_to_seconds(interval))
+
+def extract_percentiles(percentiles, format="{:g}th percentile".format):
+    return { format(float(percentile)): float(value) for percentile, value in percentiles.values.to_dict().items() }
+
+def get_latency_histogram_observation(results):
+    ranks = sorted((float(edge), rank or 0.0) for edge, rank in results.ranks.values.to_dict().items())
+    requests = results.requests_count.value
+
+    cumulative = np.array([ rank for _, rank in ranks ]) / 100 * requests
+    counts = np.diff(np.concatenate([ [ 0 ], cumulative, [ requests ] ]))
+
+    # parquet requires string column names, the last bucket contains everything slower than the last edge
+    labels = [ f"{edge:g}" for edge, _ in ranks ] + [ "inf" ]
+    return dict(zip(labels, np.clip(np.rint(counts), 0, None)))
 
 def get_request_observation(results, start, end):
     return {
@@ -53,24 +149,51 @@ def get_request_observation(results, start, end):
         "requests": int(results.requests_count.value),
         "failures": int(results.failures_count.value),
         "rps": results.requests_count.value / (end - start).total_seconds(),
-        **extract_percentiles(results.percentiles)
+        **extract_percentiles(results.percentiles),
+        "generator cpu": results.generator_cpu.value,
+        "generator saturated": bool(results.generator_saturated.value),
     }
 
-def get_resource_observation(container):
+def get_server_timing_observation(results, phases=SERVER_TIMING_PHASES):
+    # one row per phase, phases that were never reported are skipped
+    return [
+        {
+            "phase": phase,
+            "requests": int(results[f"{phase}_count"].value),
+            "average": results[f"{phase}_average"].value,
+            **extract_percentiles(results[f"{phase}_percentiles"]),
+        }
+        for phase in phases if results[f"{phase}_count"].value
+    ]
+
+def get_resource_observation(results, container):
     return {
-        "container": container.key,
-        "minimum": container.minimum.value,
-        "peak": container.peak.value,
-        "average": container.average.value,
-        **extract_percentiles(container.percentiles)
+        "container": container,
+        "minimum": results.minimum.value,
+        "peak": results.peak.value,
+        "average": results.average.value,
+        **extract_percentiles(results.percentiles)
+    }
+
+def resource_observation(bucket):
+    return get_resource_observation(bucket, bucket.key.container)
+
+def resource_time_observation(bucket):
+    return { "time": bucket_time(bucket), **resource_observation(bucket) }
+
+def request_time_observation(interval="5s", path=None):
+    return lambda bucket: {
+        "time": bucket_time(bucket),
+        "path": path or bucket.key.path,
+        **get_request_observation(bucket, *bucket_range(bucket, interval))
     }
 
-def resource_generator(aggregation):
-    for bucket in aggregation.containers.buckets:
-        yield get_resource_observation(bucket)
+def latency_histogram_time_observation(path=None):
+    return lambda bucket: {
+        "time": bucket_time(bucket),
+        "path": path or bucket.key.path,
+        **get_latency_histogram_observation(bucket)
+    }
 
-def request_generator(aggregation, start, end):
-    yield { "path": "all", **get_request_observation(aggregation, start, end) }
-    if "per_path" in aggregation:
-        for bucket in aggregation.per_path.buckets:
-            yield { "path": bucket.key, **get_request_observation(bucket, start, end) }
\ No newline at end of file
+def request_path_observation(start, end):
+    return lambda bucket: { "path": bucket.key.path, **get_request_observation(bucket, start, end) }
@@ -1,40 +1,76 @@
 from argparse import ArgumentParser
-from elasticsearch.client import Elasticsearch
 from datetime import datetime
+import pandas as pd
+
+from utils.aggs import PERCENTILES
+from utils.runs import get_run_range
+from utils.storage import open_storage
 
 def add_elastic_arg(parser: ArgumentParser):
     parser.add_argument(
         '--elasticsearch', '-e',
-        nargs='*', 
         dest='elasticsearch', 
         default="http://localhost:9200", 
-        type=lambda hosts: Elasticsearch(hosts), 
-        help="Elasticsearch host")
+        type=open_storage, 
+        help="Elasticsearch hosts (comma separated) or directory with stats written as parquet files (file://path)")
 
 def add_containers_arg(parser: ArgumentParser):
     parser.add_argument(
         '--container', '-c',
         nargs='*',
-        dest='containers', type=str, 
+        dest='containers', type=str, default=[],
         help="container name")
 
-def add_date_range_args(parser: ArgumentParser):
+def add_date_range_args(parser: ArgumentParser, optional_start=False, optional_end=False):
     parser.add_argument(
         'from',
         type=datetime.fromisoformat, 
+        nargs='?' if optional_start else None,
         help="Date of the experiment start")
 
     parser.add_argument(
         'to', 
         type=datetime.fromisoformat, 
+        nargs='?' if optional_end else None,
         help="Date of the experiment end")
 
+def add_run_arg(parser: ArgumentParser):
+    parser.add_argument(
+        '--run', '-R',
+        dest='run', type=str, default=None,
+        help="Id of the test run, dates default to the range of the run")
+
+def resolve_date_range(parser: ArgumentParser, args):
+    start, end = getattr(args, 'from'), getattr(args, 'to')
+
+    if args.run is not None and (start is None or end is None):
+        run_start, run_end = get_run_range(args.elasticsearch, args.run)
+        start, end = start or run_start, end or run_end
+
+    if start is None or end is None:
+        parser.error("the following arguments are required: from, to (or --run)")
+
+    return start, end
+
 def add_per_path_arg(parser: ArgumentParser):
     parser.add_argument(
         '--per-path', '-p', 
         dest='per_path', action='store_true',
         help="Enable per path stats")
 
+def add_percentiles_arg(parser: ArgumentParser):
+    parser.add_argument(
+        '--percentiles', '-P',
+        nargs='+',
+        dest='percentiles', type=float, default=PERCENTILES,
+        help="Latency percentiles to compute, e.g. 50 95 99 99.9")
+
+def add_server_timing_arg(parser: ArgumentParser):
+    parser.add_argument(
+        '--server-timing', '-T',
+        dest='server_timing', action='store_true',
+        help="Show durations of server side phases reported in Server-Timing header")
+
 def add_resources_args(parser: ArgumentParser):
     parser.add_argument(
         '--cpu', '-C', 
@@ -44,4 +80,44 @@ def add_resources_args(parser: ArgumentParser):
     parser.add_argument(
         '--memory', '-M',
         dest='memory', action='store_true',
-        help="Enable memory stats") 
\ No newline at end of file
+        help="Enable memory stats")
+
+def add_cache_args(parser: ArgumentParser):
+    parser.add_argument(
+        '--no-cache',
+        dest='cache', action='store_false',
+        help="Do not use local cache of query results")
+
+    parser.add_argument(
+        '--refresh',
+        dest='refresh', action='store_true',
+        help="Query elasticsearch again and refresh cached results")
+
+def add_jobs_arg(parser: ArgumentParser):
+    parser.add_argument(
+        '--jobs', '-j',
+        dest='jobs', type=int, default=8,
+        help="Maximum number of concurrent elasticsearch queries")
+
+def add_steady_state_arg(parser: ArgumentParser):
+    parser.add_argument(
+        '--steady-state', '-s',
+        dest='steady_state', action='store_true',
+        help="Skip warm-up and cool-down, use only the steady state of the test")
+
+def add_format_args(parser: ArgumentParser, formatters = {}):
+    parser.set_defaults(format=lambda df: pd.DataFrame.to_string(df, formatters=formatters))
+
+    output_format_group = parser.add_mutually_exclusive_group()
+    output_format_group.add_argument(
+        "--latex", "-l", 
+        help="Output as LaTeX table", 
+        const=lambda df: pd.DataFrame.to_latex(df, formatters=formatters), 
+        action='store_const', 
+        dest="format")
+    output_format_group.add_argument(
+        "--csv", "-c", 
+        help="Output as CSV", 
+        const=pd.DataFrame.to_csv, 
+        action='store_const', 
+        dest="format")
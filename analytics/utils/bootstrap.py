@@ -0,0 +1,39 @@
+import numpy as np
+
+def bootstrap_means(values: np.ndarray, resamples=10000, seed=None, block=1):
+    """
+    Returns means of circular moving block bootstrap resamples of the observations, all resamples are drawn at once as
+    index matrix. Per-interval observations are autocorrelated, so consecutive blocks of them are resampled instead of
+    single values - block of one observation is ordinary bootstrap.
+    """
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return np.full(resamples, np.nan)
+
+    count = len(values)
+    block = max(1, min(block, count))
+
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0, count, size=(resamples, -(-count // block)))
+    indices = ((starts[:, :, None] + np.arange(block)) % count).reshape(resamples, -1)[:, :count]
+
+    return values[indices].mean(axis=1)
+
+def block_length(interval_seconds, duration=60):
+    # blocks span the given duration, which is longer than the correlation of the intervals
+    return max(1, int(np.ceil(duration / interval_seconds)))
+
+def confidence_interval(samples: np.ndarray, confidence=0.95):
+    if np.isnan(samples).all():
+        return (np.nan, np.nan)
+
+    alpha = (1 - confidence) / 2
+    return tuple(np.nanquantile(samples, [ alpha, 1 - alpha ]))
+
+def p_value(differences: np.ndarray):
+    # two-sided bootstrap test of hypothesis that the difference is zero
+    differences = differences[~np.isnan(differences)]
+    if len(differences) == 0:
+        return np.nan
+
+    return min(1.0, 2 * min(np.mean(differences <= 0), np.mean(differences >= 0)))
@@ -0,0 +1,135 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+import pandas as pd
+from datetime import datetime, timedelta
+
+from utils.dates import now
+
+# bump when shape of the cached frames or underlying aggregations change
+CACHE_VERSION = 5
+
+# data of the range keeps arriving after its end - refresh interval of the indices during ingest, late reports of
+# the workers and period of metricbeat, so the range is considered finished only after this long
+FINISHED_AFTER = timedelta(minutes=5)
+
+DEFAULT_CACHE_DIR  = os.getenv("ANALYTICS_CACHE_DIR", os.path.join(os.path.dirname(__file__), "..", ".cache"))
+DEFAULT_CACHE_SIZE = int(os.getenv("ANALYTICS_CACHE_SIZE", str(512 * 1024 * 1024)))
+
+class ResultCache:
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_SIZE, enabled=True, refresh=False):
+        self.directory = directory
+        self.max_size = max_size
+        self.enabled = enabled
+        self.refresh = refresh
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.parquet")
+
+    def get(self, key):
+        if not self.enabled or self.refresh:
+            return None
+
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+
+        # mtime is used as last access time for eviction
+        os.utime(path)
+        return pd.read_parquet(path)
+
+    def put(self, key, df: pd.DataFrame):
+        if not self.enabled:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        # unique temporary file, as the same query could be computed by multiple threads at once
+        path = self.path(key)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        df.to_parquet(temporary)
+        os.replace(temporary, path)
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.name.endswith(".parquet"):
+                    entries.append((entry.path, entry.stat()))
+            except FileNotFoundError:
+                pass
+
+        entries.sort(key=lambda entry: entry[1].st_mtime, reverse=True)
+
+        total = 0
+        for path, stat in entries:
+            total += stat.st_size
+            if total > self.max_size:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+cache = ResultCache()
+
+def configure(enabled=True, refresh=False, directory=None, max_size=None):
+    cache.enabled = enabled
+    cache.refresh = refresh
+    cache.directory = directory or cache.directory
+    cache.max_size = max_size or cache.max_size
+
+def serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    # elasticsearch_dsl queries
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+
+    raise TypeError(f"Cannot use {type(value).__name__} as part of cache key")
+
+def query_key(name, arguments):
+    payload = json.dumps([ CACHE_VERSION, name, arguments ], sort_keys=True, default=serialize)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def is_finished(end):
+    # results for ranges that are still running may change, so they are never cached
+    return end is not None and end + FINISHED_AFTER < now(end)
+
+def cached(function=None, finished=None):
+    """
+    Caches frames returned by the query function for finished time ranges (end argument older than FINISHED_AFTER). Functions
+    without the time range pass finished predicate, which decides from the result whether it can change later.
+    """
+    if function is None:
+        return functools.partial(cached, finished=finished)
+
+    signature = inspect.signature(function)
+
+    @functools.wraps(function)
+    def wrapper(elasticsearch, *args, **kwargs):
+        bound = signature.bind(elasticsearch, *args, **kwargs)
+        bound.apply_defaults()
+
+        arguments = { name: value for name, value in bound.arguments.items() if name != "elasticsearch" }
+        # results of elasticsearch and file storage (see utils/storage.py) are cached separately
+        arguments["storage"] = getattr(elasticsearch, "cache_key", None)
+        if not cache.enabled or (finished is None and not is_finished(arguments.get("end"))):
+            return function(elasticsearch, *args, **kwargs)
+
+        key = query_key(function.__name__, arguments)
+
+        df = cache.get(key)
+        if df is None:
+            df = function(elasticsearch, *args, **kwargs)
+            if finished is None or finished(df):
+                cache.put(key, df)
+
+        return df
+
+    return wrapper
@@ -0,0 +1,15 @@
+import pandas as pd
+from datetime import datetime, timezone
+
+# naive dates are sent to elasticsearch as they are and therefore interpreted as UTC
+
+def now(reference=None):
+    if reference is None or reference.tzinfo is None:
+        return datetime.now(timezone.utc).replace(tzinfo=None)
+
+    return datetime.now(reference.tzinfo)
+
+def to_timezone(time, reference):
+    # buckets are naive UTC, same as naive dates passed to queries
+    time = pd.Timestamp(time).to_pydatetime()
+    return time.replace(tzinfo=timezone.utc).astimezone(reference.tzinfo) if reference.tzinfo else time
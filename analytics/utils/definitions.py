@@ -0,0 +1,9 @@
+from yaml import load
+try:
+    from yaml import CLoader as Loader
+except ImportError:
+    from yaml import Loader
+
+def load_definitions(path):
+    with open(path) as file:
+        return load(file, Loader=Loader)
@@ -0,0 +1,245 @@
+import os
+import json
+import base64
+import mmap
+import zlib
+import shutil
+import struct
+import hashlib
+import numpy as np
+import pandas as pd
+from elasticsearch import helpers
+
+from utils.cache import cache
+
+# format of batches written by EventLog in locust/locustfile.py - header with number of events and size of the
+# compressed payload, payload contains columns one after another followed by JSON table of [method, path] pairs
+HEADER = struct.Struct("<II")
+COLUMNS = [
+    ("timestamp", "<f8"),
+    ("response_time", "<f4"),
+    ("status", "<u2"),
+    ("content_length", "<u4"),
+    ("request", "<u4"),
+]
+
+def event_index(run_id):
+    # indexed by locust master with LOCUST_EVENT_LOG=elasticsearch, every document holds one base64 encoded batch
+    return f"request-events-{run_id.lower()}"
+
+def find_event_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".events")))
+        else:
+            files.append(path)
+
+    return files
+
+def decode_batch(payload, count):
+    columns, position = {}, 0
+    for name, dtype in COLUMNS:
+        columns[name] = np.frombuffer(payload, dtype=dtype, count=count, offset=position)
+        position += count * np.dtype(dtype).itemsize
+
+    return count, columns, json.loads(payload[position:])
+
+def read_batches(path):
+    """
+    Yields number of events, columns and request table of every batch in the file. File is memory mapped, so batches
+    are decompressed straight from the page cache. Incomplete batch at the end of the file (still being written) is
+    skipped.
+    """
+    if os.path.getsize(path) == 0:
+        return
+
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        offset = 0
+        while offset + HEADER.size <= len(data):
+            count, size = HEADER.unpack_from(data, offset)
+            offset += HEADER.size
+
+            if offset + size > len(data):
+                break
+
+            payload = zlib.decompress(data[offset:offset + size])
+            offset += size
+
+            yield decode_batch(payload, count)
+
+def read_stored_batches(elasticsearch, run_id):
+    """
+    Yields batches of the run stored in elasticsearch, in the same form as read_batches.
+    """
+    for hit in helpers.scan(elasticsearch, index=event_index(run_id), query={ "_source": [ "events" ] }):
+        batch = base64.b64decode(hit["_source"]["events"])
+        count, size = HEADER.unpack_from(batch)
+
+        yield decode_batch(zlib.decompress(batch[HEADER.size:HEADER.size + size]), count)
+
+def read_events(batches):
+    """
+    Reads all batches into memory, returns columns and request table shared by all of them. Batches is a function
+    returning iterable of batches, e.g. of read_batches.
+    """
+    chunks, known = { name: [] for name, _ in COLUMNS }, {}
+
+    for count, columns, requests in batches():
+        mapping = np.array([ known.setdefault(tuple(request), len(known)) for request in requests ], dtype=np.uint32)
+        for name, _ in COLUMNS:
+            chunks[name].append(mapping[columns[name]] if name == "request" else columns[name])
+
+    table = sorted(known, key=known.get)
+    columns = { name: np.concatenate(chunks[name]) if chunks[name] else np.empty(0, dtype=dtype) for name, dtype in COLUMNS }
+
+    return columns, table
+
+def unpack_events(batches, directory):
+    """
+    Converts batches into one .npy file per column and requests.json table, batches are written directly into the
+    memory mapped columns, so the conversion needs memory only for one batch. Batches are read twice - to count the
+    events first.
+    """
+    total = sum(count for count, _, _ in batches())
+
+    temporary = f"{directory}.{os.getpid()}.tmp"
+    os.makedirs(temporary, exist_ok=True)
+
+    outputs = {
+        name: np.lib.format.open_memmap(os.path.join(temporary, f"{name}.npy"), mode="w+", dtype=dtype, shape=(total,))
+        for name, dtype in COLUMNS
+    }
+
+    position, known = 0, {}
+    for count, columns, requests in batches():
+        mapping = np.array([ known.setdefault(tuple(request), len(known)) for request in requests ], dtype=np.uint32)
+        for name, _ in COLUMNS:
+            outputs[name][position:position + count] = mapping[columns[name]] if name == "request" else columns[name]
+
+        position += count
+
+    for output in outputs.values():
+        output.flush()
+
+    with open(os.path.join(temporary, "requests.json"), "w") as file:
+        json.dump(sorted(known, key=known.get), file)
+
+    os.replace(temporary, directory)
+
+def unpacked_columns(key, batches):
+    """
+    Returns memory mapped columns and request table of the batches unpacked into the cache directory under given key.
+    Without cache all events are read into memory.
+    """
+    if not cache.enabled:
+        return read_events(batches)
+
+    directory = os.path.join(cache.directory, "events", hashlib.sha256(json.dumps(key).encode()).hexdigest())
+
+    if cache.refresh or not os.path.exists(directory):
+        os.makedirs(os.path.dirname(directory), exist_ok=True)
+        shutil.rmtree(directory, ignore_errors=True)
+
+        unpack_events(batches, directory)
+
+    columns = { name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name, _ in COLUMNS }
+    with open(os.path.join(directory, "requests.json")) as file:
+        table = [ tuple(request) for request in json.load(file) ]
+
+    return columns, table
+
+def load_event_columns(paths):
+    """
+    Returns columns and request table of all events in the files (or directories with .events files), keyed in the
+    cache by paths, sizes and modification times of the files.
+    """
+    files = find_event_files(paths)
+    key = [ (os.path.abspath(path), os.path.getsize(path), os.path.getmtime(path)) for path in files ]
+
+    return unpacked_columns(key, lambda: (batch for path in files for batch in read_batches(path)))
+
+def load_stored_event_columns(elasticsearch, run_id):
+    """
+    Returns columns and request table of all events of the run stored in elasticsearch, keyed in the cache by the run
+    and number of stored batches.
+    """
+    elasticsearch.indices.refresh(index=event_index(run_id))
+    key = [ event_index(run_id), elasticsearch.count(index=event_index(run_id))["count"] ]
+
+    return unpacked_columns(key, lambda: read_stored_batches(elasticsearch, run_id))
+
+def events_frame(columns, table):
+    """
+    Returns events as dataframe with time (naive UTC, same as time series queried from elasticsearch), method, path,
+    response time in ms, status code (0 if request failed without response) and content length.
+    """
+    methods = pd.Categorical([ method for method, _ in table ])
+    paths = pd.Categorical([ path for _, path in table ])
+    requests = columns["request"].astype(np.int64)
+
+    return pd.DataFrame({
+        "time": pd.to_datetime(columns["timestamp"], unit="s"),
+        "method": pd.Categorical.from_codes(methods.codes[requests], methods.categories) if table else pd.Categorical([]),
+        "path": pd.Categorical.from_codes(paths.codes[requests], paths.categories) if table else pd.Categorical([]),
+        "response_time": columns["response_time"],
+        "status": columns["status"],
+        "content_length": columns["content_length"],
+    })
+
+def load_events(paths):
+    return events_frame(*load_event_columns(paths))
+
+def load_stored_events(elasticsearch, run_id):
+    return events_frame(*load_stored_event_columns(elasticsearch, run_id))
+
+def is_failure(df: pd.DataFrame):
+    return (df["status"] == 0) | (df["status"] >= 400)
+
+def get_exact_stats(df: pd.DataFrame, percents, duration=None):
+    """
+    Returns number of requests, failures, rps and exact percentiles of response time.
+    """
+    if duration is None:
+        duration = max((df["time"].max() - df["time"].min()).total_seconds(), 1) if len(df) else 1
+
+    times = df["response_time"].to_numpy()
+
+    return {
+        "requests": len(df),
+        "failures": int(is_failure(df).sum()),
+        "rps": len(df) / duration,
+        "average": times.mean() if len(times) else np.nan,
+        "max": times.max() if len(times) else np.nan,
+        **{
+            f"{percent:g}th percentile": value
+            for percent, value in zip(percents, np.percentile(times, percents) if len(times) else [ np.nan ] * len(percents))
+        },
+    }
+
+def get_event_stats(df: pd.DataFrame, percents, per_path=False):
+    duration = max((df["time"].max() - df["time"].min()).total_seconds(), 1) if len(df) else 1
+    rows = { "all": get_exact_stats(df, percents, duration) }
+
+    if per_path:
+        for path, group in df.groupby("path", observed=True):
+            rows[path] = get_exact_stats(group, percents, duration)
+
+    return pd.DataFrame.from_dict(rows, orient="index")
+
+def get_event_time_series(df: pd.DataFrame, percents, interval="5s", start=None):
+    """
+    Returns exact stats of every interval, intervals are aligned to the start (the first event by default) in the same
+    way as time series queried from elasticsearch, so both can be correlated.
+    """
+    step = pd.Timedelta(interval)
+    start = pd.Timestamp(start) if start is not None else df["time"].min()
+    df = df.assign(time=start + (df["time"] - start) // step * step)
+    seconds = step.total_seconds()
+
+    rows = [
+        { "time": time, **get_exact_stats(group, percents, seconds) }
+        for time, group in df.groupby("time")
+    ]
+
+    return pd.DataFrame(rows, columns=[ "time", *get_exact_stats(df.iloc[:0], percents) ])
@@ -1,6 +1,11 @@
+import os
 from elasticsearch_dsl import Q
 from functools import partial
 
+# samples of the sampler service, metricbeat writes the same fields into metricbeat-7* indices every 5 seconds - both
+# must not be mixed in one aggregation, as averages and percentiles would be skewed towards the denser samples
+RESOURCE_INDEX = os.getenv("ANALYTICS_RESOURCE_INDEX", "metricbeat-sampler*")
+
 def time_query(start, end):
     return Q("range", **{'@timestamp': { 
         'gte': start.isoformat(),
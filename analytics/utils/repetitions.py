@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+# relative deviation from the median of other repetitions above which repetition is considered an outlier
+OUTLIER_THRESHOLD = 0.15
+
+def suite_repetitions(suite):
+    """
+    Returns list of repetitions of the suite, every repetition inherits all fields (name, containers, ...) of the suite.
+    Suites without repetitions are treated as a single repetition.
+    """
+    if "repetitions" not in suite:
+        return [ suite ]
+
+    common = { key: value for key, value in suite.items() if key != "repetitions" }
+    return [ { **common, **repetition } for repetition in suite["repetitions"] ]
+
+def get_variation(df: pd.DataFrame, columns):
+    """
+    Returns mean, standard deviation and coefficient of variation of columns across the rows (repetitions) of df.
+    """
+    values = df[columns].to_numpy(dtype=float)
+    mean = np.nanmean(values, axis=0)
+    std = np.nanstd(values, axis=0, ddof=1) if len(values) > 1 else np.full(len(columns), np.nan)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cv = np.where(mean != 0, std / mean, np.nan)
+
+    return pd.DataFrame({ "mean": mean, "std": std, "cv": cv, "min": np.nanmin(values, axis=0), "max": np.nanmax(values, axis=0) }, index=columns)
+
+def find_outliers(values: np.ndarray, threshold=OUTLIER_THRESHOLD):
+    """
+    Returns mask of values that deviate by more than threshold from the median of all values. With less than three
+    repetitions there is no majority to compare against, so nothing is flagged.
+    """
+    if len(values) < 3:
+        return np.zeros(len(values), dtype=bool)
+
+    median = np.nanmedian(values)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        deviations = np.abs(values - median) / abs(median)
+
+    return np.nan_to_num(deviations, nan=0.0) > threshold
@@ -0,0 +1,62 @@
+import pandas as pd
+from datetime import datetime
+from elasticsearch_dsl import Search, Q
+
+from utils.cache import cached, FINISHED_AFTER
+from utils.dates import now
+from utils.storage import is_file_storage, get_file_run_range
+
+DEFAULT_INDEX = "locust*"
+
+def run_index(run_id):
+    return f"locust-{run_id.lower()}" if run_id else DEFAULT_INDEX
+
+# run without new stats for FINISHED_AFTER is considered finished, locust reports every 3 seconds
+def is_run_finished(df: pd.DataFrame):
+    return not df.empty and df["end"].iloc[0] + FINISHED_AFTER < now()
+
+@cached(finished=is_run_finished)
+def get_run_frame(elasticsearch, run_id):
+    if is_file_storage(elasticsearch):
+        run_range = get_file_run_range(elasticsearch, run_index(run_id))
+    else:
+        search = Search(using=elasticsearch, index=run_index(run_id)).extra(size=0)
+        search.aggs.metric("start", "min", field="@timestamp")
+        search.aggs.metric("end", "max", field="@timestamp")
+
+        response = search.execute()
+
+        # naive UTC, same as other dates sent to elasticsearch
+        run_range = (
+            datetime.utcfromtimestamp(response.aggregations.start.value / 1000),
+            datetime.utcfromtimestamp(response.aggregations.end.value / 1000),
+        ) if response.aggregations.start.value is not None else None
+
+    return pd.DataFrame([ run_range ] if run_range else [], columns=[ "start", "end" ])
+
+def get_run_range(elasticsearch, run_id):
+    df = get_run_frame(elasticsearch, run_id)
+    if df.empty:
+        raise ValueError(f"There are no stats for run {run_id}")
+
+    return df["start"].iloc[0].to_pydatetime(), df["end"].iloc[0].to_pydatetime()
+
+def resolve_suite(elasticsearch, suite):
+    """
+    Returns time range and index of the suite, which is defined either by the run id or by the time range.
+    """
+    if "run" in suite:
+        start, end = get_run_range(elasticsearch, suite["run"])
+        return suite.get("from", start), suite.get("to", end), run_index(suite["run"])
+
+    return suite["from"], suite["to"], DEFAULT_INDEX
+
+def suite_filter(suite):
+    """
+    Returns query selecting only requests sent with the connection policy of the suite, or None if suite does not
+    specify the policy.
+    """
+    if "connection" not in suite:
+        return None
+
+    return Q("term", **{ "connection.policy": suite["connection"] })
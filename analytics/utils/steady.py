@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+
+from utils.aggs import elastic_interval_to_seconds
+from utils.dates import to_timezone
+
+def mser(values: np.ndarray, max_fraction=0.5):
+    """
+    Marginal Standard Error Rule - returns number of leading observations that should be truncated, so that the mean
+    of the remaining ones has the smallest standard error.
+    """
+    n = len(values)
+    if n < 2:
+        return 0
+
+    # cumulative sums over reversed values give statistics of every suffix values[d:] at once
+    reversed_values = values[::-1]
+    counts = np.arange(1, n + 1)
+    sums = np.cumsum(reversed_values)
+    squares = np.cumsum(reversed_values ** 2)
+
+    deviations = squares - sums ** 2 / counts
+    errors = (deviations / counts ** 2)[::-1]
+
+    return int(np.argmin(errors[:max(1, int(n * max_fraction))]))
+
+def find_steady_state(df: pd.DataFrame, start, end, interval="5s", columns=["rps", "95th percentile"]):
+    """
+    Finds stable sub-window of the request time series (as returned by get_request_time_series) by truncating warm-up
+    at the beginning and cool-down at the end of every metric in columns.
+    """
+    series = df.xs("all", level="path").sort_index()
+    values = series[columns].fillna(0).to_numpy(dtype=float)
+
+    if len(values) < 2:
+        return start, end
+
+    first = max(mser(values[:, column]) for column in range(values.shape[1]))
+    last = len(values) - max(mser(values[::-1, column]) for column in range(values.shape[1]))
+
+    if last <= first:
+        return start, end
+
+    times = series["time"].to_numpy()
+    steady_start = to_timezone(times[first], start) if first > 0 else start
+    steady_end = to_timezone(times[last - 1], end) + timedelta(seconds=elastic_interval_to_seconds(interval)) if last < len(values) else end
+
+    return max(start, steady_start), min(end, steady_end)
@@ -0,0 +1,355 @@
+import os
+import glob
+import fnmatch
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from elasticsearch import Elasticsearch
+from elasticsearch_dsl import Q
+
+from utils.aggs import RESPONSE_TIMES_FIELD, SERVER_TIMING_FIELD, SERVER_TIMING_PHASES, PERCENTILES, elastic_interval_to_seconds
+from utils.queries import time_query, RESOURCE_INDEX
+
+class FileStorage:
+    """
+    Stats written without elasticsearch - by locust master with LOCUST_STORAGE and by sampler with SAMPLER_OUTPUT set
+    to a directory. Every index is a subdirectory with append-only parquet parts, fields of the documents are
+    flattened into columns named by their dotted path (e.g. stats.num_requests), histograms into .values and .counts
+    list columns. Functions of stats.py and times.py compute the same frames from it as from elasticsearch.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    @property
+    def cache_key(self):
+        return os.path.abspath(self.directory)
+
+    def parts(self, index):
+        # index can be comma separated list of patterns, same as in elasticsearch
+        patterns = index.split(",")
+        names = sorted(os.listdir(self.directory)) if os.path.isdir(self.directory) else []
+
+        return [
+            path
+            for name in names if any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+            for path in sorted(glob.glob(os.path.join(self.directory, name, "*.parquet")))
+        ]
+
+    def read(self, index):
+        return concat_tables([ pq.read_table(path) for path in self.parts(index) ])
+
+def open_storage(location):
+    """
+    Returns FileStorage for file:// urls and existing directories, elasticsearch client for (comma separated) hosts.
+    """
+    if location.startswith("file://"):
+        return FileStorage(location[len("file://"):])
+
+    if os.path.isdir(location):
+        return FileStorage(location)
+
+    return Elasticsearch(location.split(","))
+
+def is_file_storage(storage):
+    return isinstance(storage, FileStorage)
+
+def promote(current, other):
+    if current is None or pa.types.is_null(current):
+        return other
+
+    if pa.types.is_null(other) or current == other:
+        return current
+
+    numeric = lambda type: pa.types.is_integer(type) or pa.types.is_floating(type)
+    return pa.float64() if numeric(current) and numeric(other) else current
+
+def concat_tables(tables):
+    # parts differ in columns (e.g. server timing phases) and types (e.g. int and float times), missing columns are null
+    types = {}
+    for table in tables:
+        for field in table.schema:
+            types[field.name] = promote(types.get(field.name), field.type)
+
+    schema = pa.schema(list(types.items()))
+    unified = [
+        pa.Table.from_arrays([
+            table.column(name).cast(type) if name in table.column_names else pa.nulls(table.num_rows, type)
+            for name, type in types.items()
+        ], schema=schema)
+        for table in tables
+    ]
+
+    return pa.concat_tables(unified) if unified else pa.table({})
+
+def flatten_lists(column: pa.ChunkedArray):
+    """
+    Returns all values of the list column and number of the row every value belongs to.
+    """
+    values, rows, base = [], [], 0
+    for chunk in column.chunks:
+        lengths = np.diff(np.asarray(chunk.offsets))
+        values.append(np.asarray(chunk.flatten(), dtype=float))
+        rows.append(np.repeat(np.arange(base, base + len(chunk)), lengths))
+        base += len(chunk)
+
+    return (np.concatenate(values), np.concatenate(rows)) if values else (np.empty(0), np.empty(0, dtype=int))
+
+def to_naive_utc(value):
+    value = pd.Timestamp(value)
+    return value.tz_convert("UTC").tz_localize(None) if value.tzinfo else value
+
+def query_mask(df: pd.DataFrame, query):
+    """
+    Evaluates elasticsearch query (range, term, terms, exists, bool and match_all clauses) over the flattened documents.
+    """
+    kind, body = next(iter(query.items()))
+    missing = pd.Series(False, index=df.index)
+
+    if kind == "match_all":
+        return pd.Series(True, index=df.index)
+
+    if kind == "bool":
+        mask = pd.Series(True, index=df.index)
+        for clause in [ *body.get("must", []), *body.get("filter", []) ]:
+            mask &= query_mask(df, clause)
+        for clause in body.get("must_not", []):
+            mask &= ~query_mask(df, clause)
+        if body.get("should"):
+            should = missing.copy()
+            for clause in body["should"]:
+                should |= query_mask(df, clause)
+            mask &= should
+
+        return mask
+
+    if kind == "exists":
+        columns = [ column for column in df.columns if column == body["field"] or column.startswith(f"{body['field']}.") ]
+        return df[columns].notna().any(axis=1) if columns else missing
+
+    field, condition = next(iter(body.items()))
+    if field not in df:
+        return missing
+
+    column = df[field]
+    if kind == "term":
+        return column == (condition["value"] if isinstance(condition, dict) else condition)
+
+    if kind == "terms":
+        return column.isin(condition)
+
+    if kind == "range":
+        convert = to_naive_utc if field == "@timestamp" else lambda value: value
+        mask = pd.Series(True, index=df.index)
+        for operator, compare in [ ("gte", column.ge), ("gt", column.gt), ("lte", column.le), ("lt", column.lt) ]:
+            if operator in condition:
+                mask &= compare(convert(condition[operator]))
+
+        return mask
+
+    raise ValueError(f"Query {kind} is not supported by file storage")
+
+def read_documents(storage: FileStorage, index, query, histograms=[]):
+    """
+    Returns scalar fields of documents matching the query as dataframe, and values, counts and row numbers (in the
+    dataframe) of every requested histogram field.
+    """
+    table = storage.read(index)
+    if table.num_rows == 0:
+        return pd.DataFrame(), { field: (np.empty(0), np.empty(0), np.empty(0, dtype=int)) for field in histograms }
+
+    lists = [ field.name for field in table.schema if pa.types.is_list(field.type) ]
+    df = table.drop(lists).to_pandas()
+    df["@timestamp"] = pd.to_datetime(df["@timestamp"])
+
+    mask = query_mask(df, query.to_dict()).to_numpy()
+    positions = np.cumsum(mask) - 1
+
+    result = {}
+    for field in histograms:
+        if f"{field}.values" not in table.column_names:
+            result[field] = (np.empty(0), np.empty(0), np.empty(0, dtype=int))
+            continue
+
+        values, rows = flatten_lists(table.column(f"{field}.values"))
+        counts, _ = flatten_lists(table.column(f"{field}.counts"))
+        keep = mask[rows]
+        result[field] = (values[keep], counts[keep], positions[rows[keep]])
+
+    return df[mask].reset_index(drop=True), result
+
+def group_documents(df: pd.DataFrame, start, by=[], interval="5s"):
+    """
+    Returns group number of every document and frame with keys of the groups. Time buckets are aligned to the start
+    rounded down to whole seconds, same as buckets of time_source.
+    """
+    keys = {}
+    if "time" in by:
+        step = pd.Timedelta(seconds=elastic_interval_to_seconds(interval))
+        origin = to_naive_utc(start).floor("s")
+        keys["time"] = origin + (df["@timestamp"] - origin) // step * step
+    for key, field in [ ("path", "path"), ("container", "container.name") ]:
+        if key in by:
+            keys[key] = df[field]
+
+    if not keys:
+        return np.zeros(len(df), dtype=int), pd.DataFrame(index=[ 0 ])
+
+    frame = pd.DataFrame(keys)
+    codes = frame.groupby(list(keys), sort=True).ngroup().to_numpy()
+    groups = frame.drop_duplicates().sort_values(list(keys)).reset_index(drop=True)
+
+    return codes, groups
+
+def histogram_stats(values, counts, codes, size, percents):
+    """
+    Returns totals, averages and percentiles of histograms merged per group. Percentile is the lowest value with
+    cumulative count reaching given fraction of the total, as in locust.
+    """
+    totals = np.bincount(codes, weights=counts, minlength=size)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        averages = np.bincount(codes, weights=values * counts, minlength=size) / totals
+
+    order = np.lexsort((values, codes))
+    values, counts, codes = values[order], counts[order], codes[order]
+    cumulative = np.cumsum(counts)
+
+    # groups are contiguous after sorting, so percentiles of all groups are found by one search in global cumulative sum
+    starts = np.searchsorted(codes, np.arange(size))
+    ends = np.searchsorted(codes, np.arange(size), side="right") - 1
+    before = np.concatenate([ [ 0 ], cumulative ])[starts]
+
+    percentiles = {}
+    for percent in percents:
+        if len(values) == 0:
+            percentiles[percent] = np.full(size, np.nan)
+            continue
+
+        positions = np.searchsorted(cumulative, before + totals * percent / 100, side="left")
+        positions = np.clip(np.clip(positions, starts, ends), 0, len(values) - 1)
+        percentiles[percent] = np.where(totals > 0, values[positions], np.nan)
+
+    return totals, averages, percentiles
+
+def aggregate(grouped, df, field, how, size):
+    if field not in df:
+        return pd.Series(np.nan, index=range(size))
+
+    return grouped[field].agg(how).reindex(range(size))
+
+def get_request_frame(storage, start, end, additional_filter=None, index="locust*", by=[], interval="5s", percents=PERCENTILES):
+    """
+    Returns the same observations as get_request_observation for every group of documents (time bucket, path).
+    """
+    query = time_query(start, end) & additional_filter if additional_filter is not None else time_query(start, end)
+    df, histograms = read_documents(storage, index, query, [ RESPONSE_TIMES_FIELD ])
+
+    if df.empty:
+        if by:
+            return pd.DataFrame()
+        df = pd.DataFrame({ "@timestamp": pd.Series([], dtype="datetime64[ns]") })
+
+    codes, groups = group_documents(df, start, by, interval)
+    size, grouped = len(groups), df.groupby(codes)
+
+    values, counts, rows = histograms[RESPONSE_TIMES_FIELD]
+    _, averages, percentiles = histogram_stats(values, counts, codes[rows], size, percents)
+
+    requests = aggregate(grouped, df, "stats.num_requests", "sum", size).fillna(0)
+    duration = elastic_interval_to_seconds(interval) if "time" in by else (end - start).total_seconds()
+
+    observations = pd.DataFrame({
+        "minimum": aggregate(grouped, df, "stats.min_response_time", "min", size),
+        "average": averages,
+        "maximum": aggregate(grouped, df, "stats.max_response_time", "max", size),
+        "content length": aggregate(grouped, df, "stats.total_content_length", "mean", size),
+        "requests": requests.astype(int),
+        "failures": aggregate(grouped, df, "stats.num_failures", "sum", size).fillna(0).astype(int),
+        "rps": requests / duration,
+        **{ f"{float(percent):g}th percentile": percentiles[percent] for percent in percents },
+        "generator cpu": aggregate(grouped, df, "load_generator.cpu", "max", size),
+        "generator saturated": aggregate(grouped, df, "load_generator.saturated", "max", size).fillna(0).astype(bool),
+    })
+
+    return pd.concat([ groups, observations ], axis=1)
+
+def get_server_timing_frame(storage, start, end, additional_filter=None, index="locust*", by=[], phases=SERVER_TIMING_PHASES):
+    query = time_query(start, end) & additional_filter if additional_filter is not None else time_query(start, end)
+    fields = [ f"{SERVER_TIMING_FIELD}.{phase}" for phase in phases ]
+    df, histograms = read_documents(storage, index, query, fields)
+
+    if df.empty:
+        return pd.DataFrame()
+
+    codes, groups = group_documents(df, start, by)
+
+    rows = []
+    for phase, field in zip(phases, fields):
+        values, counts, positions = histograms[field]
+        totals, averages, percentiles = histogram_stats(values, counts, codes[positions], len(groups), [ 50, 95 ])
+
+        for group, total in enumerate(totals):
+            if total > 0:
+                rows.append({
+                    **groups.iloc[group].to_dict(),
+                    "phase": phase,
+                    "requests": int(total),
+                    "average": averages[group],
+                    "50th percentile": percentiles[50][group],
+                    "95th percentile": percentiles[95][group],
+                })
+
+    return pd.DataFrame(rows)
+
+def get_latency_histogram_frame(storage, start, end, additional_filter=None, index="locust*", by=[], interval="5s", edges=[]):
+    """
+    Returns the same observations as get_latency_histogram_observation for every group of documents.
+    """
+    query = time_query(start, end) & additional_filter if additional_filter is not None else time_query(start, end)
+    df, histograms = read_documents(storage, index, query, [ RESPONSE_TIMES_FIELD ])
+
+    if df.empty:
+        return pd.DataFrame()
+
+    codes, groups = group_documents(df, start, by, interval)
+    values, counts, rows = histograms[RESPONSE_TIMES_FIELD]
+
+    # bucket is named by its upper (inclusive) edge, the last bucket contains everything slower than the last edge
+    buckets = np.searchsorted(edges, values, side="left")
+    matrix = np.bincount(codes[rows] * (len(edges) + 1) + buckets, weights=counts, minlength=len(groups) * (len(edges) + 1))
+
+    labels = [ f"{edge:g}" for edge in edges ] + [ "inf" ]
+    return pd.concat([ groups, pd.DataFrame(matrix.reshape(len(groups), len(edges) + 1), columns=labels) ], axis=1)
+
+RESOURCE_FIELDS = {
+    "memory": ("docker.memory.usage.total", "docker.memory.usage.max"),
+    "cpu": ("docker.cpu.total.pct", "docker.cpu.total.pct"),
+}
+
+def get_resource_frame(storage, resource, query, start, by=[ "container" ], interval="5s", index=RESOURCE_INDEX):
+    """
+    Returns the same observations as get_resource_observation for every group of documents (time bucket, container).
+    """
+    df, _ = read_documents(storage, index, query)
+    if df.empty:
+        return pd.DataFrame()
+
+    field, peak_field = RESOURCE_FIELDS[resource]
+    codes, groups = group_documents(df, start, by, interval)
+    size, grouped = len(groups), df.groupby(codes)
+
+    observations = pd.DataFrame({
+        "minimum": aggregate(grouped, df, field, "min", size),
+        "peak": aggregate(grouped, df, peak_field, "max", size),
+        "average": aggregate(grouped, df, field, "mean", size),
+        **{ f"{percent}th percentile": aggregate(grouped, df, field, lambda values: values.quantile(percent / 100), size) for percent in [ 50, 80, 95 ] },
+    })
+
+    return pd.concat([ groups, observations ], axis=1)
+
+def get_file_run_range(storage, index):
+    df, _ = read_documents(storage, index, Q("match_all"))
+    if df.empty:
+        return None
+
+    return df["@timestamp"].min().to_pydatetime(), df["@timestamp"].max().to_pydatetime()
@@ -0,0 +1,288 @@
+import json
+import fnmatch
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from elasticsearch_dsl import Q
+
+from utils.aggs import RESPONSE_TIMES_FIELD, SERVER_TIMING_FIELD, elastic_interval_to_seconds
+from utils.storage import FileStorage, concat_tables, read_documents, histogram_stats
+
+def locust_round(times):
+    # locust keeps response times below 100ms exact, then rounds to 2 and above 1000ms to 3 significant digits
+    return np.where(times < 100, np.round(times), np.where(times < 1000, np.round(times, -1), np.round(times, -2)))
+
+def list_array(values, offsets, type):
+    return pa.ListArray.from_arrays(pa.array(offsets, pa.int32()), pa.array(values, type))
+
+def generate_requests(start, duration, run_id="bench", paths=20, workers=3, rps=300, report_interval=3, seed=0):
+    """
+    Returns table of locust stats documents in the layout of LOCUST_STORAGE - one document per worker, path and
+    report interval. Paths have zipf distributed popularity and their own median latency, response times are log-normal
+    and elevated during the first tenth of the run to simulate warm-up.
+    """
+    rng = np.random.default_rng(seed)
+    start_ms = int(pd.Timestamp(start).timestamp() * 1000)
+
+    reports = int(duration // report_interval)
+    count = reports * paths * workers
+    report = np.repeat(np.arange(reports), paths * workers)
+    path = np.tile(np.repeat(np.arange(paths), workers), reports)
+    worker = np.tile(np.arange(workers), reports * paths)
+
+    popularity = 1 / np.arange(1, paths + 1)
+    medians = rng.lognormal(np.log(30), 0.8, paths)
+    requests = rng.poisson(rps * report_interval / workers * popularity[path] / popularity.sum())
+
+    # every sampled request belongs to one document, sampled values are then folded into per document histograms
+    documents = np.repeat(np.arange(count), requests)
+    elapsed = report[documents] * report_interval
+    warmup = 1 + 2 * np.exp(-elapsed / (0.1 * duration / 3))
+    times = locust_round(rng.lognormal(np.log(medians[path[documents]] * warmup), 0.5))
+
+    order = np.lexsort((times, documents))
+    documents, times = documents[order], times[order]
+    first = np.concatenate([ [ True ], (documents[1:] != documents[:-1]) | (times[1:] != times[:-1]) ])
+    starts = np.flatnonzero(first)
+    values = times[starts]
+    counts = np.diff(np.concatenate([ starts, [ len(times) ] ]))
+    offsets = np.searchsorted(documents[starts], np.arange(count + 1))
+
+    has_requests = requests > 0
+    bounds = np.searchsorted(documents, np.arange(count + 1))
+    minimum = np.full(count, np.nan)
+    maximum = np.full(count, np.nan)
+    minimum[has_requests] = times[bounds[:-1][has_requests]]
+    maximum[has_requests] = times[bounds[1:][has_requests] - 1]
+    total_time = np.bincount(documents, weights=times, minlength=count)
+
+    table = pa.table({
+        "@timestamp": pa.array(start_ms + report * report_interval * 1000 + rng.integers(0, 1000, count), pa.timestamp("ms")),
+        "client_id": pa.array([ f"worker-{number}" for number in worker ]),
+        "method": pa.array(np.full(count, "GET")),
+        "path": pa.array([ f"/en/blog/posts/post-{number}" for number in path ]),
+        "host": pa.array(np.full(count, "http://frontend-rr:8080")),
+        "run_id": pa.array(np.full(count, run_id)),
+        "load_generator.cpu": pa.array(rng.uniform(0.2, 0.6, count)),
+        "load_generator.saturated": pa.array(np.zeros(count, dtype=bool)),
+        "connection.policy": pa.array(np.full(count, "pooled")),
+        "stats.num_requests": pa.array(requests),
+        "stats.num_failures": pa.array(rng.binomial(requests, 0.01)),
+        "stats.num_none_requests": pa.array(np.zeros(count, dtype=int)),
+        "stats.total_response_time": pa.array(total_time),
+        "stats.total_content_length": pa.array(requests * 25000),
+        "stats.max_response_time": pa.array(maximum),
+        "stats.min_response_time": pa.array(minimum),
+        f"{RESPONSE_TIMES_FIELD}.values": list_array(values, offsets, pa.float64()),
+        f"{RESPONSE_TIMES_FIELD}.counts": list_array(counts, offsets, pa.int64()),
+    })
+
+    # locust does not report paths without requests
+    return table.filter(pa.array(has_requests))
+
+def generate_resources(start, duration, containers=[], period=5, seed=0):
+    """
+    Returns table of container cpu and memory samples in the layout of metricbeat documents, taken every period
+    seconds - 5 for metricbeat, below one second for the sampler.
+    """
+    rng = np.random.default_rng(seed)
+    start_ms = int(pd.Timestamp(start).timestamp() * 1000)
+
+    samples = int(duration / period)
+    count = samples * len(containers)
+    sample = np.repeat(np.arange(samples), len(containers))
+    container = np.tile(np.arange(len(containers)), samples)
+
+    memory = 100e6 + np.cumsum(rng.normal(1e5, 1e6, count)).clip(0)
+
+    return pa.table({
+        "@timestamp": pa.array(start_ms + (sample * period * 1000).astype(np.int64), pa.timestamp("ms")),
+        "container.name": pa.array([ containers[number] for number in container ]),
+        "docker.cpu.total.pct": pa.array(rng.gamma(4, 0.2, count)),
+        "docker.memory.usage.total": pa.array(memory.astype(np.int64)),
+        "docker.memory.usage.max": pa.array((memory * 1.1).astype(np.int64)),
+    })
+
+class MemoryStorage(FileStorage):
+    """
+    FileStorage with tables kept in memory by index name.
+    """
+    def __init__(self, tables):
+        super().__init__(None)
+        self.tables = tables
+
+    @property
+    def cache_key(self):
+        return f"memory:{id(self)}"
+
+    def read(self, index):
+        patterns = index.split(",")
+        return concat_tables([ table for name, table in self.tables.items() if any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns) ])
+
+def is_histogram(field):
+    return field == RESPONSE_TIMES_FIELD or field.startswith(f"{SERVER_TIMING_FIELD}.")
+
+def nullable(value):
+    return None if value is None or (isinstance(value, float) and np.isnan(value)) else value
+
+class FakeElasticsearch:
+    """
+    Local stand-in for elasticsearch - answers search requests of elasticsearch_dsl with composite and metric
+    aggregations computed from the documents of given storage, in the same format as elasticsearch does. Responses are
+    kept serialized by index and body, so repeated requests cost only decoding of the response, as with real client.
+
+    Aggregations are computed by the same code as for FileStorage, so results of both backends are always equal - the
+    stand-in is not a reference for correctness of elasticsearch queries, only for the cost of their client side.
+    """
+    def __init__(self, storage: FileStorage):
+        self.storage = storage
+        self.responses = {}
+        # key, buckets and number of documents of the last composite aggregation
+        self.last = (None, [], 0)
+
+    def search(self, index=None, body=None, **kwargs):
+        # newer clients send parts of the body as named parameters
+        body = body if body is not None else kwargs
+        index = ",".join(index) if isinstance(index, (list, tuple)) else index or "*"
+
+        key = json.dumps([ index, body ], sort_keys=True, default=str)
+        if key not in self.responses:
+            self.responses[key] = json.dumps(self.respond(index, body))
+
+        return json.loads(self.responses[key])
+
+    def respond(self, index, body):
+        aggs = body.get("aggs", {})
+
+        if "composite" in aggs:
+            aggregations = { "composite": self.composite(index, body, aggs["composite"]["composite"], aggs["composite"].get("aggs", {})) }
+            total = self.last[2]
+        else:
+            df, histograms = self.read(index, body, aggs)
+            aggregations, total = self.metrics(df, histograms, np.zeros(len(df), dtype=int), 1, aggs)[0], len(df)
+
+        return {
+            "took": 0,
+            "timed_out": False,
+            "_shards": { "total": 1, "successful": 1, "skipped": 0, "failed": 0 },
+            "hits": { "total": { "value": total, "relation": "eq" }, "max_score": None, "hits": [] },
+            "aggregations": aggregations,
+        }
+
+    def read(self, index, body, metrics):
+        fields = [ definition["field"] for metric in metrics.values() for definition in metric.values() if "field" in definition ]
+        return read_documents(self.storage, index, Q(body.get("query", { "match_all": {} })), [ field for field in fields if is_histogram(field) ])
+
+    def composite(self, index, body, composite, metrics):
+        # all pages of the composite aggregation are computed by the first request, following requests only slice them
+        key = json.dumps([ index, body.get("query"), composite["sources"], metrics ], sort_keys=True, default=str)
+        if self.last[0] != key or "after" not in composite:
+            df, histograms = self.read(index, body, metrics)
+            self.last = (key, self.buckets(df, histograms, composite["sources"], metrics), len(df))
+
+        buckets = self.last[1]
+        if "after" in composite:
+            after = tuple(composite["after"].values())
+            buckets = [ bucket for bucket in buckets if tuple(bucket["key"].values()) > after ]
+
+        buckets = buckets[:composite.get("size", 10)]
+
+        response = { "buckets": buckets }
+        if buckets:
+            response["after_key"] = buckets[-1]["key"]
+
+        return response
+
+    def buckets(self, df, histograms, sources, metrics):
+        keys = {}
+        for source in sources:
+            (name, definition), = source.items()
+            kind, parameters = next(iter(definition.items()))
+
+            if kind == "date_histogram":
+                step = elastic_interval_to_seconds(parameters["fixed_interval"]) * 1000
+                offset = int(parameters.get("offset", "+0s").strip("+s")) * 1000
+                timestamps = df["@timestamp"].astype("datetime64[ms]").astype(np.int64) if not df.empty else pd.Series([], dtype=np.int64)
+                keys[name] = (timestamps - offset) // step * step + offset
+            else:
+                field = parameters["field"][:-len(".keyword")] if parameters["field"].endswith(".keyword") else parameters["field"]
+                keys[name] = df[field] if field in df else pd.Series([ None ] * len(df))
+
+        if df.empty:
+            return []
+
+        frame = pd.DataFrame(keys)
+        codes = frame.groupby(list(keys), sort=True).ngroup().to_numpy()
+        groups = frame.drop_duplicates().sort_values(list(keys)).reset_index(drop=True)
+
+        results = self.metrics(df, histograms, codes, len(groups), metrics)
+        sizes = np.bincount(codes, minlength=len(groups))
+
+        return [
+            { "key": { name: (int(value) if isinstance(value, np.integer) else value) for name, value in key.items() }, "doc_count": int(sizes[number]), **results[number] }
+            for number, key in enumerate(groups.to_dict("records"))
+        ]
+
+    def metrics(self, df, histograms, codes, size, metrics):
+        results = [ {} for _ in range(size) ]
+        grouped = df.groupby(codes) if not df.empty else None
+
+        for name, metric in metrics.items():
+            kind, parameters = next(iter(metric.items()))
+            field = parameters["field"]
+
+            if is_histogram(field):
+                values, counts, rows = histograms[field]
+                results_of_metric = self.histogram_metric(kind, parameters, values, counts, codes[rows], size)
+            else:
+                results_of_metric = self.scalar_metric(kind, parameters, df, grouped, field, size)
+
+            for number in range(size):
+                results[number][name] = results_of_metric[number]
+
+        return results
+
+    def histogram_metric(self, kind, parameters, values, counts, codes, size):
+        if kind == "percentile_ranks":
+            edges = parameters["values"]
+            # rank of an edge is the share of values lower or equal to it
+            buckets = np.searchsorted(edges, values, side="left")
+            matrix = np.bincount(codes * (len(edges) + 1) + buckets, weights=counts, minlength=size * (len(edges) + 1)).reshape(size, -1)
+            totals = matrix.sum(axis=1, keepdims=True)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ranks = np.cumsum(matrix, axis=1)[:, :-1] / totals * 100
+
+            return [ { "values": { str(float(edge)): nullable(float(rank)) for edge, rank in zip(edges, ranks[number]) } } for number in range(size) ]
+
+        percents = parameters.get("percents", [ 1, 5, 25, 50, 75, 95, 99 ])
+        totals, averages, percentiles = histogram_stats(values, counts, codes, size, percents)
+
+        if kind == "percentiles":
+            return [ { "values": { str(float(percent)): nullable(float(percentiles[percent][number])) for percent in percents } } for number in range(size) ]
+        if kind == "value_count":
+            return [ { "value": int(total) } for total in totals ]
+        if kind == "avg":
+            return [ { "value": nullable(float(average)) } for average in averages ]
+
+        raise ValueError(f"Aggregation {kind} of histogram field is not supported")
+
+    def scalar_metric(self, kind, parameters, df, grouped, field, size):
+        if grouped is None or field not in df:
+            return [ { "values": {} } if kind == "percentiles" else { "value": 0 if kind in [ "sum", "value_count" ] else None } for _ in range(size) ]
+
+        column = df[field]
+        if pd.api.types.is_datetime64_any_dtype(column):
+            column = column.astype("datetime64[ms]").astype(np.int64).astype(float)
+        elif pd.api.types.is_bool_dtype(column):
+            column = column.astype(float)
+
+        grouped = column.groupby(grouped.ngroup())
+
+        if kind == "percentiles":
+            percents = parameters.get("percents", [ 1, 5, 25, 50, 75, 95, 99 ])
+            values = { percent: grouped.quantile(percent / 100).reindex(range(size)) for percent in percents }
+            return [ { "values": { str(float(percent)): nullable(float(values[percent][number])) for percent in percents } } for number in range(size) ]
+
+        how = { "avg": "mean", "value_count": "count" }.get(kind, kind)
+        values = grouped.agg(how).reindex(range(size))
+        return [ { "value": nullable(float(value)) } for value in values ]
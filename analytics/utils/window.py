@@ -0,0 +1,32 @@
+import math
+from collections import deque, defaultdict
+
+class SlidingWindow:
+    """
+    Keeps last `size` observations and running sums of their values, so that rolling means are updated in constant
+    time as observations arrive.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.observations = deque()
+        self.sums = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def push(self, observation: dict):
+        self.observations.append(observation)
+        self.update(observation, 1)
+
+        if len(self.observations) > self.size:
+            self.update(self.observations.popleft(), -1)
+
+    def update(self, observation: dict, sign):
+        for column, value in observation.items():
+            if isinstance(value, (int, float)) and not math.isnan(value):
+                self.sums[column] += sign * value
+                self.counts[column] += sign
+
+    def mean(self, column):
+        return self.sums[column] / self.counts[column] if self.counts[column] > 0 else math.nan
+
+    def max(self, column):
+        return max((observation[column] for observation in self.observations if observation.get(column) is not None), default=math.nan)
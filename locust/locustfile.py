@@ -1,26 +1,23 @@
 import time
 import os
 import sys
+import zlib
+import base64
+import json
+import socket
+import struct
+import logging
 import gevent
+import requests
 
-from locust import HttpUser, task, tag, between, LoadTestShape, events
+from locust import HttpUser, FastHttpUser, task, tag, between, constant, LoadTestShape, events
+from array import array
 from random import randint, choice, seed
-from queue import Queue
-from elasticsearch import Elasticsearch, exceptions
+from collections import defaultdict
+from datetime import datetime, timezone
+from gevent.lock import Semaphore
 
-class ElasticsearchLogger:
-    def __init__(self, hosts, index="locust"):
-        self.es = Elasticsearch(hosts)
-        self.index = index
-        self.queue = Queue()
-
-    def log(self, stats):
-        self.queue.put(stats)
-
-    def run(self):
-        while True:
-            stats = self.queue.get()
-            self.es.index(index=self.index, body=stats)
+from loggers import ElasticsearchLogger, ParquetLogger
 
 def select(dict, keys):
     return { key: dict[key] for key in keys }
@@ -31,25 +28,61 @@ def unwind(times):
         result.extend([ ms ] * int(count))
     return result
 
+def histogram(times):
+    values = sorted(times.keys(), key=float)
+    return {
+        "values": [ float(ms) for ms in values ],
+        "counts": [ int(times[ms]) for ms in values ],
+    }
+
 
 # only on master node
 if '--master' in sys.argv:
     ELASTICSEARCH_HOSTS = os.getenv("ELASTICSEARCH_HOST", "127.0.0.1:9200").split(sep=" ")
-    logger = ElasticsearchLogger(ELASTICSEARCH_HOSTS)
+    # "elasticsearch" or directory in which stats are written as parquet files
+    STORAGE = os.getenv("LOCUST_STORAGE", "elasticsearch")
+
+    logger_options = {
+        "batch_size": int(os.getenv("ELASTICSEARCH_BATCH_SIZE", "500")),
+        "flush_interval": float(os.getenv("ELASTICSEARCH_FLUSH_INTERVAL", "2")),
+        "queue_size": int(os.getenv("ELASTICSEARCH_QUEUE_SIZE", "50000")),
+    }
+    logger = ElasticsearchLogger(ELASTICSEARCH_HOSTS, **logger_options) if STORAGE == "elasticsearch" else ParquetLogger(STORAGE, **logger_options)
+    # also write unwound response times for indices and tools not migrated to histograms yet
+    LEGACY_RESPONSE_TIMES = os.getenv("LOCUST_LEGACY_RESPONSE_TIMES", "0") == "1"
+
+    # every run is written to its own index, tuned for ingestion during the run and for queries after it
+    INGEST_SETTINGS = {
+        "number_of_replicas": 0,
+        "refresh_interval": "30s",
+        "translog.durability": "async",
+    }
+    QUERY_SETTINGS = {
+        "number_of_replicas": int(os.getenv("ELASTICSEARCH_REPLICAS", "0")),
+        "refresh_interval": None,
+        "translog.durability": "request",
+    }
+
     host = ""
+    run_id = ""
 
     @events.worker_report.add_listener
     def save_to_elastic(client_id, data):
         global logger
         global host
 
+        server_timings = { (entry['method'], entry['name']): entry['phases'] for entry in data.get('server_timing', []) }
+
         for stats in data['stats']:
-            logger.log({
+            document = {
                 "@timestamp": str(int(stats['start_time'] * 1000)),
                 "client_id": client_id,
                 "method": stats['method'],
                 "path": stats['name'],
                 "host": host,
+                "run_id": run_id,
+                "load_generator": data.get('load_generator', {}),
+                "connection": data.get('connection', {}),
                 "stats": {
                     "num_requests": stats['num_requests'],
                     "num_failures": stats['num_failures'],
@@ -58,78 +91,638 @@ if '--master' in sys.argv:
                     "total_content_length": stats['total_content_length'],
                     "max_response_time": stats['max_response_time'],
                     "min_response_time": stats['min_response_time'],
-                    "response_times": unwind(stats['response_times']),
+                    "response_time_histogram": histogram(stats['response_times']),
                 }
-            })
+            }
+
+            if (stats['method'], stats['name']) in server_timings:
+                document["stats"]["server_timing"] = server_timings[stats['method'], stats['name']]
+
+            if LEGACY_RESPONSE_TIMES:
+                document["stats"]["response_times"] = unwind(stats['response_times'])
+
+            logger.log(document)
 
     @events.test_start.add_listener
-    def save_host(environment):
+    def save_host(environment, **kwargs):
         global host
+        global run_id
+
         host = environment.host
+        run_id = os.getenv("LOCUST_RUN_ID", datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")).lower()
+
+        logger.start_run(f"locust-{run_id}", INGEST_SETTINGS)
+        logging.info(f"Writing stats of run {run_id} to locust-{run_id} index of {STORAGE}")
+
+    @events.test_stop.add_listener
+    def flush_on_stop(environment, **kwargs):
+        logger.finish_run(QUERY_SETTINGS)
+
+    @events.quitting.add_listener
+    def flush_on_quit(environment, **kwargs):
+        logger.close()
+
+    @events.init.add_listener
+    def expose_counters(environment, **kwargs):
+        if environment.web_ui:
+            @environment.web_ui.app.route("/elasticsearch")
+            def elasticsearch_counters():
+                return { **logger.counters, "pending": logger.queue.qsize() }
+
+    logger.start()
+
+class LoopLagMonitor:
+    """
+    Measures how late gevent loop wakes up sleeping greenlet - high lag means that the worker is not able to send 
+    requests on time and the results describe the load generator rather than the server.
+    """
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.lags = []
+
+    def run(self):
+        while True:
+            started = time.monotonic()
+            gevent.sleep(self.interval)
+            self.lags.append(time.monotonic() - started - self.interval)
+
+    def collect(self):
+        lags, self.lags = self.lags, []
+        return max(lags, default=0) * 1000
+
+class ServerTimingStats:
+    """
+    Histograms of durations of server side phases (kernel boot, controller, database...) reported by the SUT in the
+    Server-Timing header, collected per request name in the same way as locust collects response times.
+    """
+    def __init__(self):
+        self.entries = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+
+    def log(self, method, name, header):
+        for metric in header.split(","):
+            phase, *parameters = [ part.strip() for part in metric.split(";") ]
+
+            for parameter in parameters:
+                key, _, value = parameter.partition("=")
+                if key != "dur":
+                    continue
+
+                # header comes from the SUT, malformed entries must not abort the task of the user
+                try:
+                    duration = float(value.strip('"'))
+                except ValueError:
+                    continue
+
+                # 3 significant digits, phases take from microseconds to seconds
+                self.entries[method, name][phase][float(f"{duration:.3g}")] += 1
+
+    def collect(self):
+        entries, self.entries = self.entries, defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+
+        return [
+            { "method": method, "name": name, "phases": { phase: histogram(times) for phase, times in phases.items() } }
+            for (method, name), phases in entries.items()
+        ]
+
+class EventLog:
+    """
+    Raw events of every request - start timestamp, request, latency, status code and response size - kept in typed
+    arrays and packed into zlib compressed batches, so capturing millions of requests costs only few bytes per request.
+
+    Batch starts with header of two little endian uint32 values - number of events and size of the compressed payload.
+    Payload contains columns one after another (float64 timestamps, float32 latencies in ms, uint16 status codes,
+    uint32 sizes and uint32 indices into the request table) followed by JSON list of [method, name] pairs - the
+    request table of this batch. Format is read by analytics/utils/events.py.
+    """
+    HEADER = struct.Struct("<II")
+
+    def __init__(self, batch_size=10000):
+        self.batch_size = batch_size
+        self.batches = []
+        self.reset()
+
+    def reset(self):
+        self.times = array("d")
+        self.latencies = array("f")
+        self.statuses = array("H")
+        self.sizes = array("I")
+        self.requests = array("I")
+        self.table = {}
+
+    def log(self, timestamp, method, name, latency, status, size):
+        self.times.append(timestamp)
+        self.latencies.append(latency)
+        self.statuses.append(status)
+        self.sizes.append(size)
+        self.requests.append(self.table.setdefault((method, name), len(self.table)))
+
+        if len(self.times) >= self.batch_size:
+            self.batches.append(self.pack())
+
+    def pack(self):
+        columns = [ self.times, self.latencies, self.statuses, self.sizes, self.requests ]
+        if sys.byteorder != "little":
+            for column in columns:
+                column.byteswap()
+
+        payload = zlib.compress(b"".join([ column.tobytes() for column in columns ]) + json.dumps(list(self.table)).encode())
+        header = self.HEADER.pack(len(self.times), len(payload))
+        self.reset()
+
+        return header + payload
+
+    def collect(self):
+        if len(self.times) > 0:
+            self.batches.append(self.pack())
+
+        batches, self.batches = self.batches, []
+        return batches
+
+EVENT_LOG = os.getenv("LOCUST_EVENT_LOG")
+
+# raw events are indexed by master, which receives them from workers along with the stats - every compressed batch
+# is stored as it is, so the master does no work per request
+EVENT_MAPPINGS = {
+    "properties": {
+        "@timestamp": { "type": "date" },
+        "client_id": { "type": "keyword" },
+        "run_id": { "type": "keyword" },
+        "count": { "type": "integer" },
+        "events": { "type": "binary" },
+    }
+}
+
+if '--master' in sys.argv and EVENT_LOG == "elasticsearch":
+    events_logger = ElasticsearchLogger(
+        ELASTICSEARCH_HOSTS,
+        batch_size=50,
+        flush_interval=float(os.getenv("ELASTICSEARCH_FLUSH_INTERVAL", "2")),
+        queue_size=int(os.getenv("LOCUST_EVENT_QUEUE_SIZE", "1000")),
+        mappings=EVENT_MAPPINGS,
+    )
+
+    @events.worker_report.add_listener
+    def save_events_to_elastic(client_id, data):
+        for batch in data.get('events', []):
+            count, _ = EventLog.HEADER.unpack_from(batch)
+            events_logger.log({
+                "@timestamp": int(time.time() * 1000),
+                "client_id": client_id,
+                "run_id": run_id,
+                "count": count,
+                "events": base64.b64encode(batch).decode(),
+            })
+
+    # index name must not match locust* pattern used for the stats
+    @events.test_start.add_listener
+    def start_events_run(environment, **kwargs):
+        events_logger.start_run(f"request-events-{run_id}", INGEST_SETTINGS)
+
+    @events.test_stop.add_listener
+    def finish_events_run(environment, **kwargs):
+        events_logger.finish_run(QUERY_SETTINGS)
+
+    @events.quitting.add_listener
+    def flush_events_on_quit(environment, **kwargs):
+        events_logger.close()
+
+    events_logger.start()
+
+if EVENT_LOG == "elasticsearch" and '--master' not in sys.argv and '--worker' not in sys.argv:
+    logging.warning("Request events can be sent to elasticsearch only in distributed mode, use directory instead")
+    EVENT_LOG = None
+
+# events are captured on workers, or in the only process when running without master
+if EVENT_LOG and '--master' not in sys.argv:
+    event_log = EventLog(batch_size=int(os.getenv("LOCUST_EVENT_BATCH_SIZE", "10000")))
+
+    @events.request.add_listener
+    def record_event(request_type, name, response_time, response_length, response=None, exception=None, **kwargs):
+        status = getattr(response, "status_code", None) or 0
+        event_log.log(time.time() - response_time / 1000, request_type, name, response_time, status, response_length or 0)
+
+    if EVENT_LOG == "elasticsearch":
+        @events.report_to_master.add_listener
+        def report_events(client_id, data):
+            data['events'] = event_log.collect()
+    else:
+        class EventFile:
+            """
+            Appends batches of events to a file in the given directory, every worker (and every run) writes its own file.
+            """
+            def __init__(self, directory, flush_interval=5):
+                self.directory = directory
+                self.flush_interval = flush_interval
+                self.path = None
+
+            def open(self):
+                os.makedirs(self.directory, exist_ok=True)
+                started = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+                self.path = f"{self.directory}/{started}-{socket.gethostname()}-{os.getpid()}.events"
+
+            def write(self):
+                batches = event_log.collect()
+                if batches and self.path:
+                    with open(self.path, "ab") as file:
+                        file.write(b"".join(batches))
+
+            def run(self):
+                while True:
+                    gevent.sleep(self.flush_interval)
+                    self.write()
+
+        event_file = EventFile(EVENT_LOG)
+
+        @events.test_start.add_listener
+        def open_event_file(environment, **kwargs):
+            event_file.open()
+            logging.info(f"Writing request events to {event_file.path}")
+
+        @events.test_stop.add_listener
+        def close_event_file(environment, **kwargs):
+            event_file.write()
+            event_file.path = None
+
+        @events.quitting.add_listener
+        def flush_event_file(environment, **kwargs):
+            event_file.write()
+
+        gevent.spawn(event_file.run)
+
+# only on worker nodes
+if '--worker' in sys.argv:
+    import psutil
+
+    CPU_LIMIT = float(os.getenv("LOCUST_GENERATOR_CPU_LIMIT", "0.9"))
+    LAG_LIMIT = float(os.getenv("LOCUST_GENERATOR_LAG_LIMIT", "50"))
+
+    process = psutil.Process()
+    monitor = LoopLagMonitor()
+
+    @events.report_to_master.add_listener
+    def report_load_generator(client_id, data):
+        cpu = process.cpu_percent() / 100
+        loop_lag = monitor.collect()
+
+        data['load_generator'] = {
+            "cpu": cpu,
+            "loop_lag": loop_lag,
+            "saturated": cpu >= CPU_LIMIT or loop_lag >= LAG_LIMIT,
+        }
+
+    @events.report_to_master.add_listener
+    def report_connection_policy(client_id, data):
+        data['connection'] = {
+            "policy": CONNECTION_POLICY,
+            "max_requests": REQUESTS_PER_CONNECTION if CONNECTION_POLICY == "limited" else None,
+        }
+
+    server_timing = ServerTimingStats()
+
+    @events.request.add_listener
+    def record_server_timing(request_type, name, response=None, exception=None, **kwargs):
+        header = response.headers.get("Server-Timing") if response is not None and response.headers else None
+        if header:
+            server_timing.log(request_type, name, header)
+
+    @events.report_to_master.add_listener
+    def report_server_timing(client_id, data):
+        data['server_timing'] = server_timing.collect()
 
-    gevent.spawn(logger.run)
+    gevent.spawn(monitor.run)
 
 seed(3721)
 
 MAX_USER_COUNT = int(os.getenv("LOCUST_MAX_USER_COUNT", "250"))
 TIME_LIMIT     = int(os.getenv("LOCUST_TIME_LIMIT", "500"))
+ARRIVAL_RATE   = float(os.getenv("LOCUST_ARRIVAL_RATE", "0"))
+LOAD_SHAPE     = os.getenv("LOCUST_SHAPE", "constant")
+FAST_CLIENT    = os.getenv("LOCUST_CLIENT", "requests") == "fast"
 
-class CustomShapeLoad(LoadTestShape):
-    time_limit = TIME_LIMIT
-    user_count = MAX_USER_COUNT
-    spawn_rate = 20
+# interval of every user assumes that all LOCUST_MAX_USER_COUNT users are running, shapes changing the user count
+# would change the rate with it
+if ARRIVAL_RATE > 0 and LOAD_SHAPE != "constant":
+    raise ValueError(f"LOCUST_ARRIVAL_RATE can be used only with the constant shape, not with {LOAD_SHAPE}")
 
-    def tick(self):
-        run_time = self.get_run_time()
+CONNECTION_POLICY       = os.getenv("LOCUST_CONNECTION_POLICY", "pooled")
+REQUESTS_PER_CONNECTION = int(os.getenv("LOCUST_REQUESTS_PER_CONNECTION", "100"))
 
-        if run_time < self.time_limit:
-            return (self.user_count, self.spawn_rate)
+if CONNECTION_POLICY not in ["pooled", "new", "limited"]:
+    raise ValueError(f"Unknown connection policy {CONNECTION_POLICY}, use one of: pooled, new, limited")
 
+REPLAY_TRACE = os.getenv("LOCUST_REPLAY_TRACE")
+REPLAY_DELAY = float(os.getenv("LOCUST_REPLAY_DELAY", "2"))
+
+def percentile(times, fraction):
+    total = sum(times.values())
+    if total == 0:
         return None
 
+    seen = 0
+    for ms in sorted(times.keys()):
+        seen += times[ms]
+        if seen >= total * fraction:
+            return ms
+
+def snapshot(entry):
+    return (entry.num_requests, entry.num_failures, dict(entry.response_times))
+
+def difference(before, after):
+    requests, failures, times = before
+    return (
+        after.num_requests - requests,
+        after.num_failures - failures,
+        { ms: count - times.get(ms, 0) for ms, count in after.response_times.items() },
+    )
+
+# locust allows only one shape class in the locustfile, so only the selected one is defined
+if LOAD_SHAPE == "saturation":
+    import yaml
+
+    class SaturationSearchShape(LoadTestShape):
+        """
+        Increases user count in steps until p95 or failure ratio of the step breaks the SLO, then refines the knee 
+        with binary search between the last passing and the first failing step. Every step is written to the YAML 
+        file in the format read by analytics/summary.py.
+        """
+        spawn_rate     = 20
+        start_users    = int(os.getenv("LOCUST_SATURATION_START", "25"))
+        step_users     = int(os.getenv("LOCUST_SATURATION_STEP", "25"))
+        step_duration  = int(os.getenv("LOCUST_SATURATION_STEP_DURATION", "60"))
+        warmup         = int(os.getenv("LOCUST_SATURATION_WARMUP", "15"))
+        refinements    = int(os.getenv("LOCUST_SATURATION_REFINEMENTS", "3"))
+        max_users      = MAX_USER_COUNT
+        slo_p95        = float(os.getenv("LOCUST_SLO_P95", "500"))
+        slo_failures   = float(os.getenv("LOCUST_SLO_FAILURE_RATIO", "0.01"))
+        output         = os.getenv("LOCUST_SATURATION_OUTPUT", "/mnt/locust/saturation.yml")
+        containers     = os.getenv("LOCUST_SATURATION_CONTAINERS", "").split()
+
+        def __init__(self):
+            super().__init__()
+            # stats of the step are measured after the warm-up, so it has to end before the step does
+            if self.step_duration <= self.warmup:
+                raise ValueError(f"LOCUST_SATURATION_STEP_DURATION ({self.step_duration}s) must be longer than LOCUST_SATURATION_WARMUP ({self.warmup}s)")
+
+            self.users = self.start_users
+            self.passing = 0
+            self.failing = None
+            self.step_started = None
+            self.measure_started = None
+            self.before = None
+            self.steps = []
+
+        def tick(self):
+            run_time = self.get_run_time()
+
+            if self.step_started is None:
+                self.step_started = run_time
+
+            step_time = run_time - self.step_started
+            if step_time >= self.warmup and self.before is None:
+                self.measure_started = datetime.now(timezone.utc)
+                self.before = snapshot(self.runner.stats.total)
+
+            if step_time < self.step_duration:
+                return (self.users, self.spawn_rate)
+
+            self.users = self.next_users(self.finish_step())
+            self.step_started = run_time
+            self.before = None
+
+            if self.users is None:
+                return None
+
+            return (self.users, self.spawn_rate)
+
+        def finish_step(self):
+            requests, failures, times = difference(self.before, self.runner.stats.total)
+            end = datetime.now(timezone.utc)
+
+            p95 = percentile(times, 0.95)
+            failure_ratio = failures / requests if requests > 0 else 1.0
+            passed = p95 is not None and p95 <= self.slo_p95 and failure_ratio <= self.slo_failures
+
+            self.steps.append({
+                "name": f"{self.runner.environment.host} {self.users} users",
+                "from": self.measure_started,
+                "to": end,
+                "containers": self.containers,
+                "users": self.users,
+                "rps": requests / (end - self.measure_started).total_seconds(),
+                "95th percentile": p95,
+                "failure ratio": failure_ratio,
+                "verdict": "pass" if passed else "fail",
+            })
+            self.save()
+
+            return passed
+
+        def next_users(self, passed):
+            if passed:
+                self.passing = self.users
+            else:
+                self.failing = self.users
+
+            if self.failing is None:
+                return min(self.users + self.step_users, self.max_users) if self.users < self.max_users else None
+
+            if self.refinements == 0 or self.failing - self.passing <= 1:
+                return None
+
+            self.refinements -= 1
+            return (self.passing + self.failing) // 2
+
+        def save(self):
+            with open(self.output, "w") as file:
+                yaml.dump({
+                    "slo": { "95th percentile": self.slo_p95, "failure ratio": self.slo_failures },
+                    "saturation": { "users": self.passing, "saturated": self.failing is not None },
+                    "tests": self.steps,
+                }, file, sort_keys=False)
+else:
+    class CustomShapeLoad(LoadTestShape):
+        time_limit = TIME_LIMIT
+        user_count = MAX_USER_COUNT
+        spawn_rate = 20
+
+        def tick(self):
+            run_time = self.get_run_time()
+
+            if run_time < self.time_limit:
+                return (self.user_count, self.spawn_rate)
+
+            return None
+
+def constant_arrival_rate(rate, users):
+    # open model: every user starts its requests on fixed schedule, regardless of how long previous request took - the
+    # schedule is kept per request and not per task, because tasks send different number of requests
+    interval = users / rate
+
+    def pace(user):
+        user.intended_start += interval
+        user.schedule_lag = None
+        gevent.sleep(max(0, user.intended_start - time.monotonic()))
+
+    return pace
+
+class IntendedStartRequestEvent:
+    """
+    Adds delay between intended and actual start of the request to every reported response time, so that latency is
+    measured from the intended start and queueing caused by slow server is not omitted.
+    """
+    def __init__(self, event, user):
+        self.event = event
+        self.user = user
+
+    def fire(self, **kwargs):
+        if self.user.schedule_lag is None:
+            started = time.monotonic() - kwargs["response_time"] / 1000
+            self.user.schedule_lag = max(0, started - self.user.intended_start)
+
+        kwargs["response_time"] += self.user.schedule_lag * 1000
+        return self.event.fire(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.event, name)
+
+class Catalog:
+    """
+    Tags and posts of the blog shared by all users of the worker. It is fetched with plain requests session instead of 
+    the locust client, so this setup traffic is not included in the stats.
+    """
+    def __init__(self, ttl, max_pages=3):
+        self.ttl = ttl
+        self.max_pages = max_pages
+        self.session = requests.Session()
+        self.lock = Semaphore()
+        self.host = None
+        self.loaded_at = None
+        self.refreshing = False
+
+    def get(self, host):
+        if self.host != host:
+            with self.lock:
+                if self.host != host:
+                    self.load(host)
+        elif not self.refreshing and time.monotonic() - self.loaded_at > self.ttl:
+            # users keep using current data while the catalog is refreshed
+            self.refreshing = True
+            gevent.spawn(self.refresh, host)
+
+        return self
+
+    def refresh(self, host):
+        try:
+            self.load(host)
+        except Exception as error:
+            logging.warning(f"Could not refresh catalog: {error}")
+        finally:
+            self.refreshing = False
+
+    def fetch(self, host, path):
+        response = self.session.get(f"{host}{path}")
+        response.raise_for_status()
+        return response.json()
+
+    def load(self, host):
+        tags = [ tag['name'] for tag in self.fetch(host, "/en/api/tags") ]
+
+        posts_by_tag = { tag: self.fetch(host, f"/en/api/posts?tag={tag}") for tag in tags }
+        posts_by_page = { page: self.fetch(host, f"/en/api/posts?page={page}") for page in range(1, self.max_pages + 1) }
+
+        self.tags = [ tag for tag in tags if tag != 'sample' ]
+        self.posts_by_tag = posts_by_tag
+        self.posts_by_page = posts_by_page
+        self.host = host
+        self.loaded_at = time.monotonic()
+
+catalog = Catalog(ttl=int(os.getenv("LOCUST_CATALOG_TTL", "300")))
+
+if '--master' not in sys.argv:
+    @events.test_start.add_listener
+    def preload_catalog(environment, **kwargs):
+        if environment.host:
+            catalog.get(environment.host)
+
+class ConnectionPolicy:
+    """
+    Decides when the connection of the user should be closed: pooled connection is kept alive for the whole test, 
+    with "new" policy every request is sent over new connection and with "limited" policy connection is closed after 
+    given number of requests. Connection is closed by asking the server to do so, which works the same for both 
+    clients and also makes the server go through its connection teardown.
+    """
+    def __init__(self, policy, requests_per_connection=100):
+        self.limit = { "pooled": None, "new": 1, "limited": requests_per_connection }[policy]
+        self.count = 0
+
+    def headers(self):
+        if self.limit is None:
+            return None
+
+        self.count += 1
+        if self.count < self.limit:
+            return None
+
+        self.count = 0
+        return { "Connection": "close" }
+
 def is_not_code_sample(post):
     return "Code Sample" not in post["title"]
 
-class BlogUser(HttpUser):
-    wait_time = between(1, 2.5)
+class BlogUser(FastHttpUser if FAST_CLIENT else HttpUser):
+    # in replay mode requests are defined by the trace
+    abstract = REPLAY_TRACE is not None
+
+    # with arrival rate tasks do not wait, every request waits for its slot of the schedule instead
+    wait_time = constant(0) if ARRIVAL_RATE > 0 else between(1, 2.5)
+    pace = staticmethod(constant_arrival_rate(ARRIVAL_RATE, MAX_USER_COUNT)) if ARRIVAL_RATE > 0 else None
 
     def on_start(self):
-        self.max_pages = 3
-        self.tags = [ tag['name'] for tag in self.client.get("/en/api/tags").json() if tag['name'] != 'sample' ]
+        catalog.get(self.host)
+        self.connection = ConnectionPolicy(CONNECTION_POLICY, REQUESTS_PER_CONNECTION)
+
+        if ARRIVAL_RATE > 0:
+            self.intended_start = time.monotonic()
+            self.schedule_lag = None
+            self.client.request_event = IntendedStartRequestEvent(self.client.request_event, self)
+
         self.queries = ["Lorem ipsum", "vitae velit", "Ubi est", "dolor"]
 
+    def get(self, url):
+        if self.pace:
+            self.pace(self)
+
+        return self.client.get(url, headers=self.connection.headers())
+
     @tag("light")
     @task(5)
     def browse_tag(self):
-        tag = choice(self.tags)
-        self.client.get(f"/en/blog?tag={tag}")
+        tag = choice(catalog.get(self.host).tags)
+        self.get(f"/en/blog?tag={tag}")
 
-        posts = self.client.get(f"/en/api/posts?tag={tag}").json()
-        self.browse_posts(posts, 3, is_not_code_sample)
+        self.browse_posts(catalog.posts_by_tag.get(tag, []), 3, is_not_code_sample)
 
     @tag("heavy")
     @task(2)
-    def browse_tag(self):
+    def browse_sample_tag(self):
         tag = "sample"
-        self.client.get(f"/en/blog?tag={tag}")
+        self.get(f"/en/blog?tag={tag}")
 
-        posts = self.client.get(f"/en/api/posts?tag={tag}").json()
-        self.browse_posts(posts, 3)
+        self.browse_posts(catalog.get(self.host).posts_by_tag.get(tag, []), 3)
 
     @tag("light")
     @task(10)
     def browse_task(self):
-        page = randint(1, self.max_pages)
+        page = randint(1, catalog.max_pages)
 
-        self.client.get(f"/en/blog/page/{page}")
-        posts = self.client.get(f"/en/api/posts?page={page}").json()
-        self.browse_posts(posts, 4, is_not_code_sample)
+        self.get(f"/en/blog/page/{page}")
+        self.browse_posts(catalog.get(self.host).posts_by_page[page], 4, is_not_code_sample)
 
     @tag("light")
     @task(2)
     def search_task(self):
         query = choice(self.queries)
-        posts = self.client.get(f"/en/api/search?q={query}").json()
+        posts = self.get(f"/en/api/search?q={query}").json()
         self.browse_posts(posts, 2, is_not_code_sample)
 
     def browse_posts(self, posts, count, check = lambda post: True):
@@ -140,4 +733,106 @@ class BlogUser(HttpUser):
 
         for _ in range(count):
             post = choice(posts)
-            self.client.get(post['url'])
+            self.get(post['url'])
+
+if REPLAY_TRACE:
+    from gevent.event import Event
+    from locust.exception import StopUser
+    from replay import Schedule
+
+    class Replay:
+        """
+        Part of the trace replayed by this worker. Master assigns every worker its slot and common start time, the 
+        worker then takes every n-th request of the trace, so every server gets the same sequence regardless of how
+        requests are distributed among workers and users.
+        """
+        def __init__(self, path):
+            self.path = path
+            self.trace = None
+            self.schedule = None
+            self.cursor = 0
+            self.start = None
+            self.ready = Event()
+
+        def assign(self, index, count, start):
+            self.trace = self.trace or Schedule.load(self.path)
+            self.schedule = self.trace.split(index, count)
+            self.cursor = 0
+            # wall clock is shared by all workers, but requests are scheduled using the monotonic one
+            self.start = time.monotonic() + (start - time.time())
+            self.ready.set()
+
+            logging.info(f"Replaying {len(self.schedule)} of {len(self.trace)} requests of {self.path} (slot {index + 1} of {count})")
+
+        def skip(self):
+            # worker without a slot replays nothing, but its users must not wait forever
+            self.schedule = []
+            self.cursor = 0
+            self.start = time.monotonic()
+            self.ready.set()
+
+        def next(self):
+            self.ready.wait()
+
+            if self.cursor >= len(self.schedule):
+                return None
+
+            self.cursor += 1
+            return self.schedule[self.cursor - 1]
+
+    replay = Replay(REPLAY_TRACE)
+
+    if '--master' in sys.argv:
+        @events.test_start.add_listener
+        def assign_replay_slots(environment, **kwargs):
+            clients = sorted(environment.runner.clients.keys())
+            environment.runner.send_message("replay", {
+                "slots": { client: index for index, client in enumerate(clients) },
+                "count": len(clients),
+                "start": time.time() + REPLAY_DELAY,
+            })
+    elif '--worker' in sys.argv:
+        @events.init.add_listener
+        def register_replay(environment, **kwargs):
+            def assign(environment, msg, **kwargs):
+                slots = msg.data["slots"]
+                if environment.runner.client_id not in slots:
+                    logging.warning(f"Worker {environment.runner.client_id} joined after the start of the test, it will not replay any requests")
+                    replay.skip()
+                    return
+
+                replay.assign(slots[environment.runner.client_id], msg.data["count"], msg.data["start"])
+
+            environment.runner.register_message("replay", assign)
+    else:
+        @events.test_start.add_listener
+        def assign_whole_trace(environment, **kwargs):
+            replay.assign(0, 1, time.time())
+
+    class ReplayUser(FastHttpUser if FAST_CLIENT else HttpUser):
+        """
+        Sends requests of the trace at their scheduled offsets. Users only provide concurrency - every user takes the
+        next request of the worker schedule, and time it waited for a free user is added to the response time.
+        """
+        wait_time = constant(0)
+
+        def on_start(self):
+            self.connection = ConnectionPolicy(CONNECTION_POLICY, REQUESTS_PER_CONNECTION)
+            self.intended_start = time.monotonic()
+            self.schedule_lag = None
+            self.client.request_event = IntendedStartRequestEvent(self.client.request_event, self)
+
+        # trace decides which requests are sent, so the task has to pass any tag filter
+        @tag("light", "heavy")
+        @task
+        def replay_request(self):
+            request = replay.next()
+            if request is None:
+                raise StopUser()
+
+            offset, method, path = request
+            self.intended_start = replay.start + offset
+            self.schedule_lag = None
+
+            gevent.sleep(max(0, self.intended_start - time.monotonic()))
+            self.client.request(method, path, headers=self.connection.headers())
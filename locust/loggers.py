@@ -0,0 +1,235 @@
+import os
+import time
+import logging
+import gevent
+
+from gevent.queue import Queue, Empty, Full
+from gevent.lock import Semaphore
+from elasticsearch import Elasticsearch, exceptions, helpers
+
+class BatchLogger:
+    """
+    Documents are put into bounded queue and shipped in batches by size or age, so the master is never blocked by 
+    the storage. Subclasses define how the batch is shipped and how the index of the run is prepared and finished.
+
+    The run loop holds the lock while it collects and ships a batch, so flush() (and with it start and finish of the
+    run) waits for the batch taken from the queue - every document is shipped to the index of the run it was logged in.
+    """
+    def __init__(self, index="locust", batch_size=500, flush_interval=2.0, queue_size=50000):
+        self.index = index
+        self.queue = Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.counters = { "queued": 0, "shipped": 0, "dropped": 0 }
+        self.lock = Semaphore()
+        self.greenlet = None
+
+    def log(self, stats):
+        try:
+            self.queue.put_nowait(stats)
+            self.counters["queued"] += 1
+        except Full:
+            self.counters["dropped"] += 1
+
+    def collect(self, timeout):
+        batch = []
+        deadline = time.monotonic() + timeout
+
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except Empty:
+                break
+
+        return batch
+
+    def ship(self, batch):
+        raise NotImplementedError()
+
+    def drain(self):
+        while not self.queue.empty():
+            self.ship(self.collect(0))
+
+    def flush(self):
+        with self.lock:
+            self.drain()
+
+        logging.info(f"{type(self).__name__}: {self.counters}")
+
+    def start_run(self, index, settings):
+        with self.lock:
+            self.drain()
+            self.index = index
+
+    def finish_run(self, settings):
+        self.flush()
+
+    def run(self):
+        while True:
+            # wait for the first document without taking it, then batch by size or age
+            self.queue.peek()
+
+            with self.lock:
+                batch = self.collect(self.flush_interval)
+                if batch:
+                    self.ship(batch)
+
+    def start(self):
+        self.greenlet = gevent.spawn(self.run)
+
+    def close(self):
+        """
+        Stops the run loop after it ships the batch it has taken from the queue and ships the rest of the queue.
+        """
+        if self.greenlet is not None:
+            with self.lock:
+                self.greenlet.kill()
+                self.greenlet = None
+
+        self.flush()
+
+class ElasticsearchLogger(BatchLogger):
+    def __init__(self, hosts, retries=3, backoff=0.5, mappings=None, **kwargs):
+        super().__init__(**kwargs)
+        self.es = Elasticsearch(hosts)
+        self.mappings = mappings
+        self.retries = retries
+        self.backoff = backoff
+
+    def ship(self, batch):
+        actions = [ { "_index": self.index, "_source": stats } for stats in batch ]
+
+        for attempt in range(self.retries + 1):
+            try:
+                shipped, failed = helpers.bulk(self.es, actions, stats_only=True, raise_on_error=False)
+                self.counters["shipped"] += shipped
+                self.counters["dropped"] += failed
+                return
+            except exceptions.TransportError as error:
+                logging.warning(f"Bulk request to elasticsearch failed (attempt {attempt + 1}): {error}")
+                gevent.sleep(self.backoff * 2 ** attempt)
+
+        self.counters["dropped"] += len(batch)
+
+    def start_run(self, index, settings):
+        super().start_run(index, settings)
+        body = { "settings": settings, "mappings": self.mappings } if self.mappings else { "settings": settings }
+        self.es.indices.create(index=index, body=body, ignore=400)
+
+    def finish_run(self, settings):
+        super().finish_run(settings)
+        self.es.indices.put_settings(index=self.index, body=settings)
+        self.es.indices.refresh(index=self.index)
+        self.es.indices.forcemerge(index=self.index, max_num_segments=1, request_timeout=600)
+
+class ParquetLogger(BatchLogger):
+    """
+    Writes every batch as new parquet file into the directory of the index, so stats can be collected without 
+    elasticsearch. Nested fields are flattened into columns named by their dotted path (e.g. stats.num_requests), 
+    which is the layout read by FileStorage in analytics/utils/storage.py.
+    """
+    def __init__(self, directory, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+        self.parts = 0
+
+    @staticmethod
+    def flatten(document, prefix=""):
+        fields = {}
+        for key, value in document.items():
+            if isinstance(value, dict):
+                fields.update(ParquetLogger.flatten(value, f"{prefix}{key}."))
+            else:
+                fields[f"{prefix}{key}"] = value
+
+        return fields
+
+    def write(self, table, path):
+        import pyarrow.parquet as pq
+
+        # parquet encoding releases the GIL, so it runs in the threadpool of the hub and the master keeps serving
+        # workers while the file is written
+        gevent.get_hub().threadpool.apply(pq.write_table, (table, path))
+
+    def ship(self, batch):
+        import pyarrow as pa
+
+        rows = [ self.flatten(document) for document in batch ]
+        names = list(dict.fromkeys(name for row in rows for name in row))
+        columns = { name: [ row.get(name) for row in rows ] for name in names }
+        columns["@timestamp"] = pa.array([ int(timestamp) for timestamp in columns["@timestamp"] ], pa.timestamp("ms"))
+
+        directory = os.path.join(self.directory, self.index)
+        os.makedirs(directory, exist_ok=True)
+
+        self.parts += 1
+        path = os.path.join(directory, f"part-{int(time.time() * 1000)}-{os.getpid()}-{self.parts}.parquet")
+
+        try:
+            # parts are renamed when complete, so readers never see partially written file
+            self.write(pa.table(columns), f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+            self.counters["shipped"] += len(batch)
+        except (OSError, pa.ArrowException) as error:
+            logging.warning(f"Could not write {path}: {error}")
+            self.counters["dropped"] += len(batch)
+
+    @staticmethod
+    def concat(tables):
+        """
+        Concatenates parts with different columns (missing ones are filled with nulls) and types (int and float values
+        of the same field become float), the same as concat_tables of analytics/utils/storage.py.
+        """
+        import pyarrow as pa
+
+        numeric = lambda type: pa.types.is_integer(type) or pa.types.is_floating(type)
+        types = {}
+        for table in tables:
+            for field in table.schema:
+                current = types.get(field.name)
+                if current is None or pa.types.is_null(current):
+                    types[field.name] = field.type
+                elif current != field.type and numeric(current) and numeric(field.type):
+                    types[field.name] = pa.float64()
+
+        schema = pa.schema(list(types.items()))
+        return pa.concat_tables([
+            pa.Table.from_arrays([
+                table.column(name).cast(type) if name in table.column_names else pa.nulls(table.num_rows, type)
+                for name, type in types.items()
+            ], schema=schema)
+            for table in tables
+        ])
+
+    def compact(self):
+        """
+        Merges all parts of the index into one file, so queries read one file instead of one per batch - same as
+        forcemerge of elasticsearch index.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        directory = os.path.join(self.directory, self.index)
+        parts = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".parquet")) if os.path.isdir(directory) else []
+        if len(parts) < 2:
+            return
+
+        path = os.path.join(directory, f"part-{int(time.time() * 1000)}-{os.getpid()}-merged.parquet")
+
+        try:
+            table = self.concat([ pq.read_table(part) for part in parts ])
+            self.write(table, f"{path}.tmp")
+        except (OSError, pa.ArrowException) as error:
+            logging.warning(f"Could not merge parts of {directory}: {error}")
+            return
+
+        # parts are removed before the merged file appears, so readers never count documents twice
+        for part in parts:
+            os.remove(part)
+        os.replace(f"{path}.tmp", path)
+
+        logging.info(f"Merged {len(parts)} parts of {directory}")
+
+    def finish_run(self, settings):
+        super().finish_run(settings)
+        self.compact()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+import re
+import sys
+import random
+import requests
+from array import array
+from argparse import ArgumentParser
+from datetime import datetime
+
+class Schedule:
+    """
+    Requests of the trace ordered by their offset from the start of the test. Offsets and indices into the table of
+    distinct requests are kept in typed arrays, so even long traces take only few bytes per request.
+
+    Trace file has one request per line - offset in seconds, method and path separated by whitespace, lines starting
+    with # are ignored.
+    """
+    def __init__(self, offsets, requests, table):
+        self.offsets = offsets
+        self.requests = requests
+        self.table = table
+
+    @classmethod
+    def from_entries(cls, entries):
+        offsets, indices, table, known = array("d"), array("I"), [], {}
+
+        for offset, method, path in sorted(entries, key=lambda entry: entry[0]):
+            request = (method, path)
+            if request not in known:
+                known[request] = len(table)
+                table.append(request)
+
+            offsets.append(offset)
+            indices.append(known[request])
+
+        return cls(offsets, indices, table)
+
+    @classmethod
+    def load(cls, path):
+        def entries(file):
+            for line in file:
+                if line.strip() and not line.startswith("#"):
+                    offset, method, path = line.split(maxsplit=2)
+                    yield float(offset), method.upper(), path.strip()
+
+        with open(path) as file:
+            return cls.from_entries(entries(file))
+
+    def save(self, path):
+        with open(path, "w") as file:
+            file.write("# offset method path\n")
+            for offset, method, path in self:
+                file.write(f"{offset:.3f} {method} {path}\n")
+
+    def split(self, index, count):
+        # round robin keeps the request rate of every part the same during the whole test
+        return Schedule(self.offsets[index::count], self.requests[index::count], self.table)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        return (self.offsets[index], *self.table[self.requests[index]])
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+LOG_PATTERN = re.compile(r'\[(?P<time>[^\]]+)\] "(?P<method>[A-Z]+) (?P<path>\S+)')
+
+def convert(lines, exclude=None):
+    """
+    Converts access log in common or combined format (nginx, apache) into trace entries.
+    """
+    start = None
+    for line in lines:
+        match = LOG_PATTERN.search(line)
+        if match is None or (exclude and re.search(exclude, match["path"])):
+            continue
+
+        time = datetime.strptime(match["time"], "%d/%b/%Y:%H:%M:%S %z")
+        start = start or time
+
+        yield (time - start).total_seconds(), match["method"], match["path"]
+
+def generate(host, rate, duration, seed=3721, heavy=False, gap=0.05):
+    """
+    Generates trace with the same mix of tasks as BlogUser, tasks start at exponentially distributed intervals with
+    given mean rate and requests of the task are spaced by gap seconds.
+    """
+    session = requests.Session()
+    fetch = lambda path: session.get(f"{host}{path}").json()
+
+    tags = [ tag["name"] for tag in fetch("/en/api/tags") ]
+    posts_by_tag = { tag: fetch(f"/en/api/posts?tag={tag}") for tag in tags }
+    posts_by_page = { page: fetch(f"/en/api/posts?page={page}") for page in range(1, 4) }
+    queries = [ "Lorem ipsum", "vitae velit", "Ubi est", "dolor" ]
+    results = { query: fetch(f"/en/api/search?q={query}") for query in queries }
+
+    is_not_code_sample = lambda post: "Code Sample" not in post["title"]
+    rng = random.Random(seed)
+
+    def posts(candidates, count, check=lambda post: True):
+        candidates = [ post for post in candidates if check(post) ]
+        return [ rng.choice(candidates)["url"] for _ in range(count) ] if candidates else []
+
+    def browse_tag():
+        tag = rng.choice([ tag for tag in tags if tag != "sample" ])
+        return [ f"/en/blog?tag={tag}", *posts(posts_by_tag[tag], 3, is_not_code_sample) ]
+
+    def browse_sample_tag():
+        return [ "/en/blog?tag=sample", *posts(posts_by_tag.get("sample", []), 3) ]
+
+    def browse_page():
+        page = rng.randint(1, 3)
+        return [ f"/en/blog/page/{page}", *posts(posts_by_page[page], 4, is_not_code_sample) ]
+
+    def search():
+        query = rng.choice(queries)
+        return [ f"/en/api/search?q={query}", *posts(results[query], 2, is_not_code_sample) ]
+
+    tasks = [ (browse_tag, 5), (browse_page, 10), (search, 2), *([ (browse_sample_tag, 2) ] if heavy else []) ]
+    functions, weights = zip(*tasks)
+
+    offset = rng.expovariate(rate)
+    while offset < duration:
+        task, = rng.choices(functions, weights)
+        for number, path in enumerate(task()):
+            yield offset + number * gap, "GET", path
+
+        offset += rng.expovariate(rate)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Creates traces for replay mode of the locustfile")
+    parser.add_argument("output", help="Trace file to write")
+
+    sources = parser.add_subparsers(dest="source", required=True)
+
+    convert_parser = sources.add_parser("convert", help="Convert access log")
+    convert_parser.add_argument("log", nargs="?", help="Access log file, standard input by default")
+    convert_parser.add_argument("--exclude", type=str, default=None, help="Regular expression of paths to skip")
+
+    generate_parser = sources.add_parser("generate", help="Generate trace with the task mix of BlogUser")
+    generate_parser.add_argument("host", help="Address of the SUT used to fetch tags and posts")
+    generate_parser.add_argument("--rate", "-r", type=float, default=50, help="Mean number of tasks started per second")
+    generate_parser.add_argument("--duration", "-d", type=float, default=500, help="Duration of the trace in seconds")
+    generate_parser.add_argument("--seed", "-s", type=int, default=3721, help="Seed of the random generator")
+    generate_parser.add_argument("--heavy", action="store_true", help="Include tasks tagged as heavy")
+
+    args = parser.parse_args()
+
+    if args.source == "convert":
+        with open(args.log) if args.log else sys.stdin as log:
+            schedule = Schedule.from_entries(convert(log, args.exclude))
+    else:
+        schedule = Schedule.from_entries(generate(args.host, args.rate, args.duration, args.seed, args.heavy))
+
+    schedule.save(args.output)
+    print(f"Written {len(schedule)} requests ({len(schedule.table)} distinct) to {args.output}", file=sys.stderr)
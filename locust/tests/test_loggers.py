@@ -0,0 +1,61 @@
+import pytest
+
+gevent = pytest.importorskip("gevent")
+
+from loggers import BatchLogger
+
+class RecordingLogger(BatchLogger):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.shipped = []
+
+    def ship(self, batch):
+        gevent.sleep(0.05)
+        self.shipped += [ (self.index, document) for document in batch ]
+
+def test_batch_collected_at_finish_run_is_shipped_to_the_finishing_index():
+    logger = RecordingLogger(index="a", batch_size=100, flush_interval=1)
+    logger.start()
+
+    for number in range(10):
+        logger.log(number)
+
+    # the run loop takes the documents and waits for more
+    gevent.sleep(0.1)
+    assert logger.queue.empty()
+
+    logger.finish_run({})
+    logger.start_run("b", {})
+    logger.log(10)
+    logger.close()
+
+    assert logger.shipped == [ ("a", number) for number in range(10) ] + [ ("b", 10) ]
+
+def test_close_ships_the_collected_batch_and_the_queue():
+    logger = RecordingLogger(batch_size=5, flush_interval=1)
+    logger.start()
+
+    for number in range(12):
+        logger.log(number)
+
+    gevent.sleep(0)
+    logger.close()
+
+    assert [ document for _, document in logger.shipped ] == list(range(12))
+    assert logger.greenlet is None
+
+def test_compact_merges_parts_with_different_fields(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    from loggers import ParquetLogger
+
+    logger = ParquetLogger(str(tmp_path), index="locust-run")
+    logger.ship([ { "@timestamp": 1000, "stats": { "num_requests": 1, "max_response_time": 10 } } ])
+    logger.ship([ { "@timestamp": 2000, "stats": { "num_requests": 2, "max_response_time": 12.5, "server_timing": 3.0 } } ])
+    logger.compact()
+
+    parts = list((tmp_path / "locust-run").glob("*.parquet"))
+    assert len(parts) == 1
+
+    table = pq.read_table(str(parts[0]))
+    assert table.column("stats.max_response_time").to_pylist() == [ 10.0, 12.5 ]
+    assert table.column("stats.server_timing").to_pylist() == [ None, 3.0 ]
@@ -0,0 +1,247 @@
+import os
+import re
+import json
+import time
+import socket
+import logging
+import threading
+import http.client
+from array import array
+from datetime import datetime, timezone
+from elasticsearch import Elasticsearch, helpers
+
+class DockerConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+def list_containers(docker_socket, pattern=None):
+    """
+    Returns names of running containers (without leading slash, same as metricbeat) by their ids.
+    """
+    connection = DockerConnection(docker_socket)
+    try:
+        connection.request("GET", "/containers/json")
+        containers = json.loads(connection.getresponse().read())
+    finally:
+        connection.close()
+
+    names = { container["Id"]: container["Names"][0].lstrip("/") for container in containers }
+    return { id: name for id, name in names.items() if pattern is None or re.search(pattern, name) }
+
+class Cgroup:
+    """
+    Reads cpu, memory and pids counters of the container from cgroup filesystem, both v1 (separate hierarchy for every
+    controller) and v2 (unified hierarchy) layouts are supported.
+    """
+    def __init__(self, root, id):
+        unified = [ f"{root}/system.slice/docker-{id}.scope", f"{root}/docker/{id}" ]
+        self.unified = next((path for path in unified if os.path.exists(f"{path}/cgroup.controllers")), None)
+
+        if self.unified is None:
+            self.cpu = self.find(root, id, [ "cpuacct", "cpu,cpuacct", "cpu" ])
+            self.memory = self.find(root, id, [ "memory" ])
+            self.pids = self.find(root, id, [ "pids" ])
+
+    @staticmethod
+    def find(root, id, controllers):
+        for controller in controllers:
+            for path in [ f"{root}/{controller}/docker/{id}", f"{root}/{controller}/system.slice/docker-{id}.scope" ]:
+                if os.path.exists(path):
+                    return path
+
+        raise FileNotFoundError(f"No {controllers[0]} cgroup for container {id}")
+
+    @staticmethod
+    def read(path):
+        with open(path) as file:
+            return file.read()
+
+    def sample(self):
+        """
+        Returns cpu time in ns, current and peak memory usage in bytes and number of processes.
+        """
+        if self.unified:
+            cpu = int(re.search(r"usage_usec (\d+)", self.read(f"{self.unified}/cpu.stat"))[1]) * 1000
+            memory = int(self.read(f"{self.unified}/memory.current"))
+            # memory.peak is available only since linux 5.19
+            peak = int(self.read(f"{self.unified}/memory.peak")) if os.path.exists(f"{self.unified}/memory.peak") else memory
+            pids = int(self.read(f"{self.unified}/pids.current")) if os.path.exists(f"{self.unified}/pids.current") else 0
+        else:
+            cpu = int(self.read(f"{self.cpu}/cpuacct.usage"))
+            memory = int(self.read(f"{self.memory}/memory.usage_in_bytes"))
+            peak = int(self.read(f"{self.memory}/memory.max_usage_in_bytes"))
+            pids = int(self.read(f"{self.pids}/pids.current"))
+
+        return cpu, memory, peak, pids
+
+class Buffer:
+    """
+    Samples of one container kept in typed arrays until they are shipped.
+    """
+    def __init__(self):
+        self.times = array("d")
+        self.cpu = array("d")
+        self.memory = array("q")
+        self.peak = array("q")
+        self.pids = array("q")
+
+    def append(self, timestamp, cpu, memory, peak, pids):
+        self.times.append(timestamp)
+        self.cpu.append(cpu)
+        self.memory.append(memory)
+        self.peak.append(peak)
+        self.pids.append(pids)
+
+    def __len__(self):
+        return len(self.times)
+
+def write_parquet(directory, index, buffers):
+    """
+    Writes samples as new parquet part in the directory of the index, with columns named the same way as flattened
+    metricbeat documents - the layout read by FileStorage in analytics/utils/storage.py.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    names = [ name for name, buffer in buffers.items() for _ in range(len(buffer)) ]
+    column = lambda attribute: [ value for buffer in buffers.values() for value in getattr(buffer, attribute) ]
+
+    table = pa.table({
+        "@timestamp": pa.array([ int(timestamp * 1000) for timestamp in column("times") ], pa.timestamp("ms")),
+        "container.name": pa.array(names, pa.string()),
+        "docker.cpu.total.pct": pa.array(column("cpu"), pa.float64()),
+        "docker.memory.usage.total": pa.array(column("memory"), pa.int64()),
+        "docker.memory.usage.max": pa.array(column("peak"), pa.int64()),
+        "docker.pids.current": pa.array(column("pids"), pa.int64()),
+    })
+
+    os.makedirs(f"{directory}/{index}", exist_ok=True)
+    path = f"{directory}/{index}/part-{int(time.time() * 1000)}-{os.getpid()}.parquet"
+
+    # parts are renamed when complete, so readers never see partially written file
+    pq.write_table(table, f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+
+class Sampler:
+    def __init__(self, es, index, cgroup_root, docker_socket, pattern=None, interval=0.25, flush_interval=5, refresh_interval=10, output=None):
+        self.es = es
+        self.output = output
+        self.index = index
+        self.cgroup_root = cgroup_root
+        self.docker_socket = docker_socket
+        self.pattern = pattern
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+
+        self.containers = {}
+        self.previous = {}
+        self.buffers = {}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        containers = {}
+        for id, name in list_containers(self.docker_socket, self.pattern).items():
+            try:
+                containers[id] = (name, self.containers[id][1] if id in self.containers else Cgroup(self.cgroup_root, id))
+            except FileNotFoundError as error:
+                logging.warning(error)
+
+        self.containers = containers
+        self.previous = { id: previous for id, previous in self.previous.items() if id in containers }
+
+    def sample(self):
+        for id, (name, cgroup) in list(self.containers.items()):
+            try:
+                cpu, memory, peak, pids = cgroup.sample()
+            except (FileNotFoundError, ProcessLookupError, ValueError):
+                # container was stopped, it will be removed on the next refresh
+                continue
+
+            now = time.time()
+            if id in self.previous:
+                previous_time, previous_cpu = self.previous[id]
+                # the same unit as docker.cpu.total.pct of metricbeat - 1.0 means one fully used core
+                pct = (cpu - previous_cpu) / ((now - previous_time) * 1e9)
+
+                with self.lock:
+                    self.buffers.setdefault(name, Buffer()).append(now, pct, memory, peak, pids)
+
+            self.previous[id] = (now, cpu)
+
+    def documents(self, buffers):
+        for name, buffer in buffers.items():
+            for i in range(len(buffer)):
+                yield {
+                    "_index": self.index,
+                    "_source": {
+                        "@timestamp": datetime.fromtimestamp(buffer.times[i], timezone.utc).isoformat(),
+                        "container": { "name": name },
+                        "docker": {
+                            "cpu": { "total": { "pct": buffer.cpu[i] } },
+                            "memory": { "usage": { "total": buffer.memory[i], "max": buffer.peak[i] } },
+                            "pids": { "current": buffer.pids[i] },
+                        },
+                    }
+                }
+
+    def flush(self):
+        with self.lock:
+            buffers, self.buffers = self.buffers, {}
+
+        if buffers and self.output:
+            write_parquet(self.output, self.index, buffers)
+        elif buffers:
+            shipped, failed = helpers.bulk(self.es, self.documents(buffers), stats_only=True, raise_on_error=False)
+            if failed:
+                logging.warning(f"Failed to write {failed} of {shipped + failed} samples")
+
+    def ship(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as error:
+                logging.warning(f"Could not write samples: {error}")
+
+    def run(self):
+        threading.Thread(target=self.ship, daemon=True).start()
+
+        refreshed = 0
+        next_sample = time.monotonic()
+        while True:
+            if time.monotonic() - refreshed > self.refresh_interval:
+                # known containers are kept sampled when docker does not answer, refresh is retried next time
+                try:
+                    self.refresh()
+                except Exception as error:
+                    logging.warning(f"Could not refresh containers: {error}")
+                refreshed = time.monotonic()
+
+            self.sample()
+
+            # fixed schedule, so that time spent on reading does not shift the samples
+            next_sample += self.interval
+            time.sleep(max(0, next_sample - time.monotonic()))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    sampler = Sampler(
+        Elasticsearch(os.getenv("ELASTICSEARCH_HOST", "127.0.0.1:9200").split(sep=" ")),
+        index=os.getenv("SAMPLER_INDEX", "metricbeat-sampler"),
+        cgroup_root=os.getenv("SAMPLER_CGROUP_ROOT", "/sys/fs/cgroup"),
+        docker_socket=os.getenv("SAMPLER_DOCKER_SOCKET", "/var/run/docker.sock"),
+        pattern=os.getenv("SAMPLER_CONTAINERS") or None,
+        interval=float(os.getenv("SAMPLER_INTERVAL", "0.25")),
+        flush_interval=float(os.getenv("SAMPLER_FLUSH_INTERVAL", "5")),
+        # directory for parquet files, samples are sent to elasticsearch when not set
+        output=os.getenv("SAMPLER_OUTPUT") or None,
+    )
+
+    sampler.run()
@@ -2,6 +2,7 @@
 
 namespace App\CommonMark;
 
+use App\Utils\ServerTiming;
 use Kadet\Highlighter\Formatter\HtmlFormatter;
 use Kadet\Highlighter\KeyLighter;
 use League\CommonMark\Block\Element\AbstractBlock;
@@ -14,11 +15,13 @@ class KeylighterCodeRenderer implements BlockRendererInterface
 {
     private $keylighter;
     private $formatter;
+    private $timing;
 
-    public function __construct(KeyLighter $keylighter)
+    public function __construct(KeyLighter $keylighter, ServerTiming $timing)
     {
         $this->keylighter = $keylighter;
         $this->formatter  = new HtmlFormatter();
+        $this->timing     = $timing;
     }
 
     /**
@@ -29,6 +32,13 @@ class KeylighterCodeRenderer implements BlockRendererInterface
         $language = $this->keylighter->getLanguage($block instanceof FencedCode ? $block->getInfo() : 'plaintext');
         $text     = $block->getStringContent();
 
-        return new HtmlElement('pre', ['class' => 'keylighter'], @$this->keylighter->highlight($text, $language, $this->formatter));
+        $this->timing->start('highlight');
+        try {
+            $html = @$this->keylighter->highlight($text, $language, $this->formatter);
+        } finally {
+            $this->timing->stop('highlight');
+        }
+
+        return new HtmlElement('pre', ['class' => 'keylighter'], $html);
     }
 }
@@ -0,0 +1,35 @@
+<?php
+
+namespace App\DependencyInjection\Compiler;
+
+use App\Utils\ServerTimingSqlLogger;
+use Doctrine\DBAL\Logging\LoggerChain;
+use Symfony\Component\DependencyInjection\Compiler\CompilerPassInterface;
+use Symfony\Component\DependencyInjection\ContainerBuilder;
+use Symfony\Component\DependencyInjection\Definition;
+use Symfony\Component\DependencyInjection\Reference;
+
+/**
+ * Attaches ServerTimingSqlLogger to the default connection, next to loggers configured by the doctrine bundle.
+ */
+class ServerTimingPass implements CompilerPassInterface
+{
+    public function process(ContainerBuilder $container): void
+    {
+        if (!$container->hasDefinition('doctrine.dbal.default_connection.configuration')) {
+            return;
+        }
+
+        $configuration = $container->getDefinition('doctrine.dbal.default_connection.configuration');
+
+        $loggers = [new Reference(ServerTimingSqlLogger::class)];
+        foreach ($configuration->getMethodCalls() as [$method, $arguments]) {
+            if ('setSQLLogger' === $method) {
+                $loggers[] = $arguments[0];
+            }
+        }
+
+        $configuration->removeMethodCall('setSQLLogger');
+        $configuration->addMethodCall('setSQLLogger', [new Definition(LoggerChain::class, [$loggers])]);
+    }
+}
@@ -0,0 +1,69 @@
+<?php
+
+namespace App\EventSubscriber;
+
+use App\Utils\ServerTiming;
+use Symfony\Component\EventDispatcher\EventSubscriberInterface;
+use Symfony\Component\HttpKernel\Event\ControllerEvent;
+use Symfony\Component\HttpKernel\Event\RequestEvent;
+use Symfony\Component\HttpKernel\Event\ResponseEvent;
+use Symfony\Component\HttpKernel\KernelEvents;
+
+/**
+ * Sends durations of kernel boot, controller, database queries, templates and code highlighting in the Server-Timing
+ * header, so that load tests can tell which part of the request processing is affected by the server architecture.
+ * Controller phase includes database queries and templates, template phase includes highlighting.
+ */
+class ServerTimingSubscriber implements EventSubscriberInterface
+{
+    private $timing;
+
+    public function __construct(ServerTiming $timing)
+    {
+        $this->timing = $timing;
+    }
+
+    public static function getSubscribedEvents(): array
+    {
+        return [
+            KernelEvents::REQUEST => ['startRequest', 4096],
+            KernelEvents::CONTROLLER => ['startController', -4096],
+            KernelEvents::RESPONSE => ['addHeader', -4096],
+        ];
+    }
+
+    public function startRequest(RequestEvent $event): void
+    {
+        if (!$event->isMasterRequest()) {
+            return;
+        }
+
+        // long-running workers handle many requests with the same service instance
+        $this->timing->reset();
+
+        $request = $event->getRequest();
+        if ($request->attributes->has(ServerTiming::BOOT_ATTRIBUTE)) {
+            $this->timing->add('boot', $request->attributes->get(ServerTiming::BOOT_ATTRIBUTE));
+        }
+    }
+
+    public function startController(ControllerEvent $event): void
+    {
+        if ($event->isMasterRequest()) {
+            $this->timing->start('controller');
+        }
+    }
+
+    public function addHeader(ResponseEvent $event): void
+    {
+        if (!$event->isMasterRequest()) {
+            return;
+        }
+
+        $this->timing->stop('controller');
+
+        if ('' !== $header = $this->timing->getHeader()) {
+            $event->getResponse()->headers->set('Server-Timing', $header);
+        }
+    }
+}
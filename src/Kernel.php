@@ -11,8 +11,13 @@
 
 namespace App;
 
+use App\DependencyInjection\Compiler\ServerTimingPass;
+use App\Utils\ServerTiming;
 use Symfony\Bundle\FrameworkBundle\Kernel\MicroKernelTrait;
+use Symfony\Component\DependencyInjection\ContainerBuilder;
 use Symfony\Component\DependencyInjection\Loader\Configurator\ContainerConfigurator;
+use Symfony\Component\HttpFoundation\Request;
+use Symfony\Component\HttpKernel\HttpKernelInterface;
 use Symfony\Component\HttpKernel\Kernel as BaseKernel;
 use Symfony\Component\Routing\Loader\Configurator\RoutingConfigurator;
 
@@ -20,6 +25,23 @@ class Kernel extends BaseKernel
 {
     use MicroKernelTrait;
 
+    public function handle(Request $request, int $type = HttpKernelInterface::MASTER_REQUEST, bool $catch = true)
+    {
+        if (HttpKernelInterface::MASTER_REQUEST === $type) {
+            // already booted kernel of long-running workers only resets services here
+            $start = ServerTiming::now();
+            $this->boot();
+            $request->attributes->set(ServerTiming::BOOT_ATTRIBUTE, ServerTiming::now() - $start);
+        }
+
+        return parent::handle($request, $type, $catch);
+    }
+
+    protected function build(ContainerBuilder $container): void
+    {
+        $container->addCompilerPass(new ServerTimingPass());
+    }
+
     protected function configureContainer(ContainerConfigurator $container): void
     {
         $container->import('../config/{packages}/*.yaml');
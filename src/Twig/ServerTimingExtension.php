@@ -0,0 +1,41 @@
+<?php
+
+namespace App\Twig;
+
+use App\Utils\ServerTiming;
+use Twig\Extension\AbstractExtension;
+use Twig\Profiler\NodeVisitor\ProfilerNodeVisitor;
+use Twig\Profiler\Profile;
+
+/**
+ * Measures time spent in rendering templates. It uses the same node visitor as the Twig profiler, but only the
+ * outermost template is measured and no profile tree is kept, so memory usage does not grow in long-running workers.
+ */
+class ServerTimingExtension extends AbstractExtension
+{
+    private $timing;
+
+    public function __construct(ServerTiming $timing)
+    {
+        $this->timing = $timing;
+    }
+
+    public function enter(Profile $profile): void
+    {
+        if ($profile->isTemplate()) {
+            $this->timing->start('template');
+        }
+    }
+
+    public function leave(Profile $profile): void
+    {
+        if ($profile->isTemplate()) {
+            $this->timing->stop('template');
+        }
+    }
+
+    public function getNodeVisitors(): array
+    {
+        return [new ProfilerNodeVisitor(self::class)];
+    }
+}
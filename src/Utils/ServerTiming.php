@@ -0,0 +1,79 @@
+<?php
+
+namespace App\Utils;
+
+use Symfony\Contracts\Service\ResetInterface;
+
+/**
+ * Collects durations of request processing phases and formats them as Server-Timing header. Phase can be started
+ * multiple times (e.g. for every query) and nested (e.g. template embedding other templates) - only the outermost
+ * start/stop pair is measured and durations of all such pairs are summed.
+ */
+class ServerTiming implements ResetInterface
+{
+    /**
+     * Request attribute with duration of the kernel boot, set by the kernel before the request is handled.
+     */
+    public const BOOT_ATTRIBUTE = '_server_timing_boot';
+
+    private $durations = [];
+    private $starts = [];
+    private $depths = [];
+
+    public static function now(): float
+    {
+        return hrtime(true) / 1e6;
+    }
+
+    public function start(string $phase): void
+    {
+        $depth = $this->depths[$phase] ?? 0;
+        $this->depths[$phase] = $depth + 1;
+
+        if (0 === $depth) {
+            $this->starts[$phase] = self::now();
+        }
+    }
+
+    public function stop(string $phase): void
+    {
+        $depth = $this->depths[$phase] ?? 0;
+
+        if (0 === $depth) {
+            return;
+        }
+
+        $this->depths[$phase] = $depth - 1;
+
+        if (1 === $depth) {
+            $this->add($phase, self::now() - $this->starts[$phase]);
+        }
+    }
+
+    public function add(string $phase, float $duration): void
+    {
+        $this->durations[$phase] = ($this->durations[$phase] ?? 0) + $duration;
+    }
+
+    public function getDurations(): array
+    {
+        return $this->durations;
+    }
+
+    public function getHeader(): string
+    {
+        $metrics = [];
+        foreach ($this->durations as $phase => $duration) {
+            $metrics[] = sprintf('%s;dur=%.3f', $phase, $duration);
+        }
+
+        return implode(', ', $metrics);
+    }
+
+    public function reset(): void
+    {
+        $this->durations = [];
+        $this->starts = [];
+        $this->depths = [];
+    }
+}
@@ -0,0 +1,34 @@
+<?php
+
+namespace App\Utils;
+
+use Doctrine\DBAL\Logging\SQLLogger;
+
+/**
+ * Measures time spent in database queries, it is attached to the default connection by ServerTimingPass.
+ */
+class ServerTimingSqlLogger implements SQLLogger
+{
+    private $timing;
+
+    public function __construct(ServerTiming $timing)
+    {
+        $this->timing = $timing;
+    }
+
+    /**
+     * @inheritDoc
+     */
+    public function startQuery($sql, ?array $params = null, ?array $types = null)
+    {
+        $this->timing->start('db');
+    }
+
+    /**
+     * @inheritDoc
+     */
+    public function stopQuery()
+    {
+        $this->timing->stop('db');
+    }
+}
@@ -0,0 +1,63 @@
+<?php
+
+namespace App\Tests\Utils;
+
+use App\Utils\ServerTiming;
+use PHPUnit\Framework\TestCase;
+
+class ServerTimingTest extends TestCase
+{
+    private $timing;
+
+    protected function setUp(): void
+    {
+        $this->timing = new ServerTiming();
+    }
+
+    public function testHeader(): void
+    {
+        $this->timing->add('boot', 1.5);
+        $this->timing->add('db', 0.25);
+
+        $this->assertSame('boot;dur=1.500, db;dur=0.250', $this->timing->getHeader());
+    }
+
+    public function testDurationsAreSummed(): void
+    {
+        $this->timing->add('db', 1);
+        $this->timing->add('db', 2);
+
+        $this->assertSame(['db' => 3.0], $this->timing->getDurations());
+    }
+
+    public function testOnlyOutermostPhaseIsMeasured(): void
+    {
+        $this->timing->start('template');
+        $this->timing->start('template');
+        $this->timing->stop('template');
+
+        $this->assertSame([], $this->timing->getDurations());
+
+        $this->timing->stop('template');
+
+        $this->assertArrayHasKey('template', $this->timing->getDurations());
+        $this->assertGreaterThanOrEqual(0, $this->timing->getDurations()['template']);
+    }
+
+    public function testStopWithoutStartIsIgnored(): void
+    {
+        $this->timing->stop('controller');
+
+        $this->assertSame('', $this->timing->getHeader());
+    }
+
+    public function testReset(): void
+    {
+        $this->timing->add('boot', 1);
+        $this->timing->start('controller');
+        $this->timing->reset();
+        $this->timing->stop('controller');
+
+        $this->assertSame([], $this->timing->getDurations());
+    }
+}